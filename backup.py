@@ -0,0 +1,86 @@
+# backup.py - онлайн-резервное копирование через SQLite backup API
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import core
+from core import iter_database_paths
+from utils.logger import logger
+
+
+def backup_database(path: str, dest_dir: str) -> str:
+    """
+    Снять копию одной БД без остановки бота и сжать ее. Возвращает путь к архиву.
+
+    Копия снимается за один шаг из снимка чтения: пошаговое копирование
+    начинается заново после каждой записи бота и под нагрузкой не завершается.
+    БД в режиме WAL (core.create_tables), поэтому запись на это время не блокируется.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    tmp_path = os.path.join(dest_dir, f"{name}_{timestamp}.db.tmp")
+    archive_path = os.path.join(dest_dir, f"{name}_{timestamp}.db.gz")
+
+    src = sqlite3.connect(path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0] != 'wal':
+            logger.warning(f"БД {path} не в режиме WAL: запись в нее ждет окончания копирования")
+        src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+
+    try:
+        with open(tmp_path, 'rb') as f_in, gzip.open(archive_path, 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    finally:
+        os.remove(tmp_path)
+
+    return archive_path
+
+
+def apply_retention(dest_dir: str, name: str, keep: int) -> int:
+    """Оставить только keep последних копий БД с именем name. Возвращает количество удаленных"""
+    backups = sorted(
+        f for f in os.listdir(dest_dir)
+        if f.startswith(f"{name}_") and f.endswith('.db.gz')
+    )
+    removed = 0
+    for filename in backups[:-keep] if keep > 0 else backups:
+        os.remove(os.path.join(dest_dir, filename))
+        removed += 1
+    return removed
+
+
+def backup_all(dest_dir: str, keep: int) -> list[dict]:
+    """Резервная копия главной БД и всех шардов с ротацией старых копий"""
+    results = []
+    for path in dict.fromkeys([core.DATABASE_PATH] + iter_database_paths()):
+        if not os.path.exists(path):
+            continue
+        started = time.monotonic()
+        archive_path = backup_database(path, dest_dir)
+        removed = apply_retention(dest_dir, os.path.splitext(os.path.basename(path))[0], keep)
+        results.append({
+            'database': path,
+            'archive': archive_path,
+            'size': os.path.getsize(archive_path),
+            'seconds': time.monotonic() - started,
+            'removed': removed
+        })
+        logger.info(f"Резервная копия {path} -> {archive_path} ({results[-1]['seconds']:.1f} с)")
+    return results
+
+
+if __name__ == "__main__":
+    from config import BACKUP_DIR, BACKUP_KEEP
+    for item in backup_all(BACKUP_DIR, BACKUP_KEEP):
+        print(f"✅ {item['database']} -> {item['archive']} ({item['size']} байт)")
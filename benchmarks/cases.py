@@ -0,0 +1,159 @@
+# cases.py - сценарии бенчмарков: горячие пути crud, calc и экспорта
+import os
+import random
+from datetime import datetime, timedelta
+
+import core
+import crud
+from calc import def_calc
+from export_to_excel import calculate_correct_running_balance, create_excel_export, \
+    get_account_transactions_with_details
+
+# Длины истории счета для замеров баланса
+HISTORY_LENGTHS = (100, 10_000, 100_000)
+
+# Выражения в том виде, в каком их пишут пользователи
+CALC_CORPUS = [
+    "100", "-250", "1500+200", "-40*3", "12.5", "-1000:4", "(200+300)*2", "-99.99", "7*(3+4)",
+    "100-50%", "100 + 50 + 2%", "2500*1.2-300", "(1200+800):4*3", "0.15*19999.99", "-(350+150)*2",
+    "1000000:3", "12,5+7,5", "((10+20)*(30-5)):5", "99999*99999", "3.14159*2*2",
+]
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, repeat: int = 5):
+    """Зарегистрировать сценарий: функция получает фикстуру и возвращает замеряемый callable"""
+    def decorator(factory):
+        BENCHMARKS[name] = {'factory': factory, 'repeat': repeat}
+        return factory
+    return decorator
+
+
+# ===== ФИКСТУРА =====
+def _insert_history(conn, account_id: int, chat_id: int, count: int, reconcile: bool) -> None:
+    start = datetime(2024, 1, 1)
+    rows = [
+        (account_id, chat_id, round(random.uniform(-1000, 1000), 2),
+         (start + timedelta(minutes=i)).isoformat(' '), 'Бенчмарк', 1, 'bench', int(random.random() < 0.03))
+        for i in range(count)
+    ]
+    conn.executemany(
+        """INSERT INTO transactions (account_id, chat_id, amount, date, comment, created_by, username, is_reverted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+    if reconcile:
+        # Сверка посередине истории: вторая половина остается активной
+        middle = rows[count // 2][3]
+        conn.execute(
+            "UPDATE transactions SET is_archived = 1 WHERE account_id = ? AND date <= ?", (account_id, middle)
+        )
+        conn.execute(
+            "INSERT INTO reconciliations (account_id, chat_id, balance, reconciliation_date, created_by, username) "
+            "VALUES (?, ?, ?, ?, 1, 'bench')",
+            (account_id, chat_id, 1000.0, middle)
+        )
+
+
+def build_fixture(workdir: str) -> dict:
+    """Создать БД бенчмарков: чат со счетами разной длины истории (со сверкой и без)"""
+    random.seed(42)
+    core.set_database_path(os.path.join(workdir, 'bench.db'))
+    core.create_tables()
+
+    chat_id = 1
+    crud.upsert_identity(chat=(chat_id, 'private', None), user=(1, 'bench'), member=(chat_id, 1))
+    accounts = {}
+    conn = core.get_db_connection(chat_id=chat_id)
+    try:
+        for length in HISTORY_LENGTHS:
+            for reconcile in (False, True):
+                account_id = conn.execute(
+                    "INSERT INTO accounts (chat_id, account_name, created_by, username, precision) "
+                    "VALUES (?, ?, 1, 'bench', 2)",
+                    (chat_id, f"счет{length}{'с' if reconcile else ''}")
+                ).lastrowid
+                _insert_history(conn, account_id, chat_id, length, reconcile)
+                accounts[(length, reconcile)] = account_id
+        conn.execute("INSERT INTO accounts (chat_id, account_name, created_by, precision) VALUES (?, 'пустой', 1, 2)",
+                     (chat_id,))
+        # Отдельный счет для бенчмарка вставки: число вставок зависит от машины (autorange)
+        # и не должно менять размер истории счетов, на которых меряются остальные случаи
+        insert_account_id = conn.execute(
+            "INSERT INTO accounts (chat_id, account_name, created_by, precision) VALUES (?, 'вставка', 1, 2)",
+            (chat_id,)
+        ).lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {'workdir': workdir, 'chat_id': chat_id, 'user_id': 1, 'accounts': accounts,
+            'insert_account_id': insert_account_id}
+
+
+# ===== CRUD =====
+@benchmark('crud.create_transaction')
+def bench_create_transaction(fixture):
+    account_id = fixture['insert_account_id']
+    now = datetime.now()
+    return lambda: crud.create_transaction(account_id, fixture['chat_id'], 10.0, now, 'bench', 1, 'bench')
+
+
+def _balance_case(length: int, reconcile: bool):
+    def factory(fixture):
+        account_id = fixture['accounts'][(length, reconcile)]
+        return lambda: crud.get_account_balance(account_id)
+    return factory
+
+
+for _length in HISTORY_LENGTHS:
+    benchmark(f'crud.get_account_balance[{_length}]')(_balance_case(_length, False))
+    benchmark(f'crud.get_account_balance[{_length},сверка]')(_balance_case(_length, True))
+
+
+@benchmark('crud.get_user_accounts')
+def bench_get_user_accounts(fixture):
+    return lambda: crud.get_user_accounts(fixture['user_id'], fixture['chat_id'])
+
+
+# ===== CALC =====
+@benchmark('calc.def_calc[корпус]')
+def bench_def_calc(fixture):
+    def run():
+        for expression in CALC_CORPUS:
+            def_calc(expression, 2)
+    return run
+
+
+# ===== ЭКСПОРТ =====
+def _statement_case(length: int):
+    def factory(fixture):
+        account_id = fixture['accounts'][(length, True)]
+        transactions = get_account_transactions_with_details(account_id)
+        reconciliations = crud.get_account_reconciliations(account_id)
+        return lambda: calculate_correct_running_balance(transactions, reconciliations, 2)
+    return factory
+
+
+benchmark('export.calculate_correct_running_balance[100]')(_statement_case(100))
+benchmark('export.calculate_correct_running_balance[10000]')(_statement_case(10_000))
+
+
+@benchmark('export.create_excel_export[10100]', repeat=3)
+def bench_workbook(fixture):
+    accounts_data = []
+    for length in (100, 10_000):
+        account_id = fixture['accounts'][(length, True)]
+        accounts_data.append({
+            'account': crud.get_account(account_id),
+            'transactions': get_account_transactions_with_details(account_id),
+            'reconciliations': crud.get_account_reconciliations(account_id),
+        })
+
+    def run():
+        success, path, message = create_excel_export(accounts_data, 'full', fixture['chat_id'])
+        if not success:
+            raise RuntimeError(message)
+        os.remove(path)
+    return run
@@ -0,0 +1,139 @@
+# run.py - запуск бенчмарков, сохранение базовых результатов и сравнение с ними
+"""
+Бенчмарки горячих путей (crud, calc, экспорт) на отдельной временной БД.
+
+Запуск:
+    python benchmarks/run.py                        # замерить и вывести результаты
+    python benchmarks/run.py --save main            # сохранить как базовые benchmarks/baselines/main.json
+    python benchmarks/run.py --compare main         # сравнить с базовыми, отметить регрессии
+    python benchmarks/run.py --filter crud --compare main --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Бенчмаркам не нужен настоящий токен, а подробный лог искажает замеры
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('SLOW_QUERY_MS', '0')
+
+from benchmarks.cases import BENCHMARKS, build_fixture
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+# Изменение медианы больше порога считается регрессией/улучшением
+DEFAULT_THRESHOLD = 0.10
+
+
+def measure(func, repeat: int) -> dict:
+    """Время одного вызова: число повторов подбирается autorange (≥ 0.2 с на замер)"""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    timings = [total / loops for total in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'loops': loops,
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(name_filter: str = None) -> dict:
+    workdir = tempfile.mkdtemp(prefix='kesha_bench_')
+    cwd = os.getcwd()
+    # Экспорт пишет файлы в ./exports — держим их во временной папке
+    os.chdir(workdir)
+    try:
+        fixture = build_fixture(workdir)
+        results = {}
+        for name, case in BENCHMARKS.items():
+            if name_filter and name_filter not in name:
+                continue
+            results[name] = measure(case['factory'](fixture), case['repeat'])
+            print(f"  {name:50} {format_time(results[name]['median']):>10}", flush=True)
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (('с', 1), ('мс', 1e-3), ('мкс', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} нс"
+
+
+def save_baseline(name: str, results: dict) -> str:
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    path = os.path.join(BASELINES_DIR, f"{name}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(results: dict, baseline_name: str, threshold: float) -> list[str]:
+    """Напечатать сравнение с базовыми результатами. Возвращает имена с регрессией"""
+    with open(os.path.join(BASELINES_DIR, f"{baseline_name}.json"), encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    print(f"\nСравнение с «{baseline_name}» ({baseline['created_at']}, Python {baseline['python']}):")
+    print(f"  {'сценарий':50} {'было':>10} {'стало':>10} {'изменение':>10}")
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"  {name:50} {'—':>10} {format_time(current['median']):>10}   новый")
+            continue
+        change = current['median'] / previous['median'] - 1
+        if change > threshold:
+            mark = '  ⚠️ регрессия'
+            regressions.append(name)
+        elif change < -threshold:
+            mark = '  ✅ быстрее'
+        else:
+            mark = ''
+        print(f"  {name:50} {format_time(previous['median']):>10} {format_time(current['median']):>10} "
+              f"{change:>+9.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки crud, calc и экспорта")
+    parser.add_argument('--filter', help="запускать только сценарии, содержащие строку")
+    parser.add_argument('--save', metavar='NAME', help="сохранить результаты как базовые")
+    parser.add_argument('--compare', metavar='NAME', help="сравнить с сохраненными базовыми")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="порог изменения медианы (доля), по умолчанию 0.10")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="код выхода 1, если есть регрессии")
+    args = parser.parse_args()
+
+    print("Бенчмарки (медиана одного вызова):")
+    results = run_benchmarks(args.filter)
+
+    if args.save:
+        print(f"\n💾 Базовые результаты сохранены: {save_baseline(args.save, results)}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,28 @@
 import os
 import sys
 import re
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import asyncio
+from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram import Update, BotCommand
 from telegram import ReplyKeyboardMarkup, KeyboardButton
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, MAX_CONCURRENT_UPDATES, BOT_MODE, DROP_PENDING_UPDATES, \
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, BACKUP_INTERVAL_HOURS, \
+    MAINTENANCE_INTERVAL_HOURS, VERIFY_INTERVAL_HOURS, METRICS_LISTEN, METRICS_PORT
 from utils.logger import logger
 from handlers.start_help import start_command, help_command, error_handler
-from handlers.accounts import add_account_command, delete_account_command, list_accounts_command
-from handlers.operations import handle_operation
-from handlers.balance import show_balance_command
+from handlers.router import get_router_handler
 from handlers.callbacks import get_callback_handler
-from handlers.reconciliation import reconcile_command, get_reconciliation_handlers
+from handlers.reconciliation import get_reconciliation_handlers
+from handlers.middleware import get_middleware_handlers
+from handlers.admin import admin_command, backup_job, maintenance_job, verify_job
+from utils.update_processor import ChatOrderedUpdateProcessor
+from utils.metrics import instrument_application, start_metrics_server
 from core import create_tables
 from export_to_excel import cleanup_old_exports
+from webhook import run_webhook
 
 
 async def setup_commands(application):
@@ -32,6 +38,13 @@ async def setup_commands(application):
     await application.bot.set_my_commands(commands)
 
 
+async def on_startup(application):
+    """Действия после инициализации приложения: меню команд и эндпоинт метрик"""
+    await setup_commands(application)
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_LISTEN, METRICS_PORT)
+
+
 def get_main_keyboard():
     """Создает основную клавиатуру с кнопками"""
     keyboard = [
@@ -85,6 +98,66 @@ async def start_with_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
 
+def build_application(with_updater: bool = True, request=None) -> Application:
+    """
+    Создает приложение и регистрирует все обработчики.
+    request — собственная реализация запросов к Bot API (например, для нагрузочного теста без сети).
+    """
+    # Чаты обрабатываются параллельно, обновления одного чата — по очереди
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    )
+    if not with_updater:
+        # В режиме вебхука обновления приходят через встроенный HTTP-сервер
+        builder = builder.updater(None)
+    if request is not None:
+        builder = builder.request(request)
+    application = builder.build()
+
+    # Настраиваем команды бота с подсказками и запускаем эндпоинт метрик
+    application.post_init = on_startup
+
+    # Middleware: отбрасываем повторно доставленные обновления, сохраняем чат и пользователя
+    for handler, group in get_middleware_handlers():
+        application.add_handler(handler, group=group)
+
+    # Добавляем обработчики команд
+    application.add_handler(CommandHandler("start", start_with_keyboard))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("admin", admin_command))
+
+    # Единый маршрутизатор: кириллические команды, текстовые команды сверки и операции по счетам
+    application.add_handler(get_router_handler())
+
+    # Добавляем обработчики callback'ов
+    application.add_handler(get_callback_handler())
+
+    # Добавляем обработчики для сверки
+    for handler in get_reconciliation_handlers():
+        application.add_handler(handler)
+
+    # Добавляем обработчик ошибок
+    application.add_error_handler(error_handler)
+
+    # Гистограммы задержек для всех зарегистрированных обработчиков
+    instrument_application(application)
+
+    # Фоновые задачи (нужен python-telegram-bot[job-queue])
+    if application.job_queue:
+        application.job_queue.run_repeating(backup_job, interval=BACKUP_INTERVAL_HOURS * 3600, first=60,
+                                            name="backup")
+        application.job_queue.run_repeating(maintenance_job, interval=MAINTENANCE_INTERVAL_HOURS * 3600,
+                                            first=300, name="maintenance")
+        application.job_queue.run_repeating(verify_job, interval=VERIFY_INTERVAL_HOURS * 3600,
+                                            first=600, name="verify")
+    else:
+        logger.warning("JobQueue недоступна (установите APScheduler) — плановые задачи отключены")
+
+    return application
+
+
 def main():
     try:
         logger.info("Запуск бота-бухгалтера...")
@@ -99,52 +172,28 @@ def main():
         cleanup_old_exports()
         logger.info("Очистка файлов экспорта завершена")
 
-        # Создаем приложение
-        application = Application.builder().token(BOT_TOKEN).build()
-
-        # Настраиваем команды бота с подсказками
-        application.post_init = setup_commands
-
-        # Добавляем обработчики команд
-        application.add_handler(CommandHandler("start", start_with_keyboard))
-        application.add_handler(CommandHandler("help", help_command))
-
-        # Добавляем обработчики для кириллических команд через MessageHandler
-        application.add_handler(MessageHandler(filters.Regex(r'^/добавь\s+'), add_account_command))
-        application.add_handler(MessageHandler(filters.Regex(r'^/удали\s+'), delete_account_command))
-        application.add_handler(MessageHandler(filters.Regex(r'^/счета$'), list_accounts_command))
-        application.add_handler(MessageHandler(filters.Regex(r'^/дай'), show_balance_command))
-        application.add_handler(MessageHandler(filters.Regex(r'^/сверь'), reconcile_command))
-
-        # Обработчик для текстовых команд сверки (для обратной совместимости)
-        application.add_handler(MessageHandler(
-            filters.Regex(r'^(Кеша,\s*сверено|сверено)'),
-            reconcile_command
-        ))
-
-        # Обработчик для финансовых операций
-        application.add_handler(MessageHandler(
-            filters.TEXT & filters.Regex(r'^/[a-zA-Zа-яА-Я0-9_].*'),
-            handle_operation
-        ))
-
-        # Добавляем обработчики callback'ов
-        application.add_handler(get_callback_handler())
-
-        # Добавляем обработчики для сверки
-        for handler in get_reconciliation_handlers():
-            application.add_handler(handler)
-
-        # Добавляем обработчик ошибок
-        application.add_error_handler(error_handler)
-
-        logger.info("Бот успешно инициализирован. Запускаем polling...")
-
-        # Запускаем бота
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        if BOT_MODE == "webhook":
+            application = build_application(with_updater=False)
+            logger.info(f"Бот успешно инициализирован. Запускаем вебхук на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}...")
+            asyncio.run(run_webhook(
+                application,
+                WEBHOOK_LISTEN,
+                WEBHOOK_PORT,
+                WEBHOOK_PATH,
+                webhook_url=WEBHOOK_URL,
+                secret=WEBHOOK_SECRET,
+                drop_pending_updates=False,
+                post_init=on_startup
+            ))
+        else:
+            application = build_application()
+            logger.info("Бот успешно инициализирован. Запускаем polling...")
+
+            # Запускаем бота
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=DROP_PENDING_UPDATES
+            )
 
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске бота: {e}")
@@ -1,7 +1,31 @@
 import re
+import threading
+import multiprocessing
+from config import CALC_TIMEOUT
 from decimal import Decimal, getcontext, InvalidOperation, DivisionByZero, ROUND_HALF_UP
 
 
+# ===== ОГРАНИЧЕНИЯ СТОИМОСТИ ВЫЧИСЛЕНИЙ =====
+# Защищают бота от выражений вида 9^9^9, которые блокируют event loop
+MAX_EXPRESSION_LENGTH = 256  # максимальная длина выражения в символах
+MAX_TOKENS = 128             # максимальное количество токенов
+MAX_DEPTH = 32               # максимальная вложенность скобок/унарных операций/степеней
+MAX_EXPONENT = 64            # максимальный модуль показателя степени
+MAX_RESULT_DIGITS = 18       # максимальное количество цифр целой части любого промежуточного результата
+
+
+class CalculationLimitError(ValueError):
+    """Выражение превышает допустимую стоимость вычисления"""
+    pass
+
+
+def check_magnitude(value: Decimal) -> Decimal:
+    """Проверить, что число не выходит за допустимый размер"""
+    if value.is_finite() and value != 0 and value.adjusted() >= MAX_RESULT_DIGITS:
+        raise CalculationLimitError("Слишком большое число")
+    return value
+
+
 class ASTNode:
     pass
 
@@ -43,12 +67,21 @@ class BinaryOpNode(ASTNode):
             try:
                 if right_val == right_val.to_integral_value():
                     exp = int(right_val)
+                    if abs(exp) > MAX_EXPONENT:
+                        raise CalculationLimitError(f"Показатель степени больше {MAX_EXPONENT}")
+                    # Оцениваем рост количества цифр до возведения в степень
+                    if exp > 0 and left_val != 0 and (left_val.adjusted() + 1) * exp > MAX_RESULT_DIGITS:
+                        raise CalculationLimitError("Слишком большое число")
                     result = left_val ** exp
                 else:
                     raise ValueError("Дробные степени не поддерживаются в денежных расчётах")
+            except CalculationLimitError:
+                raise
             except (ValueError, OverflowError) as e:
                 raise ValueError(f"Невозможно вычислить степень: {e}")
 
+        check_magnitude(result)
+
         # Округление результата бинарной операции
         if precision is not None:
             result = result.quantize(Decimal('1.' + '0' * precision), rounding=ROUND_HALF_UP)
@@ -101,6 +134,7 @@ class PercentageCalculator:
         self.token = None
         self.tokens = []
         self.pos = 0
+        self.depth = 0
         self.precision = precision
         self.set_precision(precision)
 
@@ -122,8 +156,13 @@ class PercentageCalculator:
         return [t for t in tokens if t]
 
     def parse(self, expression):
+        if len(expression) > MAX_EXPRESSION_LENGTH:
+            raise CalculationLimitError(f"Выражение длиннее {MAX_EXPRESSION_LENGTH} символов")
         self.tokens = self.tokenize(expression)
+        if len(self.tokens) > MAX_TOKENS:
+            raise CalculationLimitError(f"Выражение содержит больше {MAX_TOKENS} элементов")
         self.pos = 0
+        self.depth = 0
         self.next_token()
         ast = self.parse_expression()
         if self.token is not None:
@@ -155,24 +194,38 @@ class PercentageCalculator:
             left = BinaryOpNode(left, op, right)
         return left
 
+    def _descend(self):
+        """Увеличить глубину разбора с проверкой ограничения"""
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise CalculationLimitError("Слишком глубокая вложенность выражения")
+
+    def _ascend(self):
+        self.depth -= 1
+
     def parse_power(self):
         left = self.parse_factor()
         if self.token == '**':
             self.next_token()
+            self._descend()
             right = self.parse_power()
+            self._ascend()
             left = BinaryOpNode(left, '**', right)
         return left
 
     def parse_factor(self):
-        if self.token == '+':
-            self.next_token()
-            return UnaryOpNode('+', self.parse_factor())
-        elif self.token == '-':
+        if self.token in ('+', '-'):
+            op = self.token
             self.next_token()
-            return UnaryOpNode('-', self.parse_factor())
+            self._descend()
+            operand = self.parse_factor()
+            self._ascend()
+            return UnaryOpNode(op, operand)
         elif self.token == '(':
             self.next_token()
+            self._descend()
             expr = self.parse_expression()
+            self._ascend()
             if self.token != ')':
                 raise ValueError("Ожидается )")
             self.next_token()
@@ -182,6 +235,7 @@ class PercentageCalculator:
                 num = Decimal(self.token)
             except InvalidOperation:
                 raise ValueError(f"Некорректное число: {self.token}")
+            check_magnitude(num)
             self.next_token()
             node = NumberNode(num)
             if self.token == '%':
@@ -245,6 +299,10 @@ class PercentageCalculator:
             return "Ошибка: деление на ноль"
         except InvalidOperation:
             return "Ошибка: недопустимая операция"
+        except CalculationLimitError as e:
+            return f"Ошибка: выражение слишком сложное ({str(e)})"
+        except RecursionError:
+            return "Ошибка: выражение слишком сложное"
         except Exception as e:
             return f"Ошибка: {str(e)}"
 
@@ -255,6 +313,86 @@ def def_calc(expression: str, precision: int = 2) -> str:
     return calculator.calculate(expression, precision)
 
 
+def calculate_many(expressions, precision=2) -> list[dict]:
+    """
+    Пакетное вычисление выражений с общим калькулятором.
+
+    Args:
+        expressions: список выражений
+        precision: точность для всех выражений или список точностей по одному на выражение
+
+    Returns:
+        Список словарей {'expression', 'result', 'error'} в исходном порядке.
+        Одинаковые выражения с одинаковой точностью вычисляются один раз.
+    """
+    expressions = list(expressions)
+    if isinstance(precision, int):
+        precisions = [precision] * len(expressions)
+    else:
+        precisions = list(precision)
+        if len(precisions) != len(expressions):
+            raise ValueError("Количество точностей не совпадает с количеством выражений")
+
+    calculator = PercentageCalculator(max(precisions, default=2))
+    computed = {}
+    results = []
+
+    for expression, item_precision in zip(expressions, precisions):
+        key = (expression, item_precision)
+        if key not in computed:
+            computed[key] = calculator.calculate(expression, item_precision)
+        value = computed[key]
+
+        if value.startswith("Ошибка"):
+            results.append({'expression': expression, 'result': None, 'error': value})
+        else:
+            results.append({'expression': expression, 'result': value, 'error': None})
+
+    return results
+
+
+# ===== ВЫЧИСЛЕНИЕ В ОТДЕЛЬНОМ ПРОЦЕССЕ =====
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: бот многопоточный (QueueListener журнала, потоки to_thread),
+        # и fork мог бы скопировать блокировку, захваченную другим потоком
+        _pool = multiprocessing.get_context('spawn').Pool(processes=1)
+    return _pool
+
+
+def _reset_pool():
+    """Принудительно остановить зависший процесс вычислений"""
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def def_calc_bounded(expression: str, precision: int = 2, timeout: float = CALC_TIMEOUT) -> str:
+    """
+    Вычислить выражение в отдельном процессе с ограничением по времени.
+
+    Вызов блокирующий — из асинхронных обработчиков его нужно запускать
+    через asyncio.to_thread. При превышении таймаута процесс уничтожается.
+    """
+    with _pool_lock:
+        async_result = _get_pool().apply_async(def_calc, (expression, precision))
+        try:
+            return async_result.get(timeout=timeout)
+        except multiprocessing.TimeoutError:
+            _reset_pool()
+            return "Ошибка: превышено время вычисления"
+        except Exception as e:
+            _reset_pool()
+            return f"Ошибка: {str(e)}"
+
+
 # Тестовый код
 if __name__ == "__main__":
     test_expressions = [
@@ -267,4 +405,7 @@ if __name__ == "__main__":
 
     for expr in test_expressions:
         result = def_calc(expr)
-        print(f"{expr} = {result}")
\ No newline at end of file
+        print(f"{expr} = {result}")
+
+    for item in calculate_many(test_expressions + ["2+2", "9^9^9"]):
+        print(f"{item['expression']} => {item['result'] or item['error']}")
\ No newline at end of file
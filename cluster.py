@@ -0,0 +1,388 @@
+# cluster.py - горизонтальное масштабирование: воркеры, разделенные по chat_id
+"""
+Кластерный режим.
+
+Фронт принимает вебхуки Telegram и пересылает каждое обновление воркеру,
+которому принадлежит чат (consistent hashing по chat_id). Каждый воркер —
+отдельный процесс с обычными обработчиками и собственной базой данных.
+
+Запуск:
+    python cluster.py                  # фронт + CLUSTER_WORKERS воркеров
+    python cluster.py worker 0         # отдельный воркер
+    python cluster.py rebalance 2 3    # перенос чатов при переходе с 2 на 3 воркера
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import secrets
+import subprocess
+import sys
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import CLUSTER_WORKERS, CLUSTER_BASE_PORT, CLUSTER_DB_DIR, \
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, METRICS_LISTEN, METRICS_PORT
+from utils.logger import logger
+from utils.http_server import LocalHTTPServer, HTTPRequest
+from core import get_db_connection, set_database_path, create_tables, iter_database_paths, chat_db_path, \
+    copy_chat_data, delete_chat_data, SHARD_COUNT
+
+WORKER_PATH = '/update'
+WORKER_SECRET_ENV = 'CLUSTER_SECRET'
+FORWARD_TIMEOUT = 30.0
+
+
+class HashRing:
+    """Consistent hashing с виртуальными узлами"""
+
+    def __init__(self, nodes: list, replicas: int = 100):
+        self.replicas = replicas
+        self._ring = []
+        for node in nodes:
+            for i in range(replicas):
+                self._ring.append((self._hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def get_node(self, key):
+        if not self._ring:
+            raise ValueError("Нет узлов в кольце")
+        index = bisect.bisect(self._keys, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+def worker_ring(worker_count: int) -> HashRing:
+    return HashRing(list(range(worker_count)))
+
+
+def worker_db_path(index: int, db_dir: str = CLUSTER_DB_DIR) -> str:
+    return os.path.join(db_dir, f"worker_{index}.db")
+
+
+def extract_chat_id(data: dict) -> int | None:
+    """chat_id из JSON обновления без построения объекта Update"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                'my_chat_member', 'chat_member', 'chat_join_request'):
+        if key in data and 'chat' in data[key]:
+            return data[key]['chat']['id']
+    callback = data.get('callback_query')
+    if callback:
+        if callback.get('message'):
+            return callback['message']['chat']['id']
+        return callback['from']['id']
+    for key in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query'):
+        if key in data:
+            return data[key]['from']['id']
+    return None
+
+
+# ===== ФРОНТ =====
+def create_front_route(client: httpx.AsyncClient, worker_count: int, base_port: int, worker_secret: str,
+                       secret: str | None = None):
+    """
+    Маршрут фронта: проверить секрет Telegram и переслать обновление воркеру-владельцу чата.
+    Клиентом для пересылки владеет вызывающий код и закрывает его при остановке.
+    """
+    from webhook import SECRET_HEADER, is_valid_secret
+
+    ring = worker_ring(worker_count)
+
+    async def forward_update(request: HTTPRequest):
+        if secret and not is_valid_secret(request.headers.get(SECRET_HEADER), secret):
+            return 403, 'text/plain', b'Forbidden'
+
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return 400, 'text/plain', b'Bad JSON'
+
+        chat_id = extract_chat_id(data)
+        worker = ring.get_node(chat_id if chat_id is not None else data.get('update_id', 0))
+
+        try:
+            response = await client.post(
+                f"http://127.0.0.1:{base_port + worker}{WORKER_PATH}",
+                content=request.body,
+                headers={'X-Telegram-Bot-Api-Secret-Token': worker_secret, 'Content-Type': 'application/json'}
+            )
+        except httpx.HTTPError as e:
+            # Telegram повторит доставку, если ответ не 200
+            logger.error(f"Воркер {worker} недоступен: {e}")
+            return 502, 'text/plain', b'Worker unavailable'
+
+        return response.status_code, 'text/plain', response.content
+
+    return forward_update
+
+
+def start_workers(worker_count: int, worker_secret: str) -> list:
+    """Запустить процессы воркеров"""
+    env = dict(os.environ, **{WORKER_SECRET_ENV: worker_secret})
+    processes = []
+    for index in range(worker_count):
+        # У каждого воркера свои файлы журнала: logs/worker<N>.log
+        worker_env = dict(env, LOG_PROCESS_NAME=f"worker{index}")
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', str(index)],
+                                          env=worker_env))
+        logger.info(f"Запущен воркер {index} (порт {CLUSTER_BASE_PORT + index})")
+    return processes
+
+
+async def run_front(worker_count: int = CLUSTER_WORKERS) -> None:
+    """Запустить фронт-приемник вебхуков вместе с процессами воркеров"""
+    from telegram import Bot, Update
+    from config import BOT_TOKEN
+    from webhook import wait_for_stop_signal, check_webhook_security
+
+    listen = check_webhook_security(WEBHOOK_LISTEN, WEBHOOK_URL, WEBHOOK_SECRET)
+    worker_secret = secrets.token_hex(16)
+    processes = start_workers(worker_count, worker_secret)
+
+    client = httpx.AsyncClient(timeout=FORWARD_TIMEOUT)
+    server = LocalHTTPServer(listen, WEBHOOK_PORT)
+    server.add_route('POST', WEBHOOK_PATH,
+                     create_front_route(client, worker_count, CLUSTER_BASE_PORT, worker_secret, WEBHOOK_SECRET))
+    try:
+        if WEBHOOK_URL:
+            async with Bot(BOT_TOKEN) as bot:
+                await bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=False
+                )
+        await server.start()
+        await wait_for_stop_signal()
+    finally:
+        await server.stop()
+        await client.aclose()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+# ===== ВОРКЕР =====
+def run_worker(index: int) -> None:
+    """Запустить воркер: обычные обработчики, собственная БД, локальный вебхук от фронта"""
+    from bot import build_application, setup_commands
+    from utils.metrics import start_metrics_server
+    from webhook import run_webhook
+
+    os.makedirs(CLUSTER_DB_DIR, exist_ok=True)
+    set_database_path(worker_db_path(index))
+    create_tables()
+    reserve_worker_ids(index)
+
+    async def on_worker_startup(app):
+        # Команды меню достаточно установить одному воркеру
+        if index == 0:
+            await setup_commands(app)
+        # У каждого воркера свои метрики на отдельном порту
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_LISTEN, METRICS_PORT + 1 + index)
+
+    application = build_application(with_updater=False)
+    asyncio.run(run_webhook(
+        application,
+        '127.0.0.1',
+        CLUSTER_BASE_PORT + index,
+        WORKER_PATH,
+        secret=os.environ.get(WORKER_SECRET_ENV),
+        post_init=on_worker_startup
+    ))
+
+
+# ===== ПЕРЕБАЛАНСИРОВКА =====
+# Каждая БД воркера выдает ID счетов, операций и сверок из своего диапазона,
+# поэтому при переносе чата ID сохраняются и кнопки отката остаются верными
+ID_RANGE = 2 ** 32
+ID_COLUMNS = {'accounts': 'account_id', 'transactions': 'transaction_id', 'reconciliations': 'reconciliation_id'}
+
+
+def worker_db_files(index: int, db_dir: str = CLUSTER_DB_DIR) -> list[str]:
+    """Файлы БД воркера (шарды или единственный файл)"""
+    return list(dict.fromkeys(iter_database_paths(worker_db_path(index, db_dir))))
+
+
+def id_slot(index: int, file_number: int) -> int:
+    """Номер диапазона ID файла: одинаков для воркера и для перебалансировки"""
+    return index * max(SHARD_COUNT, 1) + file_number
+
+
+def max_allocated_id(conn) -> int:
+    """Наибольший когда-либо выданный в БД ID счетов, операций и сверок"""
+    top = conn.execute(
+        f"SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ({', '.join('?' * len(ID_COLUMNS))})",
+        tuple(ID_COLUMNS)
+    ).fetchone()[0] or 0
+    for table, pk in ID_COLUMNS.items():
+        top = max(top, conn.execute(f"SELECT MAX({pk}) FROM {table}").fetchone()[0] or 0)
+    return top
+
+
+def raise_id_floor(conn, floor: int) -> None:
+    """Следующие ID в БД будут больше floor (AUTOINCREMENT продолжает sqlite_sequence)"""
+    for table in ID_COLUMNS:
+        cursor = conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?", (floor, table, floor))
+        if cursor.rowcount == 0 and not conn.execute(
+                "SELECT 1 FROM sqlite_sequence WHERE name = ?", (table,)).fetchone():
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, floor))
+
+
+def reserve_worker_ids(index: int, db_dir: str = CLUSTER_DB_DIR) -> None:
+    """При запуске воркера: не выдавать ID ниже начала его диапазона"""
+    for number, path in enumerate(worker_db_files(index, db_dir)):
+        conn = get_db_connection(path)
+        try:
+            raise_id_floor(conn, id_slot(index, number) * ID_RANGE)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def assign_id_ranges(worker_count: int, db_dir: str = CLUSTER_DB_DIR) -> None:
+    """
+    После переноса чатов развести БД воркеров по новым непересекающимся диапазонам
+    выше всех уже выданных ID: перенесенные строки с чужими ID сдвигают AUTOINCREMENT
+    """
+    connections = {id_slot(index, number): get_db_connection(path)
+                   for index in range(worker_count)
+                   for number, path in enumerate(worker_db_files(index, db_dir))}
+    try:
+        top = max(max_allocated_id(conn) for conn in connections.values())
+        for slot, conn in connections.items():
+            raise_id_floor(conn, top + slot * ID_RANGE)
+            conn.commit()
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+def chat_has_data(conn, chat_id: int) -> bool:
+    return any(conn.execute(f"SELECT 1 FROM {table} WHERE chat_id = ? LIMIT 1", (chat_id,)).fetchone()
+               for table in ID_COLUMNS)
+
+
+def has_id_conflicts(src, dst, chat_id: int) -> bool:
+    """Заняты ли в целевой БД ID строк чата (базы, созданные до разделения диапазонов)"""
+    for table, pk in ID_COLUMNS.items():
+        ids = [row[0] for row in src.execute(f"SELECT {pk} FROM {table} WHERE chat_id = ?", (chat_id,))]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            if dst.execute(f"SELECT 1 FROM {table} WHERE {pk} IN ({', '.join('?' * len(chunk))}) LIMIT 1",
+                           chunk).fetchone():
+                return True
+    return False
+
+
+def move_chat(chat_id: int, src_path: str, dst_path: str) -> bool:
+    """
+    Перенести все данные чата в другую БД.
+
+    ID счетов, операций и сверок сохраняются, и кнопки отката в старых сообщениях
+    указывают на те же операции. Если ID в целевой БД уже заняты (БД, созданные
+    до разделения диапазонов ID), они назначаются заново, а время переноса
+    записывается в chat_moves.ids_renumbered_at: кнопки, созданные до него,
+    отклоняются (crud.revert_transaction_atomic, crud.revert_transaction_batch).
+
+    Перенос можно повторить после сбоя: копия, оставшаяся в целевой БД от
+    прерванного переноса (состояние 'copied'), заменяется, а не дублируется.
+
+    Returns:
+        True, если ID сохранены
+    """
+    src_path, dst_path = os.path.abspath(src_path), os.path.abspath(dst_path)
+    src = get_db_connection(src_path)
+    dst = get_db_connection(dst_path)
+    try:
+        dst.execute("BEGIN IMMEDIATE")
+        state = dst.execute("SELECT source, status FROM chat_moves WHERE chat_id = ?", (chat_id,)).fetchone()
+        if state and state['source'] == src_path and state['status'] == 'copied':
+            logger.warning(f"Чат {chat_id}: повтор прерванного переноса, копия в {dst_path} заменяется")
+            delete_chat_data(dst, chat_id)
+        elif chat_has_data(dst, chat_id):
+            raise RuntimeError(f"Чат {chat_id} уже есть в {dst_path}: перенос из {src_path} не выполнен")
+
+        previous = src.execute("SELECT ids_renumbered_at FROM chat_moves WHERE chat_id = ?", (chat_id,)).fetchone()
+        preserve_ids = not has_id_conflicts(src, dst, chat_id)
+        copy_chat_data(src, dst, chat_id, preserve_ids=preserve_ids)
+        dst.execute(
+            """INSERT OR REPLACE INTO chat_moves (chat_id, source, status, moved_at, ids_renumbered_at)
+            VALUES (?, ?, 'copied', CURRENT_TIMESTAMP, CASE WHEN ? THEN ? ELSE CURRENT_TIMESTAMP END)""",
+            (chat_id, src_path, preserve_ids, previous['ids_renumbered_at'] if previous else None)
+        )
+        dst.commit()
+
+        delete_chat_data(src, chat_id)
+        src.execute("DELETE FROM chat_moves WHERE chat_id = ?", (chat_id,))
+        src.commit()
+
+        dst.execute("UPDATE chat_moves SET status = 'done' WHERE chat_id = ?", (chat_id,))
+        dst.commit()
+        if not preserve_ids:
+            logger.warning(f"Чат {chat_id}: ID в {dst_path} заняты, назначены новые; старые кнопки отката отключены")
+        return preserve_ids
+    except Exception:
+        dst.rollback()
+        src.rollback()
+        raise
+    finally:
+        src.close()
+        dst.close()
+
+
+def rebalance(old_count: int, new_count: int, db_dir: str = CLUSTER_DB_DIR) -> int:
+    """
+    Перенести чаты между БД воркеров при изменении их количества.
+
+    Запускать при остановленных воркерах; после сбоя достаточно запустить повторно.
+    Возвращает количество перенесенных чатов.
+    """
+    new_ring = worker_ring(new_count)
+    os.makedirs(db_dir, exist_ok=True)
+    for index in range(max(old_count, new_count)):
+        base_path = worker_db_path(index, db_dir)
+        for path in dict.fromkeys([base_path] + iter_database_paths(base_path)):
+            create_tables(path)
+        reserve_worker_ids(index, db_dir)
+
+    moved = 0
+    for index in range(old_count):
+        base_path = worker_db_path(index, db_dir)
+        chat_ids = []
+        for path in iter_database_paths(base_path):
+            conn = get_db_connection(path)
+            try:
+                chat_ids += [row['chat_id'] for row in conn.execute("SELECT chat_id FROM chats").fetchall()]
+            finally:
+                conn.close()
+
+        for chat_id in chat_ids:
+            owner = new_ring.get_node(chat_id)
+            if owner != index:
+                move_chat(chat_id, chat_db_path(chat_id, base_path),
+                          chat_db_path(chat_id, worker_db_path(owner, db_dir)))
+                moved += 1
+
+    assign_id_ranges(max(old_count, new_count), db_dir)
+    logger.info(f"Перебалансировка {old_count} -> {new_count}: перенесено чатов {moved}")
+    return moved
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == 'worker':
+        run_worker(int(args[1]))
+    elif args and args[0] == 'rebalance':
+        rebalance(int(args[1]), int(args[2]))
+    else:
+        asyncio.run(run_front())
@@ -6,4 +6,50 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в .env файле")
\ No newline at end of file
+    raise ValueError("BOT_TOKEN не найден в .env файле")
+
+# Вычисление выражений в отдельном процессе с таймаутом
+CALC_USE_WORKER = os.getenv('CALC_USE_WORKER', 'false').lower() in ('1', 'true', 'yes')
+CALC_TIMEOUT = float(os.getenv('CALC_TIMEOUT', '2.0'))
+
+# Параллельная обработка обновлений разных чатов
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', 'true').lower() in ('1', 'true', 'yes')
+
+# Настройки вебхука
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес, например https://bot.example.com
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Кластерный режим: несколько воркеров, чаты распределяются по consistent hashing
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '2'))
+CLUSTER_BASE_PORT = int(os.getenv('CLUSTER_BASE_PORT', '9100'))
+CLUSTER_DB_DIR = os.getenv('CLUSTER_DB_DIR', 'data')
+
+# Администраторы бота (Telegram user_id через запятую)
+ADMIN_USER_IDS = {int(x) for x in os.getenv('ADMIN_USER_IDS', '').replace(' ', '').split(',') if x}
+
+# Резервное копирование
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+
+# Политика хранения: удалять отмененные операции старше N дней (0 — не удалять),
+# сворачивать архив старше последних K сверок в итоговые строки по дням (0 — не сворачивать)
+RETENTION_REVERTED_DAYS = int(os.getenv('RETENTION_REVERTED_DAYS', '90'))
+RETENTION_KEEP_RECONCILIATIONS = int(os.getenv('RETENTION_KEEP_RECONCILIATIONS', '3'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv('MAINTENANCE_INTERVAL_HOURS', '24'))
+
+# Проверка целостности балансов (verify.py)
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', '0')) or None  # None — по числу CPU
+VERIFY_INTERVAL_HOURS = float(os.getenv('VERIFY_INTERVAL_HOURS', '24'))
+
+# Метрики в формате Prometheus: GET /metrics (0 — не запускать)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
@@ -1,18 +1,308 @@
 # core.py - ПОЛНОСТЬЮ ОБНОВЛЕННАЯ ВЕРСИЯ С USERNAME
+import os
 import sqlite3
+from contextvars import ContextVar
 from datetime import datetime
+from utils.query_profiler import TracedConnection
 
-def get_db_connection():
-    """Установить соединение с базой данных"""
-    conn = sqlite3.connect('accountant_bot.db')
+# Путь к главной базе данных; воркеры кластера используют собственные файлы
+DATABASE_PATH = 'accountant_bot.db'
+
+# Шардирование по chat_id: при SHARD_COUNT > 1 данные каждого чата хранятся в своем файле-шарде,
+# а главная БД содержит карту шардов и данные вне контекста чата
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+
+# Чат текущего обновления; задается middleware и определяет шард для get_db_connection()
+_current_chat_id = ContextVar('current_chat_id', default=None)
+
+# (главная БД, chat_id) -> номер шарда
+_shard_cache = {}
+
+# Таблицы с данными чата в порядке копирования (с учетом внешних ключей)
+CHAT_TABLES = ('chats', 'chat_members', 'accounts', 'transactions', 'reconciliations')
+
+def set_database_path(path: str) -> None:
+    """Задать путь к главной базе данных для текущего процесса"""
+    global DATABASE_PATH
+    DATABASE_PATH = path
+
+def bind_chat(chat_id: int | None) -> None:
+    """Привязать текущий контекст (обновление, поток) к чату для выбора шарда"""
+    _current_chat_id.set(chat_id)
+
+def shard_path(shard: int, base_path: str = None) -> str:
+    """Путь к файлу шарда: accountant_bot.db -> accountant_bot.shard3.db"""
+    base, ext = os.path.splitext(base_path or DATABASE_PATH)
+    return f"{base}.shard{shard}{ext or '.db'}"
+
+def iter_database_paths(base_path: str = None) -> list[str]:
+    """Все файлы с данными чатов: шарды или единственная БД"""
+    if SHARD_COUNT <= 1:
+        return [base_path or DATABASE_PATH]
+    return [shard_path(shard, base_path) for shard in range(SHARD_COUNT)]
+
+def get_chat_shard(chat_id: int, base_path: str = None) -> int:
+    """
+    Номер шарда чата по карте шардов главной БД.
+
+    Новый чат закрепляется за шардом abs(chat_id) % SHARD_COUNT, и это
+    назначение сохраняется, поэтому изменение SHARD_COUNT не переносит старые чаты.
+    """
+    base_path = base_path or DATABASE_PATH
+    key = (base_path, chat_id)
+    if key not in _shard_cache:
+        conn = sqlite3.connect(base_path)
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO shard_map (chat_id, shard) VALUES (?, ?)",
+                (chat_id, abs(chat_id) % SHARD_COUNT)
+            )
+            conn.commit()
+            _shard_cache[key] = conn.execute("SELECT shard FROM shard_map WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+        finally:
+            conn.close()
+    return _shard_cache[key]
+
+def chat_db_path(chat_id: int, base_path: str = None) -> str:
+    """Файл БД, в котором хранятся данные чата"""
+    if SHARD_COUNT <= 1:
+        return base_path or DATABASE_PATH
+    return shard_path(get_chat_shard(chat_id, base_path), base_path)
+
+def get_db_connection(path: str = None, chat_id: int = None):
+    """
+    Установить соединение с базой данных.
+
+    Без явного пути выбирается шард чата (chat_id или чат текущего обновления),
+    а вне контекста чата — главная БД.
+    """
+    if path is None:
+        if chat_id is None:
+            chat_id = _current_chat_id.get()
+        path = chat_db_path(chat_id) if chat_id is not None else DATABASE_PATH
+    # Соединение считает и замеряет запросы (utils/query_profiler.py)
+    conn = sqlite3.connect(path, factory=TracedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
-def create_tables():
+def iter_admin_connections(base_path: str = None):
+    """
+    Соединения с главной БД, к которым через ATTACH подключены шарды
+    (для административных запросов по всем чатам).
+
+    SQLite подключает к соединению ограниченное число БД (по умолчанию 10),
+    поэтому шарды делятся на группы — по соединению на группу.
+
+    Yields:
+        (соединение, список схем с данными чатов: ['main'] или ['shard0', 'shard1', ...])
+    """
+    main_path = base_path or DATABASE_PATH
+    if SHARD_COUNT <= 1:
+        conn = get_db_connection(main_path)
+        try:
+            yield conn, ['main']
+        finally:
+            conn.close()
+        return
+
+    paths = iter_database_paths(base_path)
+    first = 0
+    while first < len(paths):
+        conn = get_db_connection(main_path)
+        try:
+            group_size = max(conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED), 1)
+            schemas = []
+            for shard in range(first, min(first + group_size, len(paths))):
+                conn.execute(f"ATTACH DATABASE ? AS shard{shard}", (paths[shard],))
+                schemas.append(f"shard{shard}")
+            first += len(schemas)
+            yield conn, schemas
+        finally:
+            conn.close()
+
+def union_all_shards(schemas: list[str], select: str) -> str:
+    """Объединить запрос по всем схемам; в select таблицы указываются как {schema}.table"""
+    return " UNION ALL ".join(select.format(schema=schema) for schema in schemas)
+
+def copy_table_rows(src, dst, table: str, where: str, params: tuple, pk: str = None, remap: dict = None) -> dict:
+    """
+    Скопировать строки таблицы между соединениями.
+
+    Если указан pk, первичный ключ назначается заново и возвращается соответствие
+    старых и новых ID; иначе строки копируются с исходными ключами.
+    """
+    id_map = {}
+    for row in src.execute(f"SELECT * FROM {table} WHERE {where}", params).fetchall():
+        data = dict(row)
+        old_id = data.pop(pk) if pk else None
+        for column, mapping in (remap or {}).items():
+            if data.get(column) is not None:
+                data[column] = mapping[data[column]]
+        columns = ', '.join(data)
+        placeholders = ', '.join('?' * len(data))
+        cursor = dst.execute(f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})", list(data.values()))
+        if pk:
+            id_map[old_id] = cursor.lastrowid
+    return id_map
+
+def copy_chat_data(src, dst, chat_id: int, preserve_ids: bool = True) -> None:
+    """Скопировать все данные чата (и связанных пользователей) из одной БД в другую"""
+    params = (chat_id,)
+    copy_table_rows(src, dst, 'users', """user_id IN (
+        SELECT user_id FROM chat_members WHERE chat_id = ?1
+        UNION SELECT created_by FROM accounts WHERE chat_id = ?1
+        UNION SELECT created_by FROM transactions WHERE chat_id = ?1)""", params)
+    copy_table_rows(src, dst, 'chats', "chat_id = ?", params)
+    copy_table_rows(src, dst, 'chat_members', "chat_id = ?", params)
+
+    if preserve_ids:
+        for table in ('accounts', 'transactions', 'reconciliations'):
+            copy_table_rows(src, dst, table, "chat_id = ?", params)
+    else:
+        account_map = copy_table_rows(src, dst, 'accounts', "chat_id = ?", params, pk='account_id')
+        copy_table_rows(src, dst, 'transactions', "chat_id = ?", params, pk='transaction_id',
+                        remap={'account_id': account_map})
+        copy_table_rows(src, dst, 'reconciliations', "chat_id = ?", params, pk='reconciliation_id',
+                        remap={'account_id': account_map})
+
+def delete_chat_data(conn, chat_id: int) -> None:
+    """Удалить все данные чата из БД"""
+    for table in reversed(CHAT_TABLES):
+        conn.execute(f"DELETE FROM {table} WHERE chat_id = ?", (chat_id,))
+
+def create_tables(path: str = None):
+    """
+    Создать таблицы в главной БД и во всех шардах
+    (или только в указанном файле, если передан path)
+    """
+    if path is not None:
+        _create_tables_in(path)
+        return
+    for db_path in dict.fromkeys([DATABASE_PATH] + iter_database_paths()):
+        _create_tables_in(db_path)
+
+def operation_day(row: str) -> str:
+    """
+    SQL-выражение дня операции (row — таблица или псевдоним). date() не разбирает
+    нестандартные строки и вернул бы NULL — тогда берем первые 10 символов
+    """
+    return f"COALESCE(date({row}.date), substr({row}.date, 1, 10))"
+
+def _create_rollup_triggers(cursor) -> None:
+    """Триггеры, поддерживающие daily_rollups при добавлении, отмене и удалении операций"""
+    add_row = '''
+        INSERT INTO daily_rollups (account_id, day, chat_id, income, expense, tx_count)
+        VALUES ({row}.account_id, {day}, {row}.chat_id, MAX({row}.amount, 0), MIN({row}.amount, 0), 1)
+        ON CONFLICT(account_id, day) DO UPDATE SET
+            income = income + excluded.income,
+            expense = expense + excluded.expense,
+            tx_count = tx_count + 1;
+    '''
+    remove_row = '''
+        UPDATE daily_rollups SET
+            income = income - MAX({row}.amount, 0),
+            expense = expense - MIN({row}.amount, 0),
+            tx_count = tx_count - 1
+        WHERE account_id = {row}.account_id AND day = {day};
+    '''
+    triggers = {
+        'trg_rollup_insert': ("AFTER INSERT ON transactions WHEN NEW.is_reverted = 0", add_row, 'NEW'),
+        'trg_rollup_delete': ("AFTER DELETE ON transactions WHEN OLD.is_reverted = 0", remove_row, 'OLD'),
+        'trg_rollup_revert': ("AFTER UPDATE OF is_reverted ON transactions "
+                              "WHEN OLD.is_reverted = 0 AND NEW.is_reverted = 1", remove_row, 'OLD'),
+        'trg_rollup_unrevert': ("AFTER UPDATE OF is_reverted ON transactions "
+                                "WHEN OLD.is_reverted = 1 AND NEW.is_reverted = 0", add_row, 'NEW'),
+    }
+    for name, (event, body, row) in triggers.items():
+        statement = body.format(row=row, day=operation_day(row))
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {statement} END")
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_rollup_account_delete AFTER DELETE ON accounts "
+        "BEGIN DELETE FROM daily_rollups WHERE account_id = OLD.account_id; END"
+    )
+
+def _create_ledger_version_triggers(cursor) -> None:
+    """Триггеры, увеличивающие версию данных чата при любом изменении счетов, операций и сверок"""
+    bump = '''
+        INSERT INTO ledger_versions (chat_id, version) VALUES ({row}.chat_id, 1)
+        ON CONFLICT(chat_id) DO UPDATE SET version = version + 1;
+    '''
+    for table in ('accounts', 'transactions', 'reconciliations'):
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_ledger_version_{table}_{event.lower()} "
+                f"AFTER {event} ON {table} BEGIN {bump.format(row=row)} END"
+            )
+
+def search_text(column: str) -> str:
+    """SQL-выражение текста для поиска: ё приводится к е (unicode61 их не объединяет)"""
+    return f"replace(replace(COALESCE({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+def _create_search_index(conn) -> None:
+    """
+    Полнотекстовый индекс FTS5 по комментариям и username операций.
+
+    Таблица без собственного содержимого (content=''): хранится только индекс,
+    данные берутся из transactions по rowid = transaction_id. chat_id индексируется
+    как слово, чтобы поиск сразу ограничивался чатом внутри индекса.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+    ).fetchone() is not None
+    if not exists:
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE transactions_fts USING fts5("
+                "comment, username, chat_id, content='', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError as e:
+            # SQLite собран без FTS5 — поиск работает через LIKE (crud.search_transactions)
+            print(f"⚠️ Полнотекстовый поиск недоступен: {e}")
+            return
+
+    def values(row):
+        return f"{row}.transaction_id, {search_text(row + '.comment')}, {search_text(row + '.username')}, {row}.chat_id"
+
+    add_row = f"INSERT INTO transactions_fts (rowid, comment, username, chat_id) VALUES ({values('NEW')});"
+    remove_row = ("INSERT INTO transactions_fts (transactions_fts, rowid, comment, username, chat_id) "
+                  f"VALUES ('delete', {values('OLD')});")
+    triggers = {
+        'trg_search_insert': ("AFTER INSERT ON transactions", add_row),
+        'trg_search_delete': ("AFTER DELETE ON transactions", remove_row),
+        'trg_search_update': ("AFTER UPDATE OF comment, username, chat_id ON transactions", remove_row + add_row),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+    if not exists:
+        # Индекс появился впервые — добавляем уже существующие операции
+        conn.execute(f"""
+            INSERT INTO transactions_fts (rowid, comment, username, chat_id)
+            SELECT {values('t')} FROM transactions t
+        """)
+
+def rebuild_daily_rollups(conn) -> None:
+    """Пересчитать дневные итоги из таблицы операций (без commit)"""
+    conn.execute("DELETE FROM daily_rollups")
+    conn.execute(f"""
+        INSERT INTO daily_rollups (account_id, day, chat_id, income, expense, tx_count)
+        SELECT t.account_id, {operation_day('t')}, t.chat_id,
+               SUM(MAX(t.amount, 0)), SUM(MIN(t.amount, 0)), COUNT(*)
+        FROM transactions t
+        JOIN accounts a ON a.account_id = t.account_id
+        WHERE t.is_reverted = 0
+        GROUP BY t.account_id, {operation_day('t')}
+    """)
+
+def _create_tables_in(path: str):
     """Создать все необходимые таблицы в базе данных с поддержкой username"""
-    conn = get_db_connection()
+    conn = get_db_connection(path)
     cursor = conn.cursor()
     cursor.execute("PRAGMA foreign_keys = ON;")
+    # Действует только для нового файла; существующие переводит maintenance.py
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    # WAL сохраняется в файле: читатели (резервная копия, отчеты) не блокируют запись
+    cursor.execute("PRAGMA journal_mode = WAL;")
 
     try:
         # Таблица пользователей
@@ -100,6 +390,59 @@ def create_tables():
         )
         ''')
 
+        # Таблица обработанных обновлений Telegram (защита от повторной доставки)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_key TEXT PRIMARY KEY,
+            processed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        ''')
+
+        # Дневные итоги по счетам (доходы, расходы, количество) для отчетов за период.
+        # Поддерживаются триггерами на transactions, см. _create_rollup_triggers
+        rollups_exist = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_rollups'"
+        ).fetchone() is not None
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            account_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            income REAL NOT NULL DEFAULT 0,
+            expense REAL NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, day)
+        ) WITHOUT ROWID
+        ''')
+
+        # Версия данных чата: растет при каждом изменении (триггеры), служит ключом кэша сводок
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_versions (
+            chat_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''')
+
+        # Карта шардов: за каким файлом-шардом закреплен чат
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shard_map (
+            chat_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL
+        )
+        ''')
+
+        # Переносы чатов между БД воркеров кластера (cluster.move_chat): состояние
+        # переноса ('copied' -> 'done') и время последнего переноса с новыми ID
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_moves (
+            chat_id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL,
+            moved_at DATETIME NOT NULL,
+            ids_renumbered_at DATETIME
+        )
+        ''')
+
         # ДОБАВЛЯЕМ КОЛОНКИ ДЛЯ ОБРАТНОЙ СОВМЕСТИМОСТИ
         tables_to_update = ['accounts', 'transactions', 'reconciliations']
         for table in tables_to_update:
@@ -116,6 +459,8 @@ def create_tables():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_accounts_created_by ON accounts(created_by)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions(account_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)')
+        # Баланс счета: операции счета после даты сверки (иначе планировщик выбирает idx_transactions_reverted)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_archived ON transactions(is_archived)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_reverted ON transactions(is_reverted)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_created_by ON transactions(created_by)')
@@ -123,6 +468,14 @@ def create_tables():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_reconciliations_date ON reconciliations(reconciliation_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_members_chat ON chat_members(chat_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_members_user ON chat_members(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_processed_updates_time ON processed_updates(processed_at)')
+
+        _create_rollup_triggers(cursor)
+        _create_ledger_version_triggers(cursor)
+        if not rollups_exist:
+            # Таблица появилась впервые — заполняем итоги по уже существующим операциям
+            rebuild_daily_rollups(conn)
+        _create_search_index(conn)
 
         conn.commit()
         print("✅ Таблицы базы данных успешно созданы/обновлены с поддержкой username!")
@@ -1,7 +1,10 @@
 # crud.py - ОБНОВЛЕННАЯ ВЕРСИЯ С USERNAME
+import re
 import sqlite3
-from datetime import datetime
-from core import get_db_connection
+from datetime import datetime, timezone
+from core import get_db_connection, iter_admin_connections, union_all_shards, search_text
+from models import Chat, Account, ChatSummary, AccountSummary
+from utils.cache import LRUCache
 
 # ===== USERS & CHATS =====
 def create_user(user_id: int, username: str = None) -> None:
@@ -22,7 +25,7 @@ def get_user(user_id: int) -> dict | None:
         conn.close()
 
 def create_chat(chat_id: int, chat_type: str, title: str = None) -> None:
-    conn = get_db_connection()
+    conn = get_db_connection(chat_id=chat_id)
     try:
         conn.execute("INSERT OR REPLACE INTO chats (chat_id, chat_type, title) VALUES (?, ?, ?)", (chat_id, chat_type, title))
         conn.commit()
@@ -30,7 +33,7 @@ def create_chat(chat_id: int, chat_type: str, title: str = None) -> None:
         conn.close()
 
 def get_chat(chat_id: int) -> dict | None:
-    conn = get_db_connection()
+    conn = get_db_connection(chat_id=chat_id)
     try:
         cursor = conn.execute("SELECT * FROM chats WHERE chat_id = ?", (chat_id,))
         row = cursor.fetchone()
@@ -39,20 +42,75 @@ def get_chat(chat_id: int) -> dict | None:
         conn.close()
 
 def add_chat_member(chat_id: int, user_id: int) -> None:
-    conn = get_db_connection()
+    conn = get_db_connection(chat_id=chat_id)
     try:
         conn.execute("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)", (chat_id, user_id))
         conn.commit()
     finally:
         conn.close()
 
+def upsert_identity(chat: tuple | None = None, user: tuple | None = None,
+                    member: tuple | None = None) -> None:
+    """
+    Сохранить чат, пользователя и участие в чате одним пакетом на одном соединении.
+
+    Args:
+        chat: (chat_id, chat_type, title) или None
+        user: (user_id, username) или None
+        member: (chat_id, user_id) или None
+    """
+    chat_id = chat[0] if chat else (member[0] if member else None)
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        if chat:
+            conn.execute(
+                """INSERT INTO chats (chat_id, chat_type, title) VALUES (?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET chat_type = excluded.chat_type, title = excluded.title""",
+                chat
+            )
+        if user:
+            conn.execute(
+                """INSERT INTO users (user_id, username) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET username = excluded.username""",
+                user
+            )
+        if member:
+            conn.execute("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)", member)
+        conn.commit()
+    finally:
+        conn.close()
+
+# ===== PROCESSED UPDATES =====
+def mark_update_processed(update_key: str) -> bool:
+    """Отметить обновление как обработанное. Возвращает False, если оно уже было обработано"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("INSERT OR IGNORE INTO processed_updates (update_key) VALUES (?)", (update_key,))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def prune_processed_updates(keep_hours: int = 48) -> int:
+    """Удалить старые ключи обработанных обновлений"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "DELETE FROM processed_updates WHERE processed_at < datetime('now', ?)",
+            (f'-{keep_hours} hours',)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
 # ===== ACCOUNTS ===== С USERNAME
 def create_account(chat_id: int, account_name: str, created_by: int = None, username: str = None, precision: int = 2) -> int:
     """Создание счета с указанной точностью и username"""
     if precision < 0 or precision > 8:
         raise ValueError("Точность должна быть от 0 до 8")
 
-    conn = get_db_connection()
+    conn = get_db_connection(chat_id=chat_id)
     try:
         cursor = conn.execute(
             "INSERT INTO accounts (chat_id, account_name, created_by, username, precision) VALUES (?, ?, ?, ?, ?)",
@@ -73,7 +131,7 @@ def get_account(account_id: int) -> dict | None:
         conn.close()
 
 def get_chat_accounts(chat_id: int) -> list[dict]:
-    conn = get_db_connection()
+    conn = get_db_connection(chat_id=chat_id)
     try:
         cursor = conn.execute("SELECT * FROM accounts WHERE chat_id = ? ORDER BY account_name", (chat_id,))
         return [dict(row) for row in cursor.fetchall()]
@@ -101,14 +159,15 @@ def delete_account(account_id: int) -> None:
 def create_transaction(account_id: int, chat_id: int, amount: float, date: datetime,
                        comment: str = None, created_by: int = None, username: str = None) -> int:
     """Создание транзакции с округлением до точности счета и сохранением username"""
-    # Получаем точность счета
-    precision = get_account_precision(account_id)
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        # Получаем точность счета из того же шарда
+        row = conn.execute("SELECT precision FROM accounts WHERE account_id = ?", (account_id,)).fetchone()
+        precision = row['precision'] if row else 2
 
-    # Округляем сумму до нужной точности
-    rounded_amount = round(amount, precision)
+        # Округляем сумму до нужной точности
+        rounded_amount = round(amount, precision)
 
-    conn = get_db_connection()
-    try:
         cursor = conn.execute(
             "INSERT INTO transactions (account_id, chat_id, amount, date, comment, created_by, username) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (account_id, chat_id, rounded_amount, date, comment, created_by, username)
@@ -118,6 +177,47 @@ def create_transaction(account_id: int, chat_id: int, amount: float, date: datet
     finally:
         conn.close()
 
+def create_transactions_batch(chat_id: int, operations: list[dict], date: datetime,
+                              created_by: int = None, username: str = None) -> dict:
+    """
+    Создание нескольких транзакций в одной транзакции БД.
+
+    Args:
+        operations: список словарей {'account_id', 'amount', 'comment'}
+
+    Returns:
+        {'transaction_ids': [...], 'balances': {account_id: баланс}} —
+        баланс пересчитывается один раз для каждого затронутого счета.
+    """
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        precisions = {}
+        transaction_ids = []
+
+        for operation in operations:
+            account_id = operation['account_id']
+            if account_id not in precisions:
+                row = conn.execute("SELECT precision FROM accounts WHERE account_id = ?", (account_id,)).fetchone()
+                precisions[account_id] = row['precision'] if row else 2
+
+            cursor = conn.execute(
+                "INSERT INTO transactions (account_id, chat_id, amount, date, comment, created_by, username) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account_id, chat_id, round(operation['amount'], precisions[account_id]), date,
+                 operation.get('comment'), created_by, username)
+            )
+            transaction_ids.append(cursor.lastrowid)
+
+        balances = {account_id: _calculate_account_balance(conn, account_id) for account_id in precisions}
+        conn.commit()
+
+        return {'transaction_ids': transaction_ids, 'balances': balances}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def get_transaction(transaction_id: int) -> dict | None:
     conn = get_db_connection()
     try:
@@ -173,14 +273,15 @@ def archive_all_transactions(account_id: int) -> int:
 def create_reconciliation(account_id: int, chat_id: int, balance: float,
                           reconciliation_date: datetime, created_by: int = None, username: str = None) -> int:
     """Создание сверки с округлением до точности счета и сохранением username"""
-    # Получаем точность счета
-    precision = get_account_precision(account_id)
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        # Получаем точность счета из того же шарда
+        row = conn.execute("SELECT precision FROM accounts WHERE account_id = ?", (account_id,)).fetchone()
+        precision = row['precision'] if row else 2
 
-    # Округляем баланс до нужной точности
-    rounded_balance = round(balance, precision)
+        # Округляем баланс до нужной точности
+        rounded_balance = round(balance, precision)
 
-    conn = get_db_connection()
-    try:
         cursor = conn.execute(
             "INSERT INTO reconciliations (account_id, chat_id, balance, reconciliation_date, created_by, username) VALUES (?, ?, ?, ?, ?, ?)",
             (account_id, chat_id, rounded_balance, reconciliation_date, created_by, username)
@@ -214,55 +315,85 @@ def get_last_reconciliation(account_id: int) -> dict | None:
         conn.close()
 
 # ===== BALANCE =====
-def get_account_balance(account_id: int) -> float:
-    """ИСПРАВЛЕННАЯ функция расчета баланса с учетом сверок и отмененных операций"""
-    conn = get_db_connection()
-    try:
-        # Находим последнюю сверку
+def _calculate_account_balance(conn, account_id: int) -> float:
+    """Расчет баланса счета на уже открытом соединении (последняя сверка + операции после нее)"""
+    last_recon = conn.execute(
+        "SELECT balance, reconciliation_date FROM reconciliations WHERE account_id = ? ORDER BY reconciliation_date DESC LIMIT 1",
+        (account_id,)
+    ).fetchone()
+
+    # Суммируем операции после последней сверки (исключая отмененные).
+    # Унарный + исключает флаги из выбора индекса: иначе SQLite может взять
+    # малоселективный idx_transactions_reverted вместо (account_id, date)
+    if last_recon:
+        cursor = conn.execute(
+            """SELECT COALESCE(SUM(amount), 0) 
+            FROM transactions 
+            WHERE account_id = ? AND +is_archived = 0 AND +is_reverted = 0 AND date > ?""",
+            (account_id, last_recon['reconciliation_date'])
+        )
+    else:
         cursor = conn.execute(
-            "SELECT balance FROM reconciliations WHERE account_id = ? ORDER BY reconciliation_date DESC LIMIT 1",
+            "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE account_id = ? AND +is_archived = 0 AND +is_reverted = 0",
             (account_id,)
         )
-        last_recon = cursor.fetchone()
-
-        # Суммируем операции после последней сверки (исключая отмененные)
-        if last_recon:
-            last_recon_date = conn.execute(
-                "SELECT reconciliation_date FROM reconciliations WHERE account_id = ? ORDER BY reconciliation_date DESC LIMIT 1",
-                (account_id,)
-            ).fetchone()
-
-            if last_recon_date:
-                cursor = conn.execute(
-                    """SELECT COALESCE(SUM(amount), 0) 
-                    FROM transactions 
-                    WHERE account_id = ? AND is_archived = 0 AND is_reverted = 0 AND date > ?""",
-                    (account_id, last_recon_date['reconciliation_date'])
-                )
-            else:
-                cursor = conn.execute(
-                    "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE account_id = ? AND is_archived = 0 AND is_reverted = 0",
-                    (account_id,)
-                )
-        else:
-            cursor = conn.execute(
-                "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE account_id = ? AND is_archived = 0 AND is_reverted = 0",
-                (account_id,)
-            )
 
-        post_recon_sum = cursor.fetchone()[0]
+    post_recon_sum = cursor.fetchone()[0]
 
-        if last_recon:
-            return float(last_recon['balance']) + float(post_recon_sum)
-        else:
-            return float(post_recon_sum)
+    if last_recon:
+        return float(last_recon['balance']) + float(post_recon_sum)
+    else:
+        return float(post_recon_sum)
 
+def get_account_balance(account_id: int) -> float:
+    """ИСПРАВЛЕННАЯ функция расчета баланса с учетом сверок и отмененных операций"""
+    conn = get_db_connection()
+    try:
+        return _calculate_account_balance(conn, account_id)
     except Exception as e:
         print(f"Ошибка при расчете баланса для счета {account_id}: {e}")
         return 0.0
     finally:
         conn.close()
 
+# ===== ОТЧЕТЫ =====
+# Группировка дневных итогов: день, неделя (понедельник), месяц, счет
+ROLLUP_GROUPS = {
+    'day': "day",
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "substr(day, 1, 7)",
+    'account': "account_id",
+}
+
+def get_rollup_report(chat_id: int, account_ids: list[int], start_day: str, end_day: str,
+                      group_by: str = 'day') -> list[dict]:
+    """
+    Поступления и списания за период по дневным итогам (daily_rollups).
+    Время не зависит от числа операций: одна строка на счет и день.
+
+    Returns:
+        [{'period', 'income', 'expense', 'tx_count'}] по возрастанию периода
+    """
+    if not account_ids:
+        return []
+    group = ROLLUP_GROUPS[group_by]
+    placeholders = ','.join('?' * len(account_ids))
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        cursor = conn.execute(
+            f"""SELECT {group} AS period, SUM(income) AS income, SUM(expense) AS expense,
+                SUM(tx_count) AS tx_count
+            FROM daily_rollups
+            WHERE account_id IN ({placeholders}) AND day BETWEEN ? AND ?
+            GROUP BY period
+            HAVING SUM(tx_count) > 0
+            ORDER BY period""",
+            (*account_ids, start_day, end_day)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
 # ===== УТИЛИТЫ =====
 def ensure_chat_exists(chat_id: int, chat_type: str, title: str = None) -> None:
     chat = get_chat(chat_id)
@@ -301,60 +432,185 @@ def get_account_current_balance(account_id: int) -> float:
     finally:
         conn.close()
 
-def get_chat_financial_summary(chat_id: int) -> dict:
-    """Получить финансовую сводку по чату"""
-    conn = get_db_connection()
-    try:
-        # Общий баланс
-        cursor = conn.execute(
-            """SELECT COALESCE(SUM(t.amount), 0) as total_balance
-            FROM transactions t
-            JOIN accounts a ON t.account_id = a.account_id
-            WHERE a.chat_id = ? AND t.is_archived = 0""",
-            (chat_id,)
-        )
-        total_balance = cursor.fetchone()['total_balance']
+def get_global_stats() -> dict:
+    """Количество чатов, счетов, операций и сверок по всем шардам (для /admin stats)"""
+    stats = {table: 0 for table in ('chats', 'accounts', 'transactions', 'reconciliations')}
+    stats['shards'] = 0
+    for conn, schemas in iter_admin_connections():
+        for table in ('chats', 'accounts', 'transactions', 'reconciliations'):
+            query = union_all_shards(schemas, f"SELECT COUNT(*) AS cnt FROM {{schema}}.{table}")
+            stats[table] += conn.execute(f"SELECT COALESCE(SUM(cnt), 0) FROM ({query})").fetchone()[0]
+        stats['shards'] += len(schemas)
+    return stats
+
+# ===== ПОИСК =====
+def search_terms(query: str) -> list[str]:
+    """Слова поискового запроса в нижнем регистре, ё -> е"""
+    return re.findall(r'\w+', query.lower().replace('ё', 'е'))
+
+def search_transactions(chat_id: int, query: str, account_id: int = None,
+                        limit: int = 10, offset: int = 0) -> list[dict]:
+    """
+    Найти операции чата по словам комментария или username (каждое слово — префикс).
+    Отмененные операции не возвращаются. Сортировка от новых к старым.
 
-        # Количество счетов
-        cursor.execute(
-            "SELECT COUNT(*) as account_count FROM accounts WHERE chat_id = ?",
-            (chat_id,)
-        )
-        account_count = cursor.fetchone()['account_count']
+    Поиск идет по индексу FTS5 transactions_fts; если SQLite собран без FTS5 —
+    через LIKE (медленно и с учетом регистра для кириллицы).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+        ).fetchone() is not None
+        account_filter = "AND t.account_id = ?" if account_id is not None else ""
+        account_params = (account_id,) if account_id is not None else ()
+
+        if has_index:
+            # chat_id индексирован как слово (без знака) — отбор по чату выполняет сам индекс
+            expression = ' '.join(f'"{term}"*' for term in terms)
+            match = f'chat_id : "{abs(chat_id)}" AND {{comment username}} : ({expression})'
+            cursor = conn.execute(
+                f"""SELECT t.transaction_id, t.account_id, a.account_name, a.precision, t.amount, t.date,
+                    t.comment, t.username
+                FROM transactions_fts f
+                JOIN transactions t ON t.transaction_id = f.rowid
+                JOIN accounts a ON a.account_id = t.account_id
+                WHERE transactions_fts MATCH ? AND t.chat_id = ? AND t.is_reverted = 0 {account_filter}
+                ORDER BY f.rowid DESC
+                LIMIT ? OFFSET ?""",
+                (match, chat_id, *account_params, limit, offset)
+            )
+        else:
+            text = f"{search_text('t.comment')} || ' ' || {search_text('t.username')}"
+            conditions = ' AND '.join(f"{text} LIKE ?" for _ in terms)
+            cursor = conn.execute(
+                f"""SELECT t.transaction_id, t.account_id, a.account_name, a.precision, t.amount, t.date,
+                    t.comment, t.username
+                FROM transactions t
+                JOIN accounts a ON a.account_id = t.account_id
+                WHERE t.chat_id = ? AND t.is_reverted = 0 {account_filter} AND {conditions}
+                ORDER BY t.transaction_id DESC
+                LIMIT ? OFFSET ?""",
+                (chat_id, *account_params, *(f"%{term}%" for term in terms), limit, offset)
+            )
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
 
-        # Количество транзакций
-        cursor.execute(
-            """SELECT COUNT(*) as transaction_count
-            FROM transactions t
-            JOIN accounts a ON t.account_id = a.account_id
-            WHERE a.chat_id = ? AND t.is_archived = 0""",
-            (chat_id,)
-        )
-        transaction_count = cursor.fetchone()['transaction_count']
+# ===== СВОДКИ =====
+# chat_id -> (версия данных чата, ChatSummary); версию поднимают триггеры ledger_versions
+_summary_cache = LRUCache(maxsize=5000)
 
-        # Доходы и расходы
-        cursor.execute(
-            """SELECT 
-                COALESCE(SUM(CASE WHEN t.amount > 0 THEN t.amount ELSE 0 END), 0) as total_income,
-                COALESCE(SUM(CASE WHEN t.amount < 0 THEN t.amount ELSE 0 END), 0) as total_expenses
+def _parse_datetime(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def get_ledger_version(conn, chat_id: int) -> int:
+    """Текущая версия данных чата (0, если чат еще не менялся)"""
+    row = conn.execute("SELECT version FROM ledger_versions WHERE chat_id = ?", (chat_id,)).fetchone()
+    return row['version'] if row else 0
+
+def _build_chat_summary(conn, chat_id: int) -> ChatSummary:
+    """Сводка по чату одним агрегирующим проходом по операциям (последняя сверка + операции после нее)"""
+    chat_row = conn.execute("SELECT * FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+    chat = Chat(chat_id=chat_id, chat_type=chat_row['chat_type'] if chat_row else 'private',
+                title=chat_row['title'] if chat_row else None,
+                created_at=_parse_datetime(chat_row['created_at']) if chat_row else None)
+
+    rows = conn.execute(
+        """WITH last_recon AS (
+            SELECT account_id, balance, reconciliation_date FROM (
+                SELECT account_id, balance, reconciliation_date,
+                       ROW_NUMBER() OVER (PARTITION BY account_id ORDER BY reconciliation_date DESC) AS rn
+                FROM reconciliations WHERE chat_id = ?1
+            ) WHERE rn = 1
+        ),
+        ops AS (
+            SELECT t.account_id, t.amount, t.date,
+                   t.is_archived = 0 AND (r.reconciliation_date IS NULL OR t.date > r.reconciliation_date) AS open
             FROM transactions t
-            JOIN accounts a ON t.account_id = a.account_id
-            WHERE a.chat_id = ? AND t.is_archived = 0""",
-            (chat_id,)
+            LEFT JOIN last_recon r ON r.account_id = t.account_id
+            WHERE t.chat_id = ?1 AND t.is_reverted = 0
         )
-        income_expenses = cursor.fetchone()
-
-        return {
-            'total_balance': total_balance,
-            'account_count': account_count,
-            'transaction_count': transaction_count,
-            'total_income': income_expenses['total_income'],
-            'total_expenses': income_expenses['total_expenses'],
-            'net_flow': income_expenses['total_income'] + income_expenses['total_expenses']
-        }
+        SELECT a.account_id, a.chat_id, a.account_name, a.created_by, a.created_at, a.precision,
+               r.balance AS reconciled_balance, r.reconciliation_date,
+               COALESCE(SUM(CASE WHEN o.open AND o.amount > 0 THEN o.amount END), 0) AS income,
+               COALESCE(SUM(CASE WHEN o.open AND o.amount < 0 THEN o.amount END), 0) AS expenses,
+               COUNT(CASE WHEN o.open THEN 1 END) AS transaction_count,
+               MAX(o.date) AS last_transaction_date
+        FROM accounts a
+        LEFT JOIN last_recon r ON r.account_id = a.account_id
+        LEFT JOIN ops o ON o.account_id = a.account_id
+        WHERE a.chat_id = ?1
+        GROUP BY a.account_id
+        ORDER BY a.account_name""",
+        (chat_id,)
+    ).fetchall()
+
+    accounts = []
+    for row in rows:
+        reconciled = float(row['reconciled_balance'] or 0)
+        accounts.append(AccountSummary(
+            account=Account(account_id=row['account_id'], chat_id=row['chat_id'], account_name=row['account_name'],
+                            created_by=row['created_by'], created_at=_parse_datetime(row['created_at']),
+                            precision=row['precision']),
+            total_income=float(row['income']),
+            total_expenses=float(row['expenses']),
+            current_balance=reconciled + row['income'] + row['expenses'],
+            transaction_count=row['transaction_count'],
+            last_transaction_date=_parse_datetime(row['last_transaction_date']),
+            reconciled_balance=reconciled,
+            last_reconciliation_date=_parse_datetime(row['reconciliation_date'])
+        ))
+
+    last_dates = [a.last_transaction_date for a in accounts if a.last_transaction_date]
+    return ChatSummary(
+        chat=chat,
+        total_income=sum(a.total_income for a in accounts),
+        total_expenses=sum(a.total_expenses for a in accounts),
+        current_balance=sum(a.current_balance for a in accounts),
+        account_count=len(accounts),
+        transaction_count=sum(a.transaction_count for a in accounts),
+        last_transaction_date=max(last_dates) if last_dates else None,
+        accounts=accounts
+    )
+
+def get_chat_summary(chat_id: int) -> ChatSummary:
+    """
+    Сводка по чату и его счетам. Результат кэшируется до следующего изменения данных чата:
+    проверка актуальности — один запрос версии из ledger_versions.
+    """
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        version = get_ledger_version(conn, chat_id)
+        cached = _summary_cache.get(chat_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        summary = _build_chat_summary(conn, chat_id)
+        _summary_cache.set(chat_id, (version, summary))
+        return summary
     finally:
         conn.close()
 
+def get_chat_financial_summary(chat_id: int) -> dict:
+    """Получить финансовую сводку по чату (словарь на основе get_chat_summary)"""
+    summary = get_chat_summary(chat_id)
+    return {
+        'total_balance': summary.current_balance,
+        'account_count': summary.account_count,
+        'transaction_count': summary.transaction_count,
+        'total_income': summary.total_income,
+        'total_expenses': summary.total_expenses,
+        'net_flow': summary.total_income + summary.total_expenses
+    }
+
 def revert_transaction(transaction_id: int, reverted_by: int = None,
                       revert_comment: str = None) -> None:
     """Отменить операцию (откат)"""
@@ -371,4 +627,193 @@ def revert_transaction(transaction_id: int, reverted_by: int = None,
         )
         conn.commit()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def _account_balance_info(conn, account_id: int) -> dict | None:
+    """Название, точность и текущий баланс счета на открытом соединении"""
+    account = conn.execute(
+        "SELECT account_name, precision FROM accounts WHERE account_id = ?", (account_id,)
+    ).fetchone()
+    if not account:
+        return None
+    return {
+        'account_id': account_id,
+        'account_name': account['account_name'],
+        'precision': account['precision'],
+        'balance': _calculate_account_balance(conn, account_id)
+    }
+
+def _ids_renumbered_since(conn, chat_id: int, button_date: datetime | None) -> bool:
+    """
+    Назначены ли ID операций чата заново (перенос в кластере) не раньше создания
+    кнопки: такая кнопка указывает на другие операции
+    """
+    if button_date is None:
+        return False
+    if button_date.tzinfo is not None:
+        button_date = button_date.astimezone(timezone.utc)
+    return conn.execute(
+        "SELECT 1 FROM chat_moves WHERE chat_id = ? AND ids_renumbered_at >= ?",
+        (chat_id, button_date.strftime('%Y-%m-%d %H:%M:%S'))
+    ).fetchone() is not None
+
+def revert_transaction_batch(first_id: int, last_id: int, chat_id: int, reverted_by: int = None,
+                             revert_comment: str = None, button_date: datetime = None) -> dict:
+    """
+    Отменить все операции из диапазона ID, созданные одним сообщением.
+
+    Откатываются только неотмененные операции этого чата, созданные тем же пользователем.
+    Возвращает количество отмененных операций и новые балансы затронутых счетов;
+    outdated — кнопка создана до переноса чата с новыми ID, ничего не отменено.
+    """
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if _ids_renumbered_since(conn, chat_id, button_date):
+            conn.rollback()
+            return {'reverted_count': 0, 'balances': [], 'outdated': True}
+
+        condition = """transaction_id BETWEEN ? AND ? AND chat_id = ? AND is_reverted = 0
+            AND (created_by IS NULL OR created_by = ?)"""
+        params = (first_id, last_id, chat_id, reverted_by)
+
+        account_ids = [row['account_id'] for row in conn.execute(
+            f"SELECT DISTINCT account_id FROM transactions WHERE {condition}", params
+        ).fetchall()]
+
+        cursor = conn.execute(
+            f"""UPDATE transactions 
+            SET is_reverted = 1, 
+                revert_comment = ?,
+                reverted_by = ?,
+                reverted_at = CURRENT_TIMESTAMP
+            WHERE {condition}""",
+            (revert_comment, reverted_by) + params
+        )
+        reverted_count = cursor.rowcount
+
+        balances = []
+        for account_id in account_ids:
+            info = _account_balance_info(conn, account_id)
+            if info:
+                balances.append(info)
+
+        conn.commit()
+        return {'reverted_count': reverted_count, 'balances': balances, 'outdated': False}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def revert_transaction_atomic(transaction_id: int, chat_id: int, reverted_by: int = None,
+                              revert_comment: str = None, button_date: datetime = None) -> dict:
+    """
+    Атомарно отменить операцию чата и вернуть новый баланс счета.
+
+    Отмена выполняется условным UPDATE ... WHERE is_reverted = 0, поэтому
+    повторное нажатие кнопки не может отменить операцию дважды. Операция ищется
+    только в указанном чате. Кнопка, созданная (button_date) до переноса чата
+    с новыми ID, получает статус 'outdated'.
+
+    Returns:
+        {'status': 'reverted' | 'not_found' | 'forbidden' | 'already_reverted' | 'outdated',
+         'account_id', 'account_name', 'precision', 'balance'}
+    """
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if _ids_renumbered_since(conn, chat_id, button_date):
+            conn.rollback()
+            return {'status': 'outdated', 'account_id': None, 'account_name': None, 'precision': 2, 'balance': 0.0}
+
+        cursor = conn.execute(
+            """UPDATE transactions 
+            SET is_reverted = 1, 
+                revert_comment = ?,
+                reverted_by = ?,
+                reverted_at = CURRENT_TIMESTAMP
+            WHERE transaction_id = ? AND chat_id = ? AND is_reverted = 0
+                AND (created_by IS NULL OR created_by = ?)""",
+            (revert_comment, reverted_by, transaction_id, chat_id, reverted_by)
+        )
+
+        transaction = conn.execute(
+            "SELECT account_id, created_by, is_reverted FROM transactions WHERE transaction_id = ? AND chat_id = ?",
+            (transaction_id, chat_id)
+        ).fetchone()
+
+        if cursor.rowcount == 1:
+            status = 'reverted'
+        elif not transaction:
+            status = 'not_found'
+        elif transaction['created_by'] is not None and transaction['created_by'] != reverted_by:
+            status = 'forbidden'
+        else:
+            status = 'already_reverted'
+
+        result = {'status': status, 'account_id': None, 'account_name': None, 'precision': 2, 'balance': 0.0}
+        if transaction:
+            info = _account_balance_info(conn, transaction['account_id'])
+            if info:
+                result.update(info)
+
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def revert_last_transactions(chat_id: int, user_id: int, count: int,
+                             revert_comment: str = None) -> dict:
+    """
+    Отменить последние count активных операций пользователя в чате одной транзакцией.
+
+    Returns:
+        {'reverted': [{'transaction_id', 'account_id', 'amount', 'comment'}], 'balances': [...]}
+    """
+    conn = get_db_connection(chat_id=chat_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            """SELECT transaction_id, account_id, amount, comment
+            FROM transactions
+            WHERE chat_id = ? AND created_by = ? AND is_reverted = 0 AND is_archived = 0
+            ORDER BY transaction_id DESC
+            LIMIT ?""",
+            (chat_id, user_id, count)
+        ).fetchall()
+        reverted = [dict(row) for row in rows]
+
+        if reverted:
+            placeholders = ', '.join('?' * len(reverted))
+            conn.execute(
+                f"""UPDATE transactions 
+                SET is_reverted = 1, 
+                    revert_comment = ?,
+                    reverted_by = ?,
+                    reverted_at = CURRENT_TIMESTAMP
+                WHERE transaction_id IN ({placeholders}) AND is_reverted = 0""",
+                [revert_comment, user_id] + [t['transaction_id'] for t in reverted]
+            )
+
+        balances = []
+        for account_id in dict.fromkeys(t['account_id'] for t in reverted):
+            info = _account_balance_info(conn, account_id)
+            if info:
+                balances.append(info)
+
+        conn.commit()
+        return {'reverted': reverted, 'balances': balances}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# Гистограммы времени выполнения для всех публичных функций модуля
+from utils.metrics import instrument_functions
+instrument_functions(globals(), 'crud')
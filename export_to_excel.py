@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from crud import get_user_accounts, get_account_transactions, get_account_balance, get_account, \
     get_account_reconciliations
 from utils.logger import logger
+from utils.metrics import timed
 import sqlite3
 from core import get_db_connection
 
@@ -274,6 +275,7 @@ def get_accounts_export_data(chat_id, user_id, include_archived=True):
         return []
 
 
+@timed('handler')
 def handle_export_command(chat_id, user_id, export_type="full"):
     """Основная функция обработки экспорта"""
     try:
@@ -2,7 +2,9 @@
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
 from utils.logger import logger
-from crud import create_account, get_user_accounts, delete_account, create_user, ensure_chat_exists
+from utils.events import instrumented
+from crud import create_account, get_user_accounts, delete_account
+from utils.account_index import invalidate_account_index
 
 def get_main_keyboard():
     """Создает основную клавиатуру с кнопками"""
@@ -13,6 +15,7 @@ def get_main_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+@instrumented('account_add')
 async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /добавь с поддержкой username"""
     user = update.effective_user
@@ -21,9 +24,6 @@ async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     chat_type = update.effective_chat.type
     username = user.username or user.full_name  # Получаем username
 
-    # Убедимся, что чат существует
-    ensure_chat_exists(chat_id, chat_type, update.effective_chat.title)
-
     # Получаем весь текст после команды
     if update.message.text:
         command_parts = update.message.text.split()
@@ -78,11 +78,9 @@ async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE
                 )
                 return
 
-        # Создаем пользователя если его нет
-        create_user(user_id, username)
-
         # Создаем счет с указанной разрядностью И USERNAME
         account_id = create_account(chat_id, account_name, user_id, username, precision)
+        invalidate_account_index(chat_id)
 
         logger.info(f"Создан счет '{account_name}' (ID: {account_id}) пользователем {username} в чате {chat_id}")
 
@@ -102,6 +100,7 @@ async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 
+@instrumented('account_delete')
 async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /удали"""
     user = update.effective_user
@@ -110,9 +109,6 @@ async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_T
     chat_type = update.effective_chat.type
     username = user.username or user.full_name
 
-    # Убедимся, что чат существует
-    ensure_chat_exists(chat_id, chat_type, update.effective_chat.title)
-
     if update.message.text:
         command_parts = update.message.text.split()
         if len(command_parts) > 1:
@@ -156,6 +152,7 @@ async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_T
             return
 
         delete_account(account_to_delete['account_id'])
+        invalidate_account_index(chat_id)
         logger.info(f"Удален счет '{account_name}' (ID: {account_to_delete['account_id']}) пользователем {username}")
 
         await update.message.reply_text(
@@ -171,6 +168,7 @@ async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_T
         )
 
 
+@instrumented('accounts_list')
 async def list_accounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /счета с отображением username создателей"""
     user = update.effective_user
@@ -178,9 +176,6 @@ async def list_accounts_command(update: Update, context: ContextTypes.DEFAULT_TY
     chat_id = update.effective_chat.id
     chat_type = update.effective_chat.type
 
-    # Убедимся, что чат существует
-    ensure_chat_exists(chat_id, chat_type, update.effective_chat.title)
-
     logger.info(f"Пользователь {user_id} запросил счета в чате {chat_id}")
 
     try:
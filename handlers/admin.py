@@ -0,0 +1,190 @@
+# admin.py - административные команды (/admin ...)
+import asyncio
+import io
+from datetime import datetime
+from telegram import Update
+from telegram.ext import ContextTypes
+from utils.logger import logger
+from utils.events import instrumented
+from config import ADMIN_USER_IDS, BACKUP_DIR, BACKUP_KEEP, \
+    RETENTION_REVERTED_DAYS, RETENTION_KEEP_RECONCILIATIONS, RETENTION_BATCH_SIZE, VERIFY_WORKERS
+from backup import backup_all
+from utils.metrics import metrics
+from utils.outbox import outbox
+from utils.sampling_profiler import SamplingProfiler, MAX_DURATION, acquire_session, release_session
+from maintenance import run_retention_all
+from verify import verify_all
+from crud import get_global_stats
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_USER_IDS
+
+
+async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin backup — внеплановая резервная копия"""
+    await update.message.reply_text("💾 Создаю резервную копию...")
+    results = await asyncio.to_thread(backup_all, BACKUP_DIR, BACKUP_KEEP)
+
+    if not results:
+        await update.message.reply_text("❌ Нет файлов БД для копирования.")
+        return
+
+    lines = [f"• {item['archive']} ({item['size'] / 1024:.0f} КБ, {item['seconds']:.1f} с)" for item in results]
+    await update.message.reply_text("✅ Резервная копия создана:\n" + "\n".join(lines))
+
+
+async def admin_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin verify — сверить текущие балансы с пересчетом по выписке"""
+    await update.message.reply_text("🔎 Проверяю балансы всех счетов...")
+    report = await asyncio.to_thread(verify_all, VERIFY_WORKERS)
+
+    response = (
+        f"Проверено счетов: {report['accounts']}, строк: {report['rows']} "
+        f"за {report['seconds']:.1f} с\n"
+    )
+    if not report['mismatches']:
+        await update.message.reply_text(response + "✅ Расхождений нет")
+        return
+
+    response += f"❌ Расхождений: {len(report['mismatches'])}\n"
+    for item in report['mismatches'][:20]:
+        response += (f"• {item['account_name']} (чат {item['chat_id']}): "
+                     f"{item['live']} ≠ {item['recomputed']}\n")
+    if len(report['mismatches']) > 20:
+        response += "…полный список в логе"
+    await update.message.reply_text(response)
+
+
+def format_latency_table(rows: list[dict], limit: int) -> str:
+    lines = []
+    for row in rows[:limit]:
+        errors = f", ошибок {row['errors']}" if row['errors'] else ""
+        lines.append(
+            f"• {row['name']}: {row['count']} шт{errors}\n"
+            f"   p50 {row['p50']:.1f} / p95 {row['p95']:.1f} / p99 {row['p99']:.1f} мс"
+        )
+    return "\n".join(lines) if lines else "нет данных"
+
+
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin stats — объем данных, задержки обработчиков и функций crud, очередь обновлений, отправка"""
+    data = await asyncio.to_thread(get_global_stats)
+    response = (
+        f"🗃 Данные: чатов {data['chats']}, счетов {data['accounts']}, "
+        f"операций {data['transactions']}, сверок {data['reconciliations']} (файлов БД: {data['shards']})\n\n"
+    )
+    response += "📈 Обработчики:\n" + format_latency_table(metrics.summary('handler'), 15)
+    response += "\n\n🗄 Самые медленные функции crud:\n" + format_latency_table(metrics.summary('crud'), 10)
+
+    processor = context.application.update_processor
+    if hasattr(processor, 'get_stats'):
+        stats = processor.get_stats()
+        response += (
+            f"\n\n📥 Обновления: в работе {stats['in_progress']}/{stats['max_workers']}, "
+            f"в очереди {stats['queued_updates']}, обработано {stats['processed']}"
+        )
+
+    outbox_stats = outbox.get_stats()
+    response += (
+        f"\n📤 Отправка: вызовов API {outbox_stats['api_calls']}, "
+        f"объединено подтверждений {outbox_stats['coalesced_confirmations']}"
+    )
+    await update.message.reply_text(response)
+
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin profile [секунды] — профилирование всех потоков и отправка свернутых стеков"""
+    try:
+        seconds = int(context.args[1]) if len(context.args) > 1 else 10
+    except ValueError:
+        await update.message.reply_text("❌ Укажите длительность в секундах, например: /admin profile 15")
+        return
+    seconds = max(1, min(seconds, MAX_DURATION))
+
+    if not acquire_session():
+        await update.message.reply_text("⏳ Профилирование уже выполняется.")
+        return
+
+    try:
+        await update.message.reply_text(f"🔬 Профилирую {seconds} с...")
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    finally:
+        release_session()
+
+    response = f"🔬 Снято сэмплов: {profiler.samples}\nСамые горячие функции (свое / всего):\n"
+    for item in profiler.top_functions(15):
+        response += f"• {item['function']} — {item['own']} / {item['total']}\n"
+    await update.message.reply_text(response.strip())
+
+    filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    await update.message.reply_document(
+        document=io.BytesIO(profiler.collapsed().encode('utf-8')),
+        filename=filename,
+        caption="Свернутые стеки для flamegraph.pl / speedscope.app"
+    )
+
+
+ADMIN_SUBCOMMANDS = {
+    'backup': admin_backup,
+    'verify': admin_verify,
+    'stats': admin_stats,
+    'profile': admin_profile,
+}
+
+
+@instrumented('admin')
+async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /admin <подкоманда>"""
+    user_id = update.effective_user.id
+
+    if not is_admin(user_id):
+        logger.warning(f"Пользователь {user_id} попытался выполнить /admin без прав")
+        await update.message.reply_text("❌ Команда доступна только администраторам.")
+        return
+
+    subcommand = context.args[0].lower() if context.args else None
+    handler = ADMIN_SUBCOMMANDS.get(subcommand)
+    if not handler:
+        await update.message.reply_text(
+            "🛠 Команды администратора:\n" + "\n".join(f"/admin {name}" for name in ADMIN_SUBCOMMANDS)
+        )
+        return
+
+    logger.info(f"Администратор {user_id} выполняет /admin {subcommand}")
+    try:
+        await handler(update, context)
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении /admin {subcommand}: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
+
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    """Плановое резервное копирование (JobQueue)"""
+    try:
+        await asyncio.to_thread(backup_all, BACKUP_DIR, BACKUP_KEEP)
+    except Exception as e:
+        logger.error(f"Ошибка планового резервного копирования: {e}", exc_info=True)
+
+
+async def maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    """Плановая очистка отмененных операций и сворачивание архива (JobQueue)"""
+    try:
+        await asyncio.to_thread(
+            run_retention_all, RETENTION_REVERTED_DAYS, RETENTION_KEEP_RECONCILIATIONS, RETENTION_BATCH_SIZE
+        )
+    except Exception as e:
+        logger.error(f"Ошибка планового обслуживания БД: {e}", exc_info=True)
+
+
+async def verify_job(context: ContextTypes.DEFAULT_TYPE):
+    """Плановая проверка балансов (JobQueue); расхождения пишутся в лог"""
+    try:
+        await asyncio.to_thread(verify_all, VERIFY_WORKERS)
+    except Exception as e:
+        logger.error(f"Ошибка плановой проверки балансов: {e}", exc_info=True)
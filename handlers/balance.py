@@ -2,7 +2,8 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
 from utils.logger import logger
-from crud import get_user_accounts, get_account_transactions, get_account_balance, ensure_chat_exists, get_account
+from utils.events import instrumented
+from crud import get_user_accounts, get_account_transactions, get_account_balance, get_account
 import os
 
 
@@ -14,6 +15,7 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+@instrumented('balance')
 async def show_balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /дай с улучшенной обработкой ошибок"""
     user = update.effective_user
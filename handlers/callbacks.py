@@ -3,12 +3,19 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from telegram.error import TimedOut, NetworkError
 from utils.logger import logger
-from crud import revert_transaction, get_transaction, get_account, get_account_transactions, get_account_balance
+from utils.events import instrumented, annotate_event
+from utils.outbox import outbox
+from crud import revert_transaction_atomic, revert_transaction_batch
 from export_to_excel import handle_export_command, cleanup_old_exports
+from handlers.search import handle_search_callback
 import asyncio
 import os
 
+# Кнопка отката создана до переноса чата, при котором ID операций назначены заново
+OUTDATED_BUTTON_TEXT = "⌛ Кнопка устарела: данные чата были перенесены. Используйте /отмена"
 
+
+@instrumented('callback')
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на inline-кнопки"""
     query = update.callback_query
@@ -24,14 +31,20 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = query.message.chat_id
 
     logger.info(f"Пользователь {user_id} нажал кнопку: {data}")
+    annotate_event(action=data.split("_")[0])
 
-    if data.startswith("cancel_"):
+    if data.startswith("cancel_batch_"):
+        _, _, first_id, last_id = data.split("_")
+        await handle_batch_cancel(query, int(first_id), int(last_id), user_id, chat_id)
+    elif data.startswith("cancel_"):
         transaction_id = int(data.split("_")[1])
-        await handle_transaction_cancel(query, transaction_id, user_id)
+        await handle_transaction_cancel(query, transaction_id, user_id, chat_id)
     elif data.startswith("export_"):
         await handle_export_callback(query, data, user_id, chat_id, context)
     elif data.startswith("reconcile_"):
         await handle_reconciliation_callback(update, context)
+    elif data.startswith("search_"):
+        await handle_search_callback(query, data, chat_id, context)
     else:
         try:
             await query.edit_message_text("[ОШИБКА] Неизвестная команда")
@@ -57,8 +70,8 @@ async def handle_export_callback(query, data: str, user_id: int, chat_id: int, c
             await query.edit_message_text("❌ Неизвестный тип экспорта")
             return
 
-        # Вызываем функцию экспорта
-        success, file_path, message = handle_export_command(chat_id, user_id, export_type)
+        # Вызываем функцию экспорта в отдельном потоке, чтобы не задерживать другие чаты
+        success, file_path, message = await asyncio.to_thread(handle_export_command, chat_id, user_id, export_type)
 
         if success and file_path and os.path.exists(file_path):
             # Отправляем файл пользователю
@@ -87,38 +100,45 @@ async def handle_export_callback(query, data: str, user_id: int, chat_id: int, c
             pass
 
 
-async def handle_transaction_cancel(query, transaction_id: int, user_id: int):
-    """Обработка отката транзакции с ПРАВИЛЬНОЙ проверкой прав"""
+async def handle_transaction_cancel(query, transaction_id: int, user_id: int, chat_id: int):
+    """Обработка отката транзакции: проверка прав, отмена и новый баланс в одной транзакции БД"""
     try:
-        # Получаем транзакцию
-        transaction = get_transaction(transaction_id)
-        if not transaction:
+        result = revert_transaction_atomic(transaction_id, chat_id, user_id, "Откат пользователем",
+                                           button_date=query.message.date)
+
+        if result['status'] == 'outdated':
+            await safe_edit_message(query, OUTDATED_BUTTON_TEXT)
+            return
+        if result['status'] == 'not_found':
             await safe_edit_message(query, "❌ Транзакция не найдена")
             return
-
-        # Проверяем права
-        if transaction.get('created_by') is not None and transaction['created_by'] != user_id:
+        if result['status'] == 'forbidden':
             await safe_edit_message(query, "❌ Недостаточно прав для отката этой операции")
             return
-
-        # Проверяем, не отменена ли уже транзакция
-        if transaction.get('is_reverted'):
+        if result['status'] == 'already_reverted':
             await safe_edit_message(query, "❌ Эта операция уже откачена")
             return
-
-        # Отменяем транзакцию (откат)
-        revert_transaction(transaction_id, user_id, "Откат пользователем")
-
-        # Получаем счёт для отображения баланса
-        account = get_account(transaction['account_id'])
-        if not account:
+        if not result['account_name']:
             await safe_edit_message(query, "❌ Счет не найден")
             return
 
-        # Используем единую функцию расчёта баланса
-        balance = get_account_balance(account['account_id'])
-        precision = account.get('precision', 2)
-        balance_str = f"{balance:.{precision}f}"
+        balance_str = f"{result['balance']:.{result['precision']}f}"
+
+        # Больше не дописываем новые подтверждения в это сообщение
+        outbox.forget_message(query.message.chat_id, query.message.message_id)
+
+        # В объединенном подтверждении оставляем кнопки остальных операций
+        remaining_buttons = []
+        if query.message.reply_markup:
+            remaining_buttons = [
+                row for row in query.message.reply_markup.inline_keyboard
+                if not any(button.callback_data == query.data for button in row)
+            ]
+        if remaining_buttons:
+            new_text = f"{query.message.text}\n❌ ОТКАТАНО. 💳 Новый баланс: {balance_str} {result['account_name']}"
+            await safe_edit_message(query, new_text, reply_markup=InlineKeyboardMarkup(remaining_buttons))
+            logger.info(f"Пользователь {user_id} откатил транзакцию {transaction_id}")
+            return
 
         # Формируем сообщение
         original_text = query.message.text
@@ -127,7 +147,7 @@ async def handle_transaction_cancel(query, transaction_id: int, user_id: int):
             lines = lines[1:]
             original_text = '\n'.join(lines).strip()
 
-        new_text = f"❌ ОТКАТАНО\n{original_text}\n💳 Новый баланс: {balance_str} {account['account_name']}"
+        new_text = f"❌ ОТКАТАНО\n{original_text}\n💳 Новый баланс: {balance_str} {result['account_name']}"
 
         await safe_edit_message(query, new_text, reply_markup=None)
         logger.info(f"Пользователь {user_id} откатил транзакцию {transaction_id}")
@@ -137,6 +157,34 @@ async def handle_transaction_cancel(query, transaction_id: int, user_id: int):
         await safe_edit_message(query, "❌ Произошла ошибка при откате операции.")
 
 
+async def handle_batch_cancel(query, first_id: int, last_id: int, user_id: int, chat_id: int):
+    """Откат всех операций, добавленных одним сообщением"""
+    try:
+        result = revert_transaction_batch(first_id, last_id, chat_id, user_id, "Откат пользователем",
+                                          button_date=query.message.date)
+
+        if result['outdated']:
+            await safe_edit_message(query, OUTDATED_BUTTON_TEXT)
+            return
+        if result['reverted_count'] == 0:
+            await safe_edit_message(query, "❌ Нет операций для отката (уже откачены или недостаточно прав)")
+            return
+
+        original_text = query.message.text
+        balance_lines = [
+            f"💳 Новый баланс: {item['balance']:.{item['precision']}f} {item['account_name']}"
+            for item in result['balances']
+        ]
+        new_text = f"❌ ОТКАТАНО ({result['reverted_count']})\n{original_text}\n" + "\n".join(balance_lines)
+
+        await safe_edit_message(query, new_text, reply_markup=None)
+        logger.info(f"Пользователь {user_id} откатил операции {first_id}-{last_id} ({result['reverted_count']} шт.)")
+
+    except Exception as e:
+        logger.error(f"Ошибка при откате операций {first_id}-{last_id} пользователем {user_id}: {e}")
+        await safe_edit_message(query, "❌ Произошла ошибка при откате операций.")
+
+
 async def handle_reconciliation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback'ов для сверки"""
     from handlers.reconciliation import handle_reconciliation_callback as reconcile_handler
@@ -0,0 +1,127 @@
+# middleware.py - обработчики, выполняемые до основных хендлеров
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler, ApplicationHandlerStop
+from utils.logger import logger
+from utils.cache import LRUSet
+from crud import mark_update_processed, prune_processed_updates, upsert_identity
+from core import bind_chat
+from handlers.router import is_routable_text
+
+# Группы с отрицательным номером выполняются раньше обработчиков группы 0.
+# В каждой группе срабатывает только первый подходящий обработчик,
+# поэтому каждому middleware нужна своя группа.
+SHARD_GROUP = -3
+DEDUP_GROUP = -2
+IDENTITY_GROUP = -1
+
+# Быстрый фильтр недавно обработанных ключей в памяти
+recent_update_keys = LRUSet(maxsize=10000)
+PRUNE_EVERY = 1000
+PROCESSED_UPDATES_KEEP_HOURS = 48
+_processed_since_prune = 0
+
+# Уже сохраненные в БД чаты, пользователи и участники чатов.
+# Ключ включает название/username, поэтому изменения сохраняются сразу,
+# а ttl периодически обновляет записи, вытесненные из других процессов.
+IDENTITY_REFRESH_SECONDS = 3600
+seen_chats = LRUSet(maxsize=20000, ttl=IDENTITY_REFRESH_SECONDS)
+seen_users = LRUSet(maxsize=50000, ttl=IDENTITY_REFRESH_SECONDS)
+seen_members = LRUSet(maxsize=100000, ttl=IDENTITY_REFRESH_SECONDS)
+
+
+async def bind_chat_shard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Привязывает обработку обновления к шарду БД его чата"""
+    bind_chat(update.effective_chat.id if update.effective_chat else None)
+
+
+def is_handled_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Дойдет ли обновление до обработчика: кнопки — всегда, сообщения — по маршрутизатору"""
+    message = update.message or update.edited_message
+    if message and not update.callback_query:
+        return is_routable_text(message.text, message.chat_id, context.bot.username)
+    return True
+
+
+def get_update_key(update: Update) -> str:
+    """Ключ идемпотентности обновления"""
+    if update.callback_query:
+        return f"c:{update.callback_query.id}"
+    if update.message:
+        return f"m:{update.message.chat_id}:{update.message.message_id}"
+    if update.edited_message:
+        # Каждая правка — отдельное обновление: в ключ входит время правки
+        edited = update.edited_message
+        edit_date = int(edited.edit_date.timestamp()) if edited.edit_date else update.update_id
+        return f"e:{edited.chat_id}:{edited.message_id}:{edit_date}"
+    return f"u:{update.update_id}"
+
+
+async def drop_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отбрасывает повторно доставленные обновления до любых вычислений и записи в БД"""
+    global _processed_since_prune
+
+    # Переписка и чужие команды не обрабатываются — не тратим на них запись в БД
+    if not is_handled_update(update, context):
+        return
+
+    update_key = get_update_key(update)
+
+    if update_key in recent_update_keys:
+        logger.warning(f"Повторное обновление {update_key} отброшено")
+        raise ApplicationHandlerStop
+
+    recent_update_keys.add(update_key)
+
+    if not mark_update_processed(update_key):
+        logger.warning(f"Повторное обновление {update_key} отброшено (найдено в БД)")
+        raise ApplicationHandlerStop
+
+    # Периодически чистим таблицу ключей
+    _processed_since_prune += 1
+    if _processed_since_prune >= PRUNE_EVERY:
+        _processed_since_prune = 0
+        removed = prune_processed_updates(PROCESSED_UPDATES_KEEP_HOURS)
+        logger.info(f"Удалено старых ключей обработанных обновлений: {removed}")
+
+
+async def register_identity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сохраняет чат, пользователя и членство в чате один раз, пока они не изменились"""
+    if not is_handled_update(update, context):
+        return
+
+    chat = update.effective_chat
+    user = update.effective_user
+    if not chat:
+        return
+
+    chat_key = (chat.id, chat.type, chat.title)
+    chat_row = None if chat_key in seen_chats else chat_key
+
+    user_row = member_row = None
+    if user:
+        username = user.username or user.full_name
+        user_key = (user.id, username)
+        user_row = None if user_key in seen_users else user_key
+        member_key = (chat.id, user.id)
+        member_row = None if member_key in seen_members else member_key
+
+    if not (chat_row or user_row or member_row):
+        return
+
+    upsert_identity(chat_row, user_row, member_row)
+
+    if chat_row:
+        seen_chats.add(chat_key)
+    if user_row:
+        seen_users.add(user_row)
+    if member_row:
+        seen_members.add(member_row)
+
+
+def get_middleware_handlers():
+    """Возвращает пары (обработчик, группа) для middleware"""
+    return [
+        (TypeHandler(Update, bind_chat_shard), SHARD_GROUP),
+        (TypeHandler(Update, drop_duplicate_updates), DEDUP_GROUP),
+        (TypeHandler(Update, register_identity), IDENTITY_GROUP),
+    ]
@@ -1,10 +1,14 @@
 # operations.py - ОБНОВЛЕННАЯ ВЕРСИЯ С USERNAME
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
-from telegram.error import TimedOut, NetworkError
+from telegram.error import TimedOut
 from utils.logger import logger
-from crud import get_user_accounts, create_transaction, get_account_transactions, get_account_balance, ensure_chat_exists
-from calc import def_calc
+from utils.events import instrumented, annotate_event
+from utils.outbox import outbox
+from crud import get_user_accounts, create_transaction, get_account_transactions, get_account_balance, \
+    create_transactions_batch, revert_last_transactions
+from calc import def_calc, def_calc_bounded, calculate_many
+from config import CALC_USE_WORKER, CALC_TIMEOUT
 from datetime import datetime
 import asyncio
 
@@ -18,6 +22,187 @@ def get_main_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+MAX_BATCH_OPERATIONS = 50
+MAX_UNDO_OPERATIONS = 20
+
+
+def find_operation_account(command_text: str, accounts: list[dict]):
+    """
+    Найти счет, к которому относится операция.
+
+    Returns:
+        (счет, текст после названия счета) или (None, "")
+    """
+    # Сортируем счета по длине названия (от длинного к короткому)
+    accounts_sorted = sorted(accounts, key=lambda x: len(x['account_name']), reverse=True)
+    command_text_lower = command_text.lower()
+
+    # Проверяем, начинается ли команда с названия счета
+    for account in accounts_sorted:
+        if command_text_lower.startswith(account['account_name'].lower() + ' '):
+            return account, command_text[len(account['account_name']):].strip()
+
+    # Если не нашли длинное совпадение, пробуем найти по первому слову
+    words = command_text.split()
+    first_word = words[0].lower() if words else ""
+    for account in accounts:
+        account_words = account['account_name'].split()
+        account_first_word = account_words[0].lower() if account_words else ""
+        if account_first_word == first_word:
+            return account, ' '.join(words[1:])
+
+    return None, ""
+
+
+def split_expression_and_comment(remaining_text: str):
+    """Разделить текст операции на выражение и комментарий"""
+    parts = remaining_text.split(maxsplit=1)
+    expression = parts[0].strip() if parts else ""
+    comment = parts[1].strip() if len(parts) > 1 else ""
+    return expression, comment
+
+
+def split_operation_lines(text: str) -> list[str]:
+    """
+    Разбить сообщение на строки-операции.
+
+    Каждая строка, начинающаяся с /, — отдельная операция (без /).
+    Строки без / дописываются к комментарию предыдущей операции.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('/'):
+            lines.append(line[1:].strip())
+        elif lines:
+            lines[-1] += ' ' + line
+    return lines
+
+
+def format_amount(amount: float, precision: int) -> str:
+    """Форматировать сумму операции со знаком"""
+    return f"+{amount:.{precision}f}" if amount >= 0 else f"{amount:.{precision}f}"
+
+
+async def send_without_undo_button(update: Update, text: str, error: Exception):
+    """Подтверждение без кнопки отката, если отправка через outbox не удалась"""
+    annotate_event(outcome='send_failed')
+    if isinstance(error, TimedOut):
+        # Подтверждение могло дойти — второе сообщение не отправляем
+        logger.warning(f"Таймаут отправки подтверждения, доставка неизвестна: {error}")
+        return
+    logger.warning(f"Не удалось отправить подтверждение с кнопкой отката: {error}")
+    try:
+        await update.message.reply_text(
+            text + "\n\n⚠️ Кнопка отката временно недоступна, используйте /откати",
+            reply_markup=get_main_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"Не удалось отправить подтверждение операции: {e}")
+
+
+async def handle_multi_operation(update: Update, context: ContextTypes.DEFAULT_TYPE, accounts: list[dict],
+                                 operation_lines: list[str]):
+    """Обработка нескольких операций из одного сообщения одной транзакцией БД"""
+    user = update.effective_user
+    user_id = user.id
+    username = user.username or user.full_name
+    chat_id = update.effective_chat.id
+    chat_type = update.effective_chat.type
+
+    if len(operation_lines) > MAX_BATCH_OPERATIONS:
+        await update.message.reply_text(
+            f"❌ Слишком много операций в одном сообщении (максимум {MAX_BATCH_OPERATIONS}).",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    # Определяем счет, выражение и комментарий для каждой строки
+    parsed = []
+    errors = []
+    for line_number, line in enumerate(operation_lines, 1):
+        account, remaining_text = find_operation_account(line, accounts)
+        if not account:
+            errors.append(f"{line_number}. /{line} — счет не найден")
+            continue
+        expression, comment = split_expression_and_comment(remaining_text)
+        if not expression:
+            errors.append(f"{line_number}. /{line} — не указана сумма")
+            continue
+        parsed.append((line_number, line, account, expression, comment))
+
+    # Вычисляем все суммы одним пакетом
+    results = calculate_many(
+        [expression for _, _, _, expression, _ in parsed],
+        [account['precision'] for _, _, account, _, _ in parsed]
+    )
+
+    operations = []
+    for (line_number, line, account, expression, comment), result in zip(parsed, results):
+        if result['error']:
+            errors.append(f"{line_number}. /{line} — {result['error']}")
+            continue
+        operations.append({
+            'account_id': account['account_id'],
+            'account': account,
+            'amount': float(result['result']),
+            'comment': comment
+        })
+
+    # Все или ничего: при ошибке в любой строке ничего не сохраняем
+    if errors:
+        annotate_event(outcome='invalid', operations=len(operation_lines))
+        await update.message.reply_text(
+            "❌ Операции не сохранены, исправьте строки:\n" + "\n".join(errors),
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    batch = create_transactions_batch(chat_id, operations, datetime.now(), user_id, username)
+    transaction_ids = batch['transaction_ids']
+    annotate_event(operations=len(operations))
+
+    logger.info(f"Пользователь {user_id} ({username}) добавил {len(operations)} операций одним сообщением")
+
+    response = f"✅ Запомнил {len(operations)} операций:\n"
+    touched_accounts = {}
+    for operation in operations:
+        account = operation['account']
+        touched_accounts[account['account_id']] = account
+        response += f"{format_amount(operation['amount'], account['precision'])} {account['account_name']}"
+        if operation['comment']:
+            response += f" 💬 {operation['comment']}"
+        response += "\n"
+
+    response += "\nБаланс:\n"
+    for account_id, account in touched_accounts.items():
+        response += f"{batch['balances'][account_id]:.{account['precision']}f} {account['account_name']}\n"
+
+    # В группах показываем кто добавил операции
+    if chat_type != "private":
+        response += f"👤 @{username}" if user.username else f"👤 {user.full_name}"
+
+    # Одна кнопка отката для всех операций сообщения
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Откатить все",
+                              callback_data=f"cancel_batch_{transaction_ids[0]}_{transaction_ids[-1]}")]
+    ])
+
+    is_group = chat_type != "private"
+    try:
+        await outbox.send_message(
+            context.bot, chat_id, response.strip(),
+            reply_markup=keyboard,
+            reply_to_message_id=update.message.message_id if is_group else None
+        )
+    except Exception as e:
+        # Операции уже сохранены — сообщение об ошибке добавления привело бы к повторной отправке
+        await send_without_undo_button(update, response.strip(), e)
+
+
+@instrumented('operation')
 async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик финансовых операций с поддержкой username"""
     user = update.effective_user
@@ -26,9 +211,6 @@ async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     chat_type = update.effective_chat.type
 
-    # Убедимся, что чат существует
-    ensure_chat_exists(chat_id, chat_type, update.effective_chat.title)
-
     if not update.message.text:
         return
 
@@ -42,46 +224,24 @@ async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Если нет счетов, это не операция
             return
 
-        # Сортируем счета по длине названия (от длинного к короткому)
-        accounts_sorted = sorted(accounts, key=lambda x: len(x['account_name']), reverse=True)
-
-        target_account = None
-        expression = ""
-        comment = ""
-
-        # Ищем подходящий счет
-        for account in accounts_sorted:
-            account_name_lower = account['account_name'].lower()
-            command_text_lower = command_text.lower()
+        # Несколько операций в одном сообщении обрабатываем отдельно
+        operation_lines = split_operation_lines(update.message.text)
+        if len(operation_lines) > 1:
+            await handle_multi_operation(update, context, accounts, operation_lines)
+            return
 
-            # Проверяем, начинается ли команда с названия счета
-            if command_text_lower.startswith(account_name_lower + ' '):
-                target_account = account
-                remaining_text = command_text[len(account['account_name']):].strip()
-                break
-
-        # Если не нашли длинное совпадение, пробуем найти по первому слову
-        if not target_account:
-            first_word = command_text.split()[0].lower() if command_text.split() else ""
-            for account in accounts:
-                account_first_word = account['account_name'].split()[0].lower() if account['account_name'].split() else ""
-                if account_first_word == first_word:
-                    target_account = account
-                    remaining_text = ' '.join(command_text.split()[1:])
-                    break
+        target_account, remaining_text = find_operation_account(command_text, accounts)
 
         if not target_account:
             # Если это не операция, а неизвестная команда - игнорируем
             return
 
+        annotate_event(account_id=target_account['account_id'])
+
         # Разбираем оставшийся текст на выражение и комментарий
-        parts = remaining_text.split(maxsplit=1)
-        if len(parts) >= 1:
-            expression = parts[0].strip()
-            if len(parts) > 1:
-                comment = parts[1].strip()
+        expression, comment = split_expression_and_comment(remaining_text)
 
-        logger.info(f"Пользователь {user_id} ({username}) добавляет операцию: {target_account['account_name']} {expression} {comment}")
+        logger.debug(f"Пользователь {user_id} ({username}) добавляет операцию: {target_account['account_name']} {expression} {comment}")
 
         # Проверяем выражение
         if not expression:
@@ -94,11 +254,16 @@ async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # Вычисляем сумму с помощью калькулятора Кати с учетом разрядности счета
-        logger.info(f"Вычисляем выражение: {expression} с разрядностью {target_account['precision']}")
-        result = def_calc(expression, target_account['precision'])
-        logger.info(f"Результат вычисления: {result}")
+        logger.debug(f"Вычисляем выражение: {expression} с разрядностью {target_account['precision']}")
+        if CALC_USE_WORKER:
+            # Вычисляем в отдельном процессе, чтобы не блокировать event loop
+            result = await asyncio.to_thread(def_calc_bounded, expression, target_account['precision'], CALC_TIMEOUT)
+        else:
+            result = def_calc(expression, target_account['precision'])
+        logger.debug(f"Результат вычисления: {result}")
 
         if "Ошибка" in result:
+            annotate_event(outcome='calc_error')
             await update.message.reply_text(
                 f"❌ {result}",
                 reply_markup=get_main_keyboard()
@@ -132,7 +297,7 @@ async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Пользователь {user_id} ({username}) добавил операцию: {target_account['account_name']} {amount}")
 
         # Форматируем ответ с учетом разрядности
-        amount_str = f"+{amount:.{target_account['precision']}f}" if amount >= 0 else f"{amount:.{target_account['precision']}f}"
+        amount_str = format_amount(amount, target_account['precision'])
         balance_str = f"{balance:.{target_account['precision']}f}"
 
         response = f"✅ Запомнил. {amount_str}\n"
@@ -145,30 +310,80 @@ async def handle_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if chat_type != "private":
             response += f"\n👤 @{username}" if user.username else f"\n👤 {user.full_name}"
 
-        # Создаем кнопку "Откатить"
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("❌ Откатить", callback_data=f"cancel_{transaction_id}")]
-        ])
-
-        # Пытаемся отправить с кнопкой, при ошибке - без кнопки
+        # Кнопка "Откатить"; частые подтверждения объединяются в одно сообщение
+        button = InlineKeyboardButton(f"❌ Откатить {amount_str} {target_account['account_name']}",
+                                      callback_data=f"cancel_{transaction_id}")
+        is_group = chat_type != "private"
         try:
-            await update.message.reply_text(response, reply_markup=keyboard)
-        except (TimedOut, NetworkError) as e:
-            logger.warning(f"Таймаут при отправке кнопки, отправляем без кнопки: {e}")
-            await update.message.reply_text(
-                response + "\n\n⚠️ Кнопка отката временно недоступна",
-                reply_markup=get_main_keyboard()
+            await outbox.send_confirmation(
+                context.bot, chat_id, user_id, response, button,
+                reply_to_message_id=update.message.message_id if is_group else None
             )
         except Exception as e:
-            logger.error(f"Ошибка при отправке кнопки: {e}")
+            # Операция уже сохранена — сообщение об ошибке добавления привело бы к повторной отправке
+            await send_without_undo_button(update, response, e)
+
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении операции для пользователя {user_id} ({username}): {e}", exc_info=True)
+        annotate_event(outcome='error')
+        await update.message.reply_text(
+            "❌ Произошла ошибка при добавлении операции.",
+            reply_markup=get_main_keyboard()
+        )
+
+
+@instrumented('undo')
+async def undo_last_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /откати [N] — отмена последних N операций пользователя"""
+    user = update.effective_user
+    user_id = user.id
+    chat_id = update.effective_chat.id
+
+    command_parts = update.message.text.split()
+    count = 1
+    if len(command_parts) > 1:
+        try:
+            count = int(command_parts[1])
+        except ValueError:
+            count = 0
+    if count < 1 or count > MAX_UNDO_OPERATIONS:
+        await update.message.reply_text(
+            f"❌ Укажите количество операций от 1 до {MAX_UNDO_OPERATIONS}. Например: `/откати 3`",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    try:
+        result = revert_last_transactions(chat_id, user_id, count, "Массовый откат пользователем")
+
+        if not result['reverted']:
             await update.message.reply_text(
-                response,
+                "❌ Нет активных операций для отката.",
                 reply_markup=get_main_keyboard()
             )
+            return
+
+        precisions = {b['account_id']: b['precision'] for b in result['balances']}
+        names = {b['account_id']: b['account_name'] for b in result['balances']}
+
+        response = f"❌ ОТКАТАНО операций: {len(result['reverted'])}\n"
+        for t in result['reverted']:
+            precision = precisions.get(t['account_id'], 2)
+            response += f"{format_amount(t['amount'], precision)} {names.get(t['account_id'], '')}"
+            if t.get('comment'):
+                response += f" 💬 {t['comment']}"
+            response += "\n"
+
+        response += "\n💳 Новый баланс:\n"
+        for b in result['balances']:
+            response += f"{b['balance']:.{b['precision']}f} {b['account_name']}\n"
+
+        logger.info(f"Пользователь {user_id} откатил последние {len(result['reverted'])} операций в чате {chat_id}")
+        await update.message.reply_text(response.strip(), reply_markup=get_main_keyboard())
 
     except Exception as e:
-        logger.error(f"Ошибка при добавлении операции для пользователя {user_id} ({username}): {e}", exc_info=True)
+        logger.error(f"Ошибка при массовом откате для пользователя {user_id}: {e}", exc_info=True)
         await update.message.reply_text(
-            "❌ Произошла ошибка при добавлении операции.",
+            "❌ Произошла ошибка при откате операций.",
             reply_markup=get_main_keyboard()
-        )
\ No newline at end of file
+        )
@@ -2,9 +2,10 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from utils.logger import logger
+from utils.events import instrumented
 from crud import (
     get_user_accounts, get_account_transactions, create_reconciliation,
-    archive_all_transactions, get_last_reconciliation, get_account_balance, ensure_chat_exists
+    archive_all_transactions, get_last_reconciliation, get_account_balance
 )
 from datetime import datetime
 
@@ -17,6 +18,7 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+@instrumented('reconcile')
 async def reconcile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды сверки с поддержкой username"""
     user = update.effective_user
@@ -246,6 +248,7 @@ def reconcile_single_account(account, chat_id, user_id=None, username=None):
         }
 
 
+@instrumented('reconcile_callback')
 async def handle_reconciliation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback'ов для сверки с поддержкой username"""
     query = update.callback_query
@@ -0,0 +1,245 @@
+# reports.py - отчеты за период (/отчёт) и сводка по счетам (/сводка)
+import re
+from datetime import date, timedelta
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+from telegram.ext import ContextTypes
+from utils.logger import logger
+from utils.events import instrumented, annotate_event
+from crud import get_user_accounts, get_rollup_report, get_chat_summary
+from models import AccountSummary
+
+
+def get_main_keyboard():
+    """Создает основную клавиатуру с кнопками"""
+    keyboard = [
+        [KeyboardButton("/help"), KeyboardButton("/счета")],
+        [KeyboardButton("/сверь"), KeyboardButton("/дай")]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
+MONTH_NAMES = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+               'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь']
+# Месяц только по полному названию: «сентябрь», «сентября», «сентябре».
+# Сокращения не принимаются — иначе «маржа» читалась бы как март
+MONTH_GENITIVE = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+                  'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря']
+MONTH_PREPOSITIONAL = ['январе', 'феврале', 'марте', 'апреле', 'мае', 'июне',
+                       'июле', 'августе', 'сентябре', 'октябре', 'ноябре', 'декабре']
+MONTH_FORMS = {form: number
+               for forms in (MONTH_NAMES, MONTH_GENITIVE, MONTH_PREPOSITIONAL)
+               for number, form in enumerate(forms, 1)}
+
+RANGE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$')
+
+
+def month_bounds(year: int, month: int) -> tuple[date, date]:
+    start = date(year, month, 1)
+    next_month = date(year + (month == 12), month % 12 + 1, 1)
+    return start, next_month - timedelta(days=1)
+
+
+def parse_period(token: str, today: date = None):
+    """
+    Разобрать период отчета.
+
+    Returns:
+        (начало, конец, группировка, название) или None, если это не период
+    """
+    today = today or date.today()
+    token = token.lower().replace('ё', 'е')
+
+    if token == 'сегодня':
+        return today, today, 'day', 'сегодня'
+    if token == 'вчера':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday, 'day', 'вчера'
+    if token == 'неделя':
+        return today - timedelta(days=today.weekday()), today, 'day', 'эта неделя'
+    if token == 'месяц':
+        return today.replace(day=1), today, 'week', f"{MONTH_NAMES[today.month - 1]} {today.year}"
+    if token == 'год':
+        return today.replace(month=1, day=1), today, 'month', f"{today.year} год"
+
+    if token in MONTH_FORMS:
+        month = MONTH_FORMS[token]
+        # Последний такой месяц: в этом году, если он уже наступил, иначе в прошлом
+        year = today.year if month <= today.month else today.year - 1
+        start, end = month_bounds(year, month)
+        return start, min(end, today), 'week', f"{MONTH_NAMES[month - 1]} {year}"
+
+    if re.fullmatch(r'\d{4}-\d{2}', token):
+        year, month = map(int, token.split('-'))
+        if not 1 <= month <= 12:
+            return None
+        start, end = month_bounds(year, month)
+        return start, end, 'week', f"{MONTH_NAMES[month - 1]} {year}"
+    if re.fullmatch(r'\d{4}', token):
+        year = int(token)
+        return date(year, 1, 1), date(year, 12, 31), 'month', f"{year} год"
+
+    match = RANGE_PATTERN.match(token)
+    if match:
+        try:
+            start, end = (date.fromisoformat(value) for value in match.groups())
+        except ValueError:
+            return None
+        if start > end:
+            start, end = end, start
+        return start, end, 'day' if (end - start).days <= 31 else 'month', \
+            f"{start:%d.%m.%Y}–{end:%d.%m.%Y}"
+    return None
+
+
+def format_period_label(period: str, group_by: str, start: date, end: date) -> str:
+    """Подпись строки отчета; неделя обрезается по границам периода"""
+    if group_by == 'month':
+        year, month = map(int, period.split('-'))
+        return f"{MONTH_NAMES[month - 1]} {year}"
+    day = date.fromisoformat(period)
+    if group_by == 'week':
+        return f"{max(day, start):%d.%m}–{min(day + timedelta(days=6), end):%d.%m}"
+    return f"{day:%d.%m}"
+
+
+def format_totals(income: float, expense: float, count: int, precision: int) -> str:
+    return (f"+{income:.{precision}f} / {expense:.{precision}f} "
+            f"= {income + expense:+.{precision}f} ({count} оп.)")
+
+
+@instrumented('report')
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /отчёт [счет] [период]"""
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+
+    try:
+        args = update.message.text.split()[1:]
+
+        accounts = get_user_accounts(user_id, chat_id)
+        if not accounts:
+            await update.message.reply_text(
+                "💼 У вас пока нет счетов.\n\nСоздайте первый счет командой `/добавь руб`",
+                reply_markup=get_main_keyboard()
+            )
+            return
+
+        # Сначала название счета целиком («/отчёт год» для счета «год»), затем
+        # последнее слово как период; по умолчанию — текущий месяц
+        account_names = {a['account_name'].lower().replace(' ', '') for a in accounts}
+        period = None
+        if args and ''.join(args).lower() not in account_names:
+            period = parse_period(args[-1])
+            if period:
+                args = args[:-1]
+        start, end, group_by, title = period or parse_period('месяц')
+        account_name = ' '.join(args).strip().lower()
+
+        if not account_name:
+            # Без счета — итоги по каждому счету (суммы в разных валютах не складываем)
+            rows = {row['period']: row for row in get_rollup_report(
+                chat_id, [a['account_id'] for a in accounts], start.isoformat(), end.isoformat(), 'account'
+            )}
+            response = f"📊 Отчёт за период: {title}\n(поступления / списания = итог)\n\n"
+            for account in accounts:
+                row = rows.get(account['account_id'])
+                if row:
+                    response += (f"• {account['account_name']}: "
+                                 f"{format_totals(row['income'], row['expense'], row['tx_count'], account['precision'])}\n")
+            if not rows:
+                response += "Операций за период нет."
+            await update.message.reply_text(response.strip(), reply_markup=get_main_keyboard())
+            return
+
+        normalized = account_name.replace(' ', '')
+        account = next((a for a in accounts if a['account_name'].lower().replace(' ', '') == normalized), None)
+        if not account:
+            await update.message.reply_text(
+                f"❌ Счет '{account_name}' не найден.\n"
+                f"Пример: /отчёт карта сентябрь, /отчёт руб неделя, /отчёт руб 2024-05",
+                reply_markup=get_main_keyboard()
+            )
+            return
+        annotate_event(account_id=account['account_id'])
+
+        precision = account['precision']
+        rows = get_rollup_report(chat_id, [account['account_id']], start.isoformat(), end.isoformat(), group_by)
+
+        response = f"📊 Отчёт: {account['account_name']} — {title}\n"
+        if not rows:
+            await update.message.reply_text(response + "Операций за период нет.", reply_markup=get_main_keyboard())
+            return
+
+        group_titles = {'day': "По дням", 'week': "По неделям", 'month': "По месяцам"}
+        response += f"{group_titles[group_by]} (поступления / списания = итог):\n"
+        for row in rows:
+            response += (f"{format_period_label(row['period'], group_by, start, end)}: "
+                         f"{format_totals(row['income'], row['expense'], row['tx_count'], precision)}\n")
+
+        income = sum(row['income'] for row in rows)
+        expense = sum(row['expense'] for row in rows)
+        count = sum(row['tx_count'] for row in rows)
+        response += f"\nИтого: {format_totals(income, expense, count, precision)}"
+
+        logger.info(f"Пользователь {user_id} запросил отчёт по счету {account['account_name']} за {title}")
+        await update.message.reply_text(response, reply_markup=get_main_keyboard())
+
+    except Exception as e:
+        logger.error(f"Ошибка при построении отчёта для пользователя {user_id}: {e}", exc_info=True)
+        annotate_event(outcome='error')
+        await update.message.reply_text(
+            "❌ Произошла ошибка при построении отчёта.",
+            reply_markup=get_main_keyboard()
+        )
+
+
+def format_summary(accounts: list[AccountSummary]) -> str:
+    """Текст сводки: по каждому счету баланс и движение после последней сверки"""
+    response = "📋 Сводка по счетам\n\n"
+    for item in accounts:
+        precision = item.account.precision
+        response += f"💼 {item.account.account_name}: {item.current_balance:.{precision}f}\n"
+        if item.last_reconciliation_date:
+            response += (f"   сверка {item.last_reconciliation_date:%d.%m.%Y}: "
+                         f"{item.reconciled_balance:.{precision}f}\n")
+        response += (f"   поступления +{item.total_income:.{precision}f}, "
+                     f"списания {item.total_expenses:.{precision}f} ({item.transaction_count} оп.)\n")
+        if item.last_transaction_date:
+            response += f"   последняя операция: {item.last_transaction_date:%d.%m.%Y %H:%M}\n"
+        response += "\n"
+
+    response += f"Счетов: {len(accounts)}, операций после сверок: {sum(a.transaction_count for a in accounts)}"
+    last_dates = [a.last_transaction_date for a in accounts if a.last_transaction_date]
+    if last_dates:
+        response += f"\nПоследняя операция в чате: {max(last_dates):%d.%m.%Y %H:%M}"
+    return response
+
+
+@instrumented('summary')
+async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /сводка"""
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+
+    try:
+        summary = get_chat_summary(chat_id)
+        # В личных чатах — только счета пользователя, как в /счета и /дай
+        accounts = [a for a in summary.accounts
+                    if not summary.chat.is_private or a.account.created_by == user_id]
+        if not accounts:
+            await update.message.reply_text(
+                "💼 У вас пока нет счетов.\n\nСоздайте первый счет командой `/добавь руб`",
+                reply_markup=get_main_keyboard()
+            )
+            return
+
+        annotate_event(accounts=len(accounts))
+        await update.message.reply_text(format_summary(accounts), reply_markup=get_main_keyboard())
+
+    except Exception as e:
+        logger.error(f"Ошибка при построении сводки для пользователя {user_id}: {e}", exc_info=True)
+        annotate_event(outcome='error')
+        await update.message.reply_text(
+            "❌ Произошла ошибка при построении сводки.",
+            reply_markup=get_main_keyboard()
+        )
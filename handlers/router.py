@@ -0,0 +1,90 @@
+# router.py - единый маршрутизатор текстовых сообщений
+import re
+from telegram import Update
+from telegram.ext import ContextTypes, MessageHandler, filters
+from handlers.accounts import add_account_command, delete_account_command, list_accounts_command
+from handlers.operations import handle_operation, undo_last_command
+from handlers.balance import show_balance_command
+from handlers.reconciliation import reconcile_command
+from handlers.reports import report_command, summary_command
+from handlers.search import search_command
+from utils.account_index import get_account_words
+
+# Встроенные команды: первое слово сообщения -> обработчик
+BUILTIN_COMMANDS = {
+    '/добавь': add_account_command,
+    '/удали': delete_account_command,
+    '/счета': list_accounts_command,
+    '/дай': show_balance_command,
+    '/сверь': reconcile_command,
+    '/откати': undo_last_command,
+    '/отчёт': report_command,
+    '/отчет': report_command,
+    '/сводка': summary_command,
+    '/найди': search_command,
+    # Латинские команды из меню и клавиатуры
+    '/list': list_accounts_command,
+    '/balance': show_balance_command,
+    '/reconcile': reconcile_command,
+}
+
+# Команды с отдельными CommandHandler (bot.py)
+HANDLER_COMMANDS = {'/start', '/help', '/admin'}
+
+# Текстовые команды сверки (для обратной совместимости)
+TEXT_RECONCILE_PATTERN = re.compile(r'^(Кеша,\s*сверено|сверено)')
+
+
+def get_command_token(text: str) -> str:
+    """Первое слово сообщения в нижнем регистре без суффикса @имя_бота"""
+    token = text.split(maxsplit=1)[0] if text.strip() else ""
+    return token.split('@', 1)[0].lower()
+
+
+def is_routable_text(text: str | None, chat_id: int, bot_username: str | None = None) -> bool:
+    """
+    Будет ли сообщение обработано: команда бота, операция по счету чата или сверка.
+
+    Проверка та же, что при маршрутизации, по кэшу слов счетов (utils/account_index.py),
+    поэтому чужие команды и переписка не доходят до записи в БД.
+    """
+    if not text:
+        return False
+    if not text.startswith('/'):
+        return TEXT_RECONCILE_PATTERN.match(text) is not None
+
+    # Команда, адресованная другому боту: /start@other_bot
+    _, _, addressee = text.split(maxsplit=1)[0].partition('@')
+    if addressee and bot_username and addressee.lower() != bot_username.lower():
+        return False
+
+    token = get_command_token(text)
+    return token in BUILTIN_COMMANDS or token in HANDLER_COMMANDS or token[1:] in get_account_words(chat_id)
+
+
+async def route_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Определяет обработчик по первому слову сообщения и вызывает его"""
+    message = update.message
+    if not message or not is_routable_text(message.text, message.chat_id, context.bot.username):
+        return
+
+    text = message.text
+
+    if not text.startswith('/'):
+        await reconcile_command(update, context)
+        return
+
+    token = get_command_token(text)
+    handler = BUILTIN_COMMANDS.get(token)
+    if handler:
+        await handler(update, context)
+        return
+
+    # Операция по счету: первое слово должно совпадать с первым словом названия счета
+    if token[1:] in get_account_words(update.effective_chat.id):
+        await handle_operation(update, context)
+
+
+def get_router_handler():
+    """Возвращает обработчик-маршрутизатор текстовых сообщений"""
+    return MessageHandler(filters.TEXT, route_message)
@@ -0,0 +1,132 @@
+# search.py - полнотекстовый поиск операций по комментариям (/найди)
+import secrets
+from datetime import datetime
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import ContextTypes
+from utils.logger import logger
+from utils.events import instrumented, annotate_event
+from crud import get_user_accounts, search_transactions, search_terms
+
+PAGE_SIZE = 10
+# Сколько последних поисков чата помнить для кнопок листания
+MAX_SAVED_SEARCHES = 20
+# Длинные комментарии обрезаются, чтобы страница уместилась в одно сообщение
+COMMENT_LIMIT = 200
+
+
+def get_main_keyboard():
+    """Создает основную клавиатуру с кнопками"""
+    keyboard = [
+        [KeyboardButton("/help"), KeyboardButton("/счета")],
+        [KeyboardButton("/сверь"), KeyboardButton("/дай")]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
+def split_account(words: list[str], accounts: list[dict]) -> tuple[list[str], dict | None]:
+    """
+    Отделить название счета в конце запроса: «аренда карта сбер» -> (['аренда'], счет «карта сбер»).
+    Хотя бы одно слово остается запросом.
+    """
+    names = {a['account_name'].lower().replace(' ', ''): a for a in accounts}
+    for size in range(len(words) - 1, 0, -1):
+        account = names.get(''.join(words[-size:]).lower())
+        if account:
+            return words[:-size], account
+    return words, None
+
+
+def format_results(query: str, account: dict | None, rows: list[dict], page: int) -> str:
+    title = f"🔎 «{query}»" + (f" — {account['account_name']}" if account else "")
+    if not rows:
+        return f"{title}\n\nНичего не найдено." if page == 0 else f"{title}\n\nБольше результатов нет."
+
+    lines = [f"{title}, стр. {page + 1}:\n"]
+    for row in rows:
+        try:
+            day = datetime.fromisoformat(str(row['date'])).strftime('%d.%m.%Y')
+        except ValueError:
+            day = str(row['date'])[:10]
+        line = f"{day}  {row['amount']:+.{row['precision']}f}"
+        if not account:
+            line += f"  {row['account_name']}"
+        if row['comment']:
+            comment = row['comment']
+            line += f" — {comment[:COMMENT_LIMIT] + '…' if len(comment) > COMMENT_LIMIT else comment}"
+        if row['username']:
+            line += f" (@{row['username']})"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def build_pager(token: str, page: int, has_more: bool) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"search_{token}_{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("Старее ➡️", callback_data=f"search_{token}_{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def run_search(chat_id: int, search: dict, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Страница результатов и кнопки листания (на одну строку больше — чтобы знать, есть ли следующая)"""
+    account = search['account']
+    rows = search_transactions(chat_id, search['query'], account['account_id'] if account else None,
+                               limit=PAGE_SIZE + 1, offset=page * PAGE_SIZE)
+    annotate_event(results=len(rows[:PAGE_SIZE]), page=page)
+    return (format_results(search['query'], account, rows[:PAGE_SIZE], page),
+            build_pager(search['token'], page, len(rows) > PAGE_SIZE))
+
+
+@instrumented('search')
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /найди запрос [счет]"""
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+
+    try:
+        words = update.message.text.split()[1:]
+        query_words, account = split_account(words, get_user_accounts(user_id, chat_id))
+        query = ' '.join(query_words)
+
+        if not search_terms(query):
+            await update.message.reply_text(
+                "🔎 Укажите, что искать.\n"
+                "Пример: /найди аренда, /найди аренда карта, /найди @username",
+                reply_markup=get_main_keyboard()
+            )
+            return
+
+        # Параметры поиска запоминаем в chat_data: в callback_data помещается только короткий ключ
+        search = {'token': secrets.token_hex(4), 'query': query, 'account': account}
+        searches = context.chat_data.setdefault('searches', {})
+        searches[search['token']] = search
+        while len(searches) > MAX_SAVED_SEARCHES:
+            searches.pop(next(iter(searches)))
+
+        text, markup = run_search(chat_id, search, 0)
+        logger.info(f"Пользователь {user_id} ищет операции: {query}")
+        await update.message.reply_text(text, reply_markup=markup)
+
+    except Exception as e:
+        logger.error(f"Ошибка при поиске операций для пользователя {user_id}: {e}", exc_info=True)
+        annotate_event(outcome='error')
+        await update.message.reply_text(
+            "❌ Произошла ошибка при поиске.",
+            reply_markup=get_main_keyboard()
+        )
+
+
+async def handle_search_callback(query, data: str, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Листание результатов поиска: search_<ключ>_<страница>"""
+    try:
+        _, token, page = data.split("_")
+        search = context.chat_data.get('searches', {}).get(token)
+        if not search:
+            await query.edit_message_text("⌛ Результаты поиска устарели — повторите команду /найди")
+            return
+
+        text, markup = run_search(chat_id, search, max(int(page), 0))
+        await query.edit_message_text(text, reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Ошибка при листании результатов поиска: {e}", exc_info=True)
@@ -1,6 +1,7 @@
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
 from utils.logger import logger
+from utils.events import instrumented
 
 
 def get_main_keyboard():
@@ -12,6 +13,7 @@ def get_main_keyboard():
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+@instrumented('start')
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
@@ -55,6 +57,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@instrumented('help')
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
     user = update.effective_user
@@ -74,10 +77,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /[счет] [сумма] [комментарий] - добавить операцию
 Пример: /руб 100+50*2 Зарплата
 Пример: /банковская карта 1500 Покупка продуктов
+Несколько операций — каждая с новой строки в одном сообщении
+/откати [N] - отменить последние N своих операций
 
 📊 **Просмотр:**
 /дай - балансы по всем счетам
 /дай [счет] - выписка по счету
+/сводка - балансы, поступления и списания после последней сверки
+/отчёт [счет] [период] - поступления и списания за период
+/найди [запрос] [счет] - поиск операций по комментарию или @username
+Период: сегодня, вчера, неделя, месяц, год, сентябрь, 2024-05, 2024, 2024-01-01..2024-03-31
 
 🔄 **Сверка:**
 /сверь - выбор счета для сверки
@@ -0,0 +1,411 @@
+# loadtest.py - синтетические данные и нагрузочный прогон обработчиков без сети
+"""
+Нагрузочное тестирование.
+
+generate — создает реалистичную БД: тысячи чатов, счета с разной точностью,
+миллионы операций, отмены и сверки (с архивированием, как в боте).
+
+replay — прогоняет синтетические обновления Telegram через настоящее
+приложение (middleware, маршрутизатор, обработчики, очередь обновлений).
+Запросы к Bot API обслуживает FakeRequest, сеть не нужна. В конце печатается
+пропускная способность, перцентили задержки и сводка по обработчикам.
+
+Запуск:
+    python loadtest.py generate --db loadtest.db --chats 2000 --transactions 1000000
+    python loadtest.py replay --db loadtest.db --updates 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Токен не проверяется: все запросы к API обслуживаются локально
+os.environ.setdefault('BOT_TOKEN', '0:loadtest')
+
+import core
+from core import get_db_connection, create_tables, chat_db_path, iter_database_paths
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+ACCOUNT_NAMES = [
+    ('руб', 2), ('usd', 2), ('eur', 2), ('нал', 0), ('карта', 2), ('касса', 2), ('склад', 0),
+    ('btc', 8), ('eth', 6), ('usdt', 2), ('долг иван', 2), ('сейф', 0), ('зарплата', 2), ('аренда', 2),
+]
+COMMENTS = ['', '', '', 'Зарплата', 'Продукты', 'Аренда', 'Такси', 'Возврат долга', 'Обмен', 'Поставка']
+EXPRESSIONS = ['100', '-250', '1500+200', '-40*3', '12.5', '-1000:4', '(200+300)*2', '-99.99', '7*(3+4)', '5000']
+
+INSERT_BATCH = 50000
+
+
+# ===== ГЕНЕРАЦИЯ ДАННЫХ =====
+def _random_amount(precision: int) -> float:
+    scale = random.choice([1, 10, 100, 1000, 10000])
+    amount = random.uniform(0.01, 1.0) * scale
+    if random.random() < 0.55:
+        amount = -amount
+    return round(amount, precision)
+
+
+def _generate_account_history(account_id: int, chat_id: int, users: list, precision: int,
+                              count: int, start: datetime, end: datetime,
+                              revert_rate: float, reconcile_rate: float):
+    """Операции и сверки одного счета; балансы сверок согласованы с правилами бота"""
+    span = (end - start).total_seconds()
+    moments = sorted(start + timedelta(seconds=random.random() * span) for _ in range(count))
+
+    transactions = []
+    reconciliations = []
+    balance = 0.0
+    since_reconciliation = []
+    for moment in moments:
+        user_id, username = random.choice(users)
+        amount = _random_amount(precision)
+        is_reverted = random.random() < revert_rate
+        row = [
+            account_id, chat_id, amount, moment.isoformat(' '), random.choice(COMMENTS) or None,
+            user_id, username, moment.isoformat(' '), 0, int(is_reverted),
+            'Отмена операции' if is_reverted else None,
+            user_id if is_reverted else None,
+            (moment + timedelta(minutes=2)).strftime('%Y-%m-%d %H:%M:%S') if is_reverted else None,
+        ]
+        transactions.append(row)
+        since_reconciliation.append(row)
+        if not is_reverted:
+            balance += amount
+
+        if random.random() < reconcile_rate:
+            # Сверка архивирует все операции счета до нее
+            for archived in since_reconciliation:
+                archived[8] = 1
+            since_reconciliation = []
+            reconciled_at = (moment + timedelta(seconds=1)).isoformat(' ')
+            reconciliations.append((account_id, chat_id, round(balance, precision), reconciled_at,
+                                    user_id, username, reconciled_at))
+    return transactions, reconciliations
+
+
+def _flush(conn, transactions: list, reconciliations: list) -> None:
+    conn.executemany(
+        """INSERT INTO transactions (account_id, chat_id, amount, date, comment, created_by, username,
+            created_at, is_archived, is_reverted, revert_comment, reverted_by, reverted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        transactions
+    )
+    conn.executemany(
+        """INSERT INTO reconciliations (account_id, chat_id, balance, reconciliation_date, created_by,
+            username, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        reconciliations
+    )
+    transactions.clear()
+    reconciliations.clear()
+
+
+def generate_database(db_path: str, chats: int, transactions: int, days: int = 365,
+                      revert_rate: float = 0.03, reconcile_rate: float = 0.01, seed: int = 1) -> dict:
+    """
+    Заполнить БД синтетическими данными.
+
+    Количество операций на счет распределено с «тяжелым хвостом»: у большинства
+    счетов короткая история, у немногих — очень длинная.
+    """
+    random.seed(seed)
+    core.set_database_path(db_path)
+    create_tables()
+
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+
+    # Раскладываем чаты и счета по файлам БД (с учетом шардирования)
+    plan = {}
+    for number in range(chats):
+        is_group = random.random() < 0.3
+        owner_id = 100000 + number
+        chat_id = -(1000000000 + number) if is_group else owner_id
+        members = [owner_id] + ([200000 + number * 10 + i for i in range(random.randint(1, 5))] if is_group else [])
+        names = random.sample(ACCOUNT_NAMES, random.randint(1, 5))
+        plan.setdefault(chat_db_path(chat_id), []).append((chat_id, is_group, members, names))
+
+    account_count = sum(len(names) for chat_list in plan.values() for *_, names in chat_list)
+    weights = [random.paretovariate(1.2) for _ in range(account_count)]
+    scale = transactions / sum(weights)
+    per_account = iter([max(1, int(w * scale)) for w in weights])
+
+    totals = {'chats': chats, 'accounts': account_count, 'transactions': 0, 'reconciliations': 0}
+    for path, chat_list in plan.items():
+        conn = get_db_connection(path)
+        try:
+            pending_transactions = []
+            pending_reconciliations = []
+            for chat_id, is_group, members, names in chat_list:
+                users = [(user_id, f"user{user_id}") for user_id in members]
+                conn.execute(
+                    "INSERT OR REPLACE INTO chats (chat_id, chat_type, title) VALUES (?, ?, ?)",
+                    (chat_id, 'group' if is_group else 'private', f"Группа {-chat_id}" if is_group else None)
+                )
+                conn.executemany("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", users)
+                conn.executemany("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)",
+                                 [(chat_id, user_id) for user_id, _ in users])
+
+                for name, precision in names:
+                    precision = random.choice([precision, precision, 2, 0])
+                    account_id = conn.execute(
+                        """INSERT INTO accounts (chat_id, account_name, created_by, username, precision, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                        (chat_id, name, users[0][0], users[0][1], precision, start.isoformat(' '))
+                    ).lastrowid
+                    account_transactions, account_reconciliations = _generate_account_history(
+                        account_id, chat_id, users, precision, next(per_account),
+                        start, end, revert_rate, reconcile_rate
+                    )
+                    pending_transactions.extend(account_transactions)
+                    pending_reconciliations.extend(account_reconciliations)
+                    totals['transactions'] += len(account_transactions)
+                    totals['reconciliations'] += len(account_reconciliations)
+
+                    if len(pending_transactions) >= INSERT_BATCH:
+                        _flush(conn, pending_transactions, pending_reconciliations)
+                        conn.commit()
+
+            _flush(conn, pending_transactions, pending_reconciliations)
+            conn.commit()
+        finally:
+            conn.close()
+    return totals
+
+
+# ===== ФЕЙКОВЫЙ BOT API =====
+class FakeRequest(BaseRequest):
+    """
+    Реализация запросов к Bot API без сети: отвечает успешными ответами
+    правдоподобной формы и считает вызовы по методам.
+    """
+
+    BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Кеша', 'username': 'kesha_loadtest_bot'}
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, parameters: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(parameters.get('chat_id', 0))
+        return {
+            'message_id': parameters.get('message_id', self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'from': self.BOT_USER,
+            'text': parameters.get('text', ''),
+        }
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        parameters = request_data.parameters if request_data else {}
+
+        if api_method == 'getMe':
+            result = self.BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            result = self._message(parameters)
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+# ===== СИНТЕТИЧЕСКИЕ ОБНОВЛЕНИЯ =====
+UPDATE_MIX = (
+    ('operation', 0.75),
+    ('multi_operation', 0.05),
+    ('balance', 0.10),
+    ('list', 0.05),
+    ('undo', 0.05),
+)
+
+
+def load_chats() -> list[dict]:
+    """Чаты с их счетами и участниками из всех файлов БД"""
+    chats = {}
+    for path in dict.fromkeys([core.DATABASE_PATH] + iter_database_paths()):
+        if not os.path.exists(path):
+            continue
+        conn = get_db_connection(path)
+        try:
+            for row in conn.execute(
+                """SELECT c.chat_id, c.chat_type, a.account_name
+                FROM chats c JOIN accounts a ON a.chat_id = c.chat_id"""
+            ):
+                chat = chats.setdefault(row['chat_id'], {'chat_id': row['chat_id'], 'type': row['chat_type'],
+                                                         'accounts': [], 'members': []})
+                chat['accounts'].append(row['account_name'])
+            for row in conn.execute("SELECT chat_id, user_id FROM chat_members"):
+                if row['chat_id'] in chats:
+                    chats[row['chat_id']]['members'].append(row['user_id'])
+        finally:
+            conn.close()
+    return [chat for chat in chats.values() if chat['members']]
+
+
+def make_text(kind: str, chat: dict) -> str:
+    if kind == 'operation':
+        return f"/{random.choice(chat['accounts'])} {random.choice(EXPRESSIONS)} {random.choice(COMMENTS)}".strip()
+    if kind == 'multi_operation':
+        return '\n'.join(f"/{random.choice(chat['accounts'])} {random.choice(EXPRESSIONS)}"
+                         for _ in range(random.randint(2, 5)))
+    if kind == 'balance':
+        return f"/дай {random.choice(chat['accounts'])}"
+    if kind == 'list':
+        return "/счета"
+    return f"/откати {random.randint(1, 3)}"
+
+
+def make_update(update_id: int, chat: dict, text: str) -> dict:
+    user_id = random.choice(chat['members'])
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat['chat_id'], 'type': chat['type']},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест', 'username': f"user{user_id}"},
+        'text': text,
+    }
+    command = text.split(maxsplit=1)[0]
+    if command[1:].isascii():
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def percentile(samples: list, q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+async def replay(updates: int, concurrency: int, api_latency: float = 0.0,
+                 keep_rate_limits: bool = False, seed: int = 1) -> dict:
+    """Прогнать синтетические обновления через приложение и собрать статистику"""
+    from bot import build_application
+    from utils import outbox as outbox_module
+    from utils.metrics import metrics
+
+    random.seed(seed)
+    if not keep_rate_limits:
+        # Лимиты Telegram к фейковому API не относятся
+        outbox_module.GLOBAL_INTERVAL = 0.0
+
+    chats = load_chats()
+    if not chats:
+        raise RuntimeError("В БД нет чатов со счетами — сначала выполните generate")
+
+    kinds = [kind for kind, _ in UPDATE_MIX]
+    weights = [weight for _, weight in UPDATE_MIX]
+    # Нагрузка неравномерна: часть чатов заметно активнее остальных
+    chat_weights = [random.paretovariate(1.5) for _ in chats]
+
+    request = FakeRequest(api_latency)
+    application = build_application(with_updater=False, request=request)
+    latencies = {kind: [] for kind in kinds}
+    in_flight = asyncio.Semaphore(concurrency)
+    # Уникальные ID между прогонами: иначе middleware отбросит обновления как повторные
+    update_id_base = int(time.time() * 1000) * 1000
+
+    async def run_one(number: int):
+        kind = random.choices(kinds, weights)[0]
+        chat = random.choices(chats, chat_weights)[0]
+        update = Update.de_json(make_update(update_id_base + number, chat, make_text(kind, chat)),
+                                application.bot)
+        async with in_flight:
+            started = time.perf_counter()
+            await application.update_processor.process_update(update, application.process_update(update))
+            latencies[kind].append(time.perf_counter() - started)
+
+    async with application:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(number) for number in range(updates)))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = sorted(sample for samples in latencies.values() for sample in samples)
+    return {
+        'updates': updates,
+        'seconds': elapsed,
+        'throughput': updates / elapsed if elapsed else 0.0,
+        'p50': percentile(all_latencies, 0.50) * 1000,
+        'p95': percentile(all_latencies, 0.95) * 1000,
+        'p99': percentile(all_latencies, 0.99) * 1000,
+        'by_kind': {
+            kind: {
+                'count': len(samples),
+                'p50': percentile(sorted(samples), 0.50) * 1000,
+                'p99': percentile(sorted(samples), 0.99) * 1000,
+            } for kind, samples in latencies.items()
+        },
+        'handlers': metrics.summary('handler'),
+        'api_calls': request.calls,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Обновлений: {report['updates']} за {report['seconds']:.1f} с "
+          f"({report['throughput']:.0f} обновлений/с)")
+    print(f"Задержка: p50 {report['p50']:.1f} мс, p95 {report['p95']:.1f} мс, p99 {report['p99']:.1f} мс")
+    print("\nПо типам обновлений:")
+    for kind, stats in report['by_kind'].items():
+        print(f"  {kind:16} {stats['count']:7}  p50 {stats['p50']:8.1f} мс  p99 {stats['p99']:8.1f} мс")
+    print("\nОбработчики:")
+    for row in report['handlers']:
+        errors = f"  ошибок {row['errors']}" if row['errors'] else ""
+        print(f"  {row['name']:28} {row['count']:7}  p50 {row['p50']:8.1f} мс  p99 {row['p99']:8.1f} мс{errors}")
+    print("\nВызовы Bot API:", ', '.join(f"{name} {count}" for name, count in sorted(report['api_calls'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные и нагрузочный прогон бота")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help="создать БД с синтетическими данными")
+    generate.add_argument('--db', default='loadtest.db')
+    generate.add_argument('--chats', type=int, default=1000)
+    generate.add_argument('--transactions', type=int, default=100000)
+    generate.add_argument('--days', type=int, default=365)
+    generate.add_argument('--revert-rate', type=float, default=0.03)
+    generate.add_argument('--reconcile-rate', type=float, default=0.01)
+    generate.add_argument('--seed', type=int, default=1)
+
+    run = subparsers.add_parser('replay', help="прогнать синтетические обновления через обработчики")
+    run.add_argument('--db', default='loadtest.db')
+    run.add_argument('--updates', type=int, default=5000)
+    run.add_argument('--concurrency', type=int, default=64)
+    run.add_argument('--api-latency-ms', type=float, default=0.0)
+    run.add_argument('--keep-rate-limits', action='store_true')
+    run.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        started = time.perf_counter()
+        totals = generate_database(args.db, args.chats, args.transactions, args.days,
+                                   args.revert_rate, args.reconcile_rate, args.seed)
+        print(f"✅ {args.db}: чатов {totals['chats']}, счетов {totals['accounts']}, "
+              f"операций {totals['transactions']}, сверок {totals['reconciliations']} "
+              f"за {time.perf_counter() - started:.1f} с")
+    else:
+        core.set_database_path(args.db)
+        report = asyncio.run(replay(args.updates, args.concurrency, args.api_latency_ms / 1000,
+                                    args.keep_rate_limits, args.seed))
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# maintenance.py - политика хранения: очистка отмененных операций и сворачивание архива
+#
+# Запуск:
+#     python maintenance.py                            # политика хранения для всех файлов БД
+#     python maintenance.py enable-incremental-vacuum  # разовый перевод старых БД (бот остановлен)
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import core
+from core import get_db_connection, iter_database_paths, operation_day
+from utils.logger import logger
+
+COMPACTED_COMMENT = "📦 Свернуто операций: {count}"
+# Страниц, освобождаемых за один вызов incremental_vacuum
+VACUUM_PAGES_PER_STEP = 1000
+# Пауза между пакетами, чтобы не мешать обработке обновлений
+BATCH_PAUSE = 0.05
+
+
+def purge_reverted_transactions(conn, older_than_days: int, batch_size: int) -> int:
+    """Удалить отмененные операции старше older_than_days дней пакетами по batch_size"""
+    total = 0
+    while True:
+        cursor = conn.execute(
+            """DELETE FROM transactions WHERE transaction_id IN (
+                SELECT transaction_id FROM transactions
+                WHERE is_reverted = 1 AND COALESCE(reverted_at, created_at) < datetime('now', ?)
+                LIMIT ?
+            )""",
+            (f'-{older_than_days} days', batch_size)
+        )
+        conn.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+        time.sleep(BATCH_PAUSE)
+
+
+def _compaction_cutoffs(conn, keep_reconciliations: int) -> list[tuple]:
+    """(account_id, дата сверки) для счетов, у которых больше keep_reconciliations сверок"""
+    return conn.execute(
+        """SELECT account_id, reconciliation_date FROM (
+            SELECT account_id, reconciliation_date,
+                   ROW_NUMBER() OVER (PARTITION BY account_id ORDER BY reconciliation_date DESC) AS rn
+            FROM reconciliations
+        ) WHERE rn = ?""",
+        (keep_reconciliations + 1,)
+    ).fetchall()
+
+
+def compact_archived_transactions(conn, keep_reconciliations: int, batch_size: int) -> int:
+    """
+    Свернуть архивные операции, закрытые сверками старше последних keep_reconciliations,
+    в итоговые строки на счет и день: одну для поступлений и одну для списаний
+    (так сохраняются и сумма, и дневные доходы/расходы в daily_rollups).
+    Отмененные архивные операции удаляются. Возвращает количество удаленных строк.
+    """
+    removed = 0
+    for account_id, cutoff in _compaction_cutoffs(conn, keep_reconciliations):
+        while True:
+            # День — то же выражение, что в daily_rollups: date() вернул бы NULL для нестандартной
+            # даты, повторная выборка по NULL ничего не нашла бы, и группа возвращалась бы бесконечно
+            groups = conn.execute(
+                f"""SELECT {operation_day('transactions')} AS day, COUNT(*) AS cnt
+                FROM transactions
+                WHERE account_id = ? AND is_archived = 1 AND date <= ?
+                GROUP BY day
+                HAVING SUM(amount > 0) > 1 OR SUM(amount < 0) > 1 OR SUM(is_reverted) > 0
+                LIMIT ?""",
+                (account_id, cutoff, batch_size)
+            ).fetchall()
+            if not groups:
+                break
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for group in groups:
+                    rows = conn.execute(
+                        f"""SELECT transaction_id, chat_id, amount, date, is_reverted
+                        FROM transactions
+                        WHERE account_id = ? AND is_archived = 1 AND date <= ?
+                            AND {operation_day('transactions')} = ?""",
+                        (account_id, cutoff, group['day'])
+                    ).fetchall()
+                    conn.executemany("DELETE FROM transactions WHERE transaction_id = ?",
+                                     [(r['transaction_id'],) for r in rows])
+                    removed += len(rows)
+
+                    active = [r for r in rows if not r['is_reverted']]
+                    for part in ([r for r in active if r['amount'] > 0], [r for r in active if r['amount'] < 0]):
+                        if not part:
+                            continue
+                        conn.execute(
+                            """INSERT INTO transactions (account_id, chat_id, amount, date, comment, is_archived)
+                            VALUES (?, ?, ?, ?, ?, 1)""",
+                            (account_id, part[-1]['chat_id'], sum(r['amount'] for r in part),
+                             max(r['date'] for r in part), COMPACTED_COMMENT.format(count=len(part)))
+                        )
+                        removed -= 1
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            time.sleep(BATCH_PAUSE)
+    return removed
+
+
+def is_incremental_vacuum(conn) -> bool:
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def enable_incremental_vacuum(path: str) -> bool:
+    """
+    Перевести существующий файл БД в режим auto_vacuum=INCREMENTAL.
+
+    Требует полного VACUUM с долгой эксклюзивной блокировкой, поэтому выполняется
+    только вручную при остановленном боте: python maintenance.py enable-incremental-vacuum.
+    Возвращает True, если файл был переведен.
+    """
+    conn = get_db_connection(path)
+    try:
+        if is_incremental_vacuum(conn):
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info(f"БД {path} переведена в режим auto_vacuum=INCREMENTAL")
+        return True
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(conn) -> int:
+    """Вернуть системе свободные страницы небольшими шагами. Возвращает количество освобожденных"""
+    released = 0
+    while True:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages == 0:
+            return released
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+        released += min(free_pages, VACUUM_PAGES_PER_STEP)
+        time.sleep(BATCH_PAUSE)
+
+
+def run_retention(path: str, reverted_days: int, keep_reconciliations: int, batch_size: int) -> dict:
+    """Применить политику хранения к одному файлу БД"""
+    conn = get_db_connection(path)
+    try:
+        purged = purge_reverted_transactions(conn, reverted_days, batch_size) if reverted_days > 0 else 0
+        compacted = (compact_archived_transactions(conn, keep_reconciliations, batch_size)
+                     if keep_reconciliations > 0 else 0)
+        if is_incremental_vacuum(conn):
+            released = incremental_vacuum(conn)
+        else:
+            # Полный VACUUM на работающей БД заблокировал бы ее надолго — переводим файл вручную
+            logger.warning(
+                f"БД {path} не в режиме auto_vacuum=INCREMENTAL, место не освобождается. "
+                f"Остановите бота и выполните: python maintenance.py enable-incremental-vacuum"
+            )
+            released = 0
+        return {'database': path, 'purged': purged, 'compacted': compacted, 'released_pages': released}
+    finally:
+        conn.close()
+
+
+def run_retention_all(reverted_days: int, keep_reconciliations: int, batch_size: int) -> list[dict]:
+    """Политика хранения для главной БД и всех шардов"""
+    results = []
+    for path in dict.fromkeys([core.DATABASE_PATH] + iter_database_paths()):
+        if not os.path.exists(path):
+            continue
+        result = run_retention(path, reverted_days, keep_reconciliations, batch_size)
+        logger.info(
+            f"Обслуживание {path}: удалено отмененных {result['purged']}, "
+            f"свернуто архивных {result['compacted']}, освобождено страниц {result['released_pages']}"
+        )
+        results.append(result)
+    return results
+
+
+def enable_incremental_vacuum_all() -> list[str]:
+    """Перевести главную БД и все шарды в режим auto_vacuum=INCREMENTAL. Возвращает переведенные файлы"""
+    return [path for path in dict.fromkeys([core.DATABASE_PATH] + iter_database_paths())
+            if os.path.exists(path) and enable_incremental_vacuum(path)]
+
+
+if __name__ == "__main__":
+    from config import RETENTION_REVERTED_DAYS, RETENTION_KEEP_RECONCILIATIONS, RETENTION_BATCH_SIZE
+    try:
+        if sys.argv[1:] == ['enable-incremental-vacuum']:
+            # Разовый полный VACUUM — только при остановленном боте
+            converted = enable_incremental_vacuum_all()
+            print(f"✅ Переведено файлов БД: {len(converted)}" + "".join(f"\n  {path}" for path in converted))
+        else:
+            for item in run_retention_all(RETENTION_REVERTED_DAYS, RETENTION_KEEP_RECONCILIATIONS,
+                                          RETENTION_BATCH_SIZE):
+                print(f"✅ {item['database']}: удалено {item['purged']}, свернуто {item['compacted']}, "
+                      f"освобождено страниц {item['released_pages']}")
+    except sqlite3.Error as e:
+        print(f"❌ Ошибка обслуживания БД: {e}")
+        sys.exit(1)
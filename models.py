@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -70,6 +70,7 @@ class Account:
     account_name: str
     created_by: Optional[int] = None
     created_at: Optional[datetime] = None
+    precision: int = 2
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -77,7 +78,8 @@ class Account:
             'chat_id': self.chat_id,
             'account_name': self.account_name,
             'created_by': self.created_by,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'precision': self.precision
         }
 
     @classmethod
@@ -87,7 +89,8 @@ class Account:
             chat_id=data['chat_id'],
             account_name=data['account_name'],
             created_by=data['created_by'],
-            created_at=datetime.fromisoformat(data['created_at']) if data['created_at'] else None
+            created_at=datetime.fromisoformat(data['created_at']) if data['created_at'] else None,
+            precision=data.get('precision', 2)
         )
 
 
@@ -284,17 +287,24 @@ class ChatSummary:
     account_count: int
     transaction_count: int
     last_transaction_date: Optional[datetime] = None
+    accounts: List['AccountSummary'] = field(default_factory=list)
 
 
 @dataclass
 class AccountSummary:
-    """Сводная информация по счету"""
+    """
+    Сводная информация по счету.
+    Доходы, расходы и количество — по операциям после последней сверки (без отмененных),
+    баланс — сумма сверки плюс эти операции.
+    """
     account: Account
     total_income: float
     total_expenses: float
     current_balance: float
     transaction_count: int
     last_transaction_date: Optional[datetime] = None
+    reconciled_balance: float = 0.0
+    last_reconciliation_date: Optional[datetime] = None
 
 
 @dataclass
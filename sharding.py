@@ -0,0 +1,73 @@
+# sharding.py - миграция единой БД в шарды по chat_id
+"""
+Разделение существующей accountant_bot.db на файлы-шарды.
+
+Перед запуском задайте SHARD_COUNT (> 1) и сделайте резервную копию БД.
+Данные чатов копируются в шарды с сохранением ID, количество строк
+сверяется, после чего данные чатов удаляются из главной БД.
+
+Запуск:
+    SHARD_COUNT=4 python sharding.py split
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import core
+from core import get_db_connection, create_tables, chat_db_path, copy_chat_data, delete_chat_data, CHAT_TABLES
+from utils.logger import logger
+
+
+def count_chat_rows(conn, chat_id: int) -> dict:
+    return {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+        for table in CHAT_TABLES
+    }
+
+
+def split_database(source_path: str = None) -> int:
+    """Перенести данные всех чатов главной БД в их шарды. Возвращает количество чатов"""
+    if core.SHARD_COUNT <= 1:
+        raise ValueError("Для разделения БД задайте SHARD_COUNT больше 1")
+
+    source_path = source_path or core.DATABASE_PATH
+    create_tables()
+
+    src = get_db_connection(source_path)
+    try:
+        chat_ids = [row['chat_id'] for row in src.execute("SELECT chat_id FROM chats").fetchall()]
+        # Счета и операции без записи в chats (до появления middleware) тоже переносим
+        chat_ids += [row['chat_id'] for row in src.execute(
+            "SELECT DISTINCT chat_id FROM accounts WHERE chat_id NOT IN (SELECT chat_id FROM chats)"
+        ).fetchall()]
+
+        for number, chat_id in enumerate(chat_ids, 1):
+            dst = get_db_connection(chat_db_path(chat_id, source_path))
+            try:
+                copy_chat_data(src, dst, chat_id, preserve_ids=True)
+                dst.commit()
+
+                expected = count_chat_rows(src, chat_id)
+                copied = count_chat_rows(dst, chat_id)
+                if expected != copied:
+                    raise RuntimeError(f"Чат {chat_id}: скопировано {copied}, ожидалось {expected}")
+            finally:
+                dst.close()
+
+            delete_chat_data(src, chat_id)
+            src.commit()
+            logger.info(f"Чат {chat_id} перенесен в шард {core.get_chat_shard(chat_id, source_path)} ({number}/{len(chat_ids)})")
+
+        src.execute("VACUUM")
+        return len(chat_ids)
+    finally:
+        src.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['split']:
+        count = split_database()
+        print(f"✅ Перенесено чатов: {count}")
+    else:
+        print(__doc__)
@@ -0,0 +1,79 @@
+# conftest.py - общие фикстуры: временная БД и Bot API без сети
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Токен нужен только для сборки приложения: запросы к Bot API обрабатывает RecordingRequest
+os.environ.setdefault('BOT_TOKEN', '123456:TEST-TOKEN')
+
+import core
+import crud
+from handlers import middleware
+from loadtest import FakeRequest
+from utils import account_index
+from utils.cache import LRUCache, LRUSet
+from utils.outbox import outbox
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class RecordingRequest(FakeRequest):
+    """FakeRequest, запоминающий вызовы Bot API вместе с параметрами"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def do_request(self, url: str, method: str, request_data=None, **kwargs):
+        self.requests.append((url.rsplit('/', 1)[-1], dict(request_data.parameters) if request_data else {}))
+        return await super().do_request(url, method, request_data, **kwargs)
+
+    def sent(self, api_method: str) -> list[dict]:
+        return [parameters for name, parameters in self.requests if name == api_method]
+
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    """Дождаться, пока приложение обработает обновление из очереди"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Обновление не обработано за отведенное время")
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая БД во временном каталоге и сброшенные кэши процесса"""
+    monkeypatch.setattr(core, 'DATABASE_PATH', str(tmp_path / 'bot.db'))
+    monkeypatch.setattr(middleware, 'recent_update_keys', LRUSet(maxsize=10000))
+    for name in ('seen_chats', 'seen_users', 'seen_members'):
+        monkeypatch.setattr(middleware, name, LRUSet(maxsize=1000))
+    monkeypatch.setattr(account_index, '_account_index', LRUCache(maxsize=1000))
+    monkeypatch.setattr(crud, '_summary_cache', LRUCache(maxsize=1000))
+    # Подтверждения не должны дописываться в сообщения предыдущего теста
+    monkeypatch.setattr(outbox, '_confirmations', {})
+    monkeypatch.setattr(outbox, '_chats', {})
+    core.create_tables()
+    return core.DATABASE_PATH
+
+
+@pytest.fixture
+def api():
+    return RecordingRequest()
+
+
+@pytest.fixture
+def account(db):
+    """Счет «карта» пользователя из записанных обновлений (tests/fixtures)"""
+    crud.upsert_identity(chat=(90210, 'private', None), user=(90210, 'anya_fin'), member=(90210, 90210))
+    return crud.create_account(90210, 'карта', created_by=90210, username='anya_fin')
@@ -0,0 +1,123 @@
+# test_query_budgets.py - бюджеты SQL-запросов обработчиков (utils/query_profiler.query_budget)
+"""
+Каждое обновление проходит через приложение целиком, вместе с middleware
+(ключ идемпотентности). Перед замером обрабатывается одно обновление: чат,
+пользователь и слова счетов уже в кэше, как у работающего бота.
+Бюджет — текущее число запросов; рост означает новый запрос на пути обработки.
+"""
+import asyncio
+import copy
+import itertools
+from datetime import datetime
+
+import pytest
+from telegram import Update
+
+import crud
+from bot import build_application
+from utils.query_profiler import query_budget
+from conftest import load_fixture
+
+QUERY_BUDGETS = {
+    'operation': 8,
+    'multi_operation': 9,
+    'undo': 7,
+    'undo_button': 8,
+    'report_account': 4,
+    'report_all': 4,
+    'search': 5,
+    'search_page': 3,
+}
+
+_update_ids = itertools.count(1)
+
+
+def message_update(text: str) -> dict:
+    data = copy.deepcopy(load_fixture('message_update.json'))
+    data['update_id'] = data['message']['message_id'] = next(_update_ids)
+    data['message']['text'] = text
+    return data
+
+
+def callback_update(callback_data: str) -> dict:
+    data = copy.deepcopy(load_fixture('callback_update.json'))
+    data['update_id'] = next(_update_ids)
+    data['callback_query']['id'] = str(data['update_id'])
+    data['callback_query']['data'] = callback_data
+    data['callback_query']['message']['reply_markup'] = {
+        'inline_keyboard': [[{'text': 'кнопка', 'callback_data': callback_data}]]
+    }
+    return data
+
+
+async def process(application, data: dict, budget: str | None = None) -> None:
+    update = Update.de_json(data, application.bot)
+    if budget is None:
+        await application.process_update(update)
+        return
+    with query_budget(QUERY_BUDGETS[budget], budget):
+        await application.process_update(update)
+
+
+def run_scenario(api, scenario) -> None:
+    async def main():
+        application = build_application(with_updater=False, request=api)
+        async with application:
+            await process(application, message_update('/счета'))
+            await scenario(application)
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def history(account):
+    """Пятьдесят операций по счету, чтобы запросы шли не по пустым таблицам"""
+    for i in range(50):
+        crud.create_transaction(account, 90210, 10 + i, datetime.now(), f"кофе {i}", 90210, 'anya_fin')
+    return account
+
+
+def last_button(api) -> str:
+    markup = api.sent('sendMessage')[-1]['reply_markup']
+    return markup['inline_keyboard'][0][-1]['callback_data']
+
+
+def test_operation_budget(api, history):
+    async def scenario(application):
+        await process(application, message_update('/карта 150+50 кофе'), 'operation')
+        assert last_button(api).startswith('cancel_')
+        await process(application, message_update('/карта 10\n/карта 20 чай'), 'multi_operation')
+        assert last_button(api).startswith('cancel_batch_')
+
+    run_scenario(api, scenario)
+
+
+def test_undo_budget(api, history):
+    async def scenario(application):
+        await process(application, message_update('/карта 5 кофе'))
+        await process(application, callback_update(last_button(api)), 'undo_button')
+        assert api.sent('editMessageText')[-1]['text'].startswith('❌ ОТКАТАНО')
+        await process(application, message_update('/откати 2'), 'undo')
+
+    run_scenario(api, scenario)
+
+
+def test_report_budget(api, history):
+    async def scenario(application):
+        await process(application, message_update('/отчёт карта'), 'report_account')
+        assert api.sent('sendMessage')[-1]['text'].startswith('📊 Отчёт: карта')
+        await process(application, message_update('/отчёт'), 'report_all')
+        assert api.sent('sendMessage')[-1]['text'].startswith('📊 Отчёт за период')
+
+    run_scenario(api, scenario)
+
+
+def test_search_budget(api, history):
+    async def scenario(application):
+        await process(application, message_update('/найди кофе'), 'search')
+        button = last_button(api)
+        assert button.startswith('search_')
+        await process(application, callback_update(button), 'search_page')
+        assert 'стр. 2' in api.sent('editMessageText')[-1]['text']
+
+    run_scenario(api, scenario)
@@ -0,0 +1,78 @@
+# test_webhook.py - прием обновлений вебхуком: записанные JSON обновлений через локальный HTTP-сервер
+import asyncio
+import json
+
+import httpx
+
+from bot import build_application
+from core import get_db_connection
+from utils.http_server import LocalHTTPServer
+from webhook import create_webhook_route, SECRET_HEADER
+from conftest import load_fixture, wait_until
+
+SECRET = 'webhook-test-secret'
+PATH = '/telegram'
+
+
+def transaction_row(transaction_id: int):
+    conn = get_db_connection()
+    try:
+        return conn.execute("SELECT amount, comment, is_reverted FROM transactions WHERE transaction_id = ?",
+                            (transaction_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+async def serve_and_post(api, requests: list[tuple[str, str | None]], check) -> list[int]:
+    """Поднять приложение и вебхук на свободном порту, отправить запросы и выполнить проверки"""
+    application = build_application(with_updater=False, request=api)
+    server = LocalHTTPServer('127.0.0.1', 0)
+    server.add_route('POST', PATH, create_webhook_route(application, SECRET))
+
+    statuses = []
+    async with application:
+        await application.start()
+        await server.start()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                for fixture, secret in requests:
+                    headers = {'Content-Type': 'application/json'}
+                    if secret is not None:
+                        headers[SECRET_HEADER] = secret
+                    response = await client.post(PATH, content=json.dumps(load_fixture(fixture)), headers=headers)
+                    statuses.append(response.status_code)
+                    await check(fixture, response.status_code)
+        finally:
+            await server.stop()
+            await application.stop()
+    return statuses
+
+
+def test_message_and_callback_are_dispatched(api, account):
+    async def check(fixture, status):
+        if fixture == 'message_update.json':
+            await wait_until(lambda: api.sent('sendMessage'))
+            row = transaction_row(1)
+            assert (row['amount'], row['comment'], row['is_reverted']) == (200, 'кофе', 0)
+            markup = api.sent('sendMessage')[0]['reply_markup']
+            assert markup['inline_keyboard'][0][0]['callback_data'] == 'cancel_1'
+        else:
+            await wait_until(lambda: api.sent('editMessageText'))
+            assert transaction_row(1)['is_reverted'] == 1
+            assert api.sent('editMessageText')[0]['text'].startswith('❌ ОТКАТАНО')
+
+    statuses = asyncio.run(serve_and_post(api, [('message_update.json', SECRET),
+                                                ('callback_update.json', SECRET)], check))
+    assert statuses == [200, 200]
+
+
+def test_wrong_or_missing_secret_is_rejected(api, account):
+    async def check(fixture, status):
+        # Отклоненное обновление не должно дойти до обработчиков
+        await asyncio.sleep(0.2)
+        assert transaction_row(1) is None
+        assert not api.sent('sendMessage')
+
+    statuses = asyncio.run(serve_and_post(api, [('message_update.json', 'wrong-secret'),
+                                                ('message_update.json', None)], check))
+    assert statuses == [403, 403]
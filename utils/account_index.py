@@ -0,0 +1,24 @@
+# account_index.py - кэш названий счетов по чатам для маршрутизации сообщений
+from utils.cache import LRUCache
+from crud import get_chat_accounts
+
+# chat_id -> множество первых слов названий счетов (в нижнем регистре)
+_account_index = LRUCache(maxsize=20000)
+
+
+def get_account_words(chat_id: int) -> set:
+    """Первые слова названий счетов чата; загружаются из БД один раз до инвалидации"""
+    words = _account_index.get(chat_id)
+    if words is None:
+        words = set()
+        for account in get_chat_accounts(chat_id):
+            name_words = account['account_name'].split()
+            if name_words:
+                words.add(name_words[0].lower())
+        _account_index.set(chat_id, words)
+    return words
+
+
+def invalidate_account_index(chat_id: int) -> None:
+    """Сбросить кэш после создания или удаления счета"""
+    _account_index.pop(chat_id)
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+
+
+class LRUSet:
+    """
+    Ограниченное по размеру множество ключей с вытеснением самых старых.
+
+    Если задан ttl (секунды), ключ считается отсутствующим по истечении ttl
+    с момента добавления — это позволяет периодически обновлять данные.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        added_at = self._items.get(key)
+        if added_at is None:
+            return False
+        if self.ttl is not None and time.monotonic() - added_at > self.ttl:
+            del self._items[key]
+            return False
+        self._items.move_to_end(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, key) -> None:
+        self._items[key] = time.monotonic()
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def discard(self, key) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+class LRUCache:
+    """Ограниченный по размеру словарь с вытеснением давно не использованных записей"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def set(self, key, value) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        self._items.clear()
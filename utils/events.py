@@ -0,0 +1,92 @@
+# events.py - структурированный журнал событий (JSON lines) с сэмплированием
+import functools
+import json
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from utils.query_profiler import track_queries, untrack_queries
+from utils.logger import event_logger
+from utils.metrics import metrics
+
+# Доля записываемых успешных событий по типам: "operation=0.1,callback=0.5".
+# Неуспешные события записываются всегда.
+EVENT_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition('=') for item in os.getenv('EVENT_SAMPLE_RATES', '').split(','))
+    if name.strip() and rate.strip()
+}
+
+# Поля события, которые обработчик дополняет по ходу работы (annotate_event)
+_event_fields = ContextVar('event_fields', default=None)
+
+
+def annotate_event(**fields) -> None:
+    """Добавить поля (account_id, outcome, ...) к событию текущего обработчика"""
+    current = _event_fields.get()
+    if current is not None:
+        current.update(fields)
+
+
+def should_log(event: str, outcome: str) -> bool:
+    if outcome != 'ok':
+        return True
+    rate = EVENT_SAMPLE_RATES.get(event, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+def log_event(event: str, **fields) -> None:
+    """Записать событие одной JSON-строкой (с учетом сэмплирования)"""
+    if not should_log(event, fields.get('outcome', 'ok')):
+        return
+    record = {'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'), 'event': event}
+    record.update(fields)
+    event_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def instrumented(event: str):
+    """
+    Декоратор обработчика обновлений: записывает событие с chat_id, user_id,
+    именем обработчика, длительностью, числом SQL-запросов и результатом.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context, *args, **kwargs):
+            # Вложенный вызов (обработчик вызван из другого обработчика) — событие пишет внешний
+            if _event_fields.get() is not None:
+                return await func(update, context, *args, **kwargs)
+
+            fields = {}
+            fields_token = _event_fields.set(fields)
+            query_stats, query_token = track_queries()
+            started = time.perf_counter()
+            outcome = 'ok'
+            try:
+                return await func(update, context, *args, **kwargs)
+            except Exception:
+                outcome = 'exception'
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                duration_ms = duration * 1000
+                untrack_queries(query_token)
+                _event_fields.reset(fields_token)
+                if outcome == 'exception':
+                    fields['outcome'] = outcome
+                metrics.observe('handler', func.__name__, duration,
+                                error=fields.get('outcome') in ('exception', 'error'))
+                log_event(
+                    event,
+                    handler=func.__name__,
+                    chat_id=update.effective_chat.id if update.effective_chat else None,
+                    user_id=update.effective_user.id if update.effective_user else None,
+                    duration_ms=round(duration_ms, 2),
+                    db_queries=query_stats['queries'],
+                    db_ms=round(query_stats['time'] * 1000, 2),
+                    **{'outcome': 'ok', **fields}
+                )
+        # Время обработчика уже замеряется — повторно не оборачивать (instrument_application)
+        wrapper.timed = True
+        return wrapper
+    return decorator
@@ -0,0 +1,114 @@
+# http_server.py - минимальный локальный HTTP-сервер на asyncio (вебхуки, метрики)
+import asyncio
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Tuple
+from urllib.parse import urlsplit, parse_qs
+from utils.logger import logger
+
+MAX_BODY_SIZE = 1024 * 1024
+READ_TIMEOUT = 10.0
+
+
+@dataclass
+class HTTPRequest:
+    """Входящий HTTP-запрос"""
+    method: str
+    path: str
+    query: Dict[str, list] = field(default_factory=dict)
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b''
+
+
+# Обработчик маршрута возвращает (код ответа, content-type, тело)
+RouteHandler = Callable[[HTTPRequest], Awaitable[Tuple[int, str, bytes]]]
+
+
+class LocalHTTPServer:
+    """
+    HTTP/1.1 сервер без внешних зависимостей: один запрос на соединение,
+    маршруты по точному совпадению метода и пути.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080):
+        self.host = host
+        self.port = port
+        self._routes = {}
+        self._server = None
+
+    def add_route(self, method: str, path: str, handler: RouteHandler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP-сервер слушает {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader) -> HTTPRequest | None:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode('latin-1').strip().split(' ', 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            raise ValueError("Слишком большое тело запроса")
+        body = await reader.readexactly(length) if length else b''
+
+        url = urlsplit(target)
+        return HTTPRequest(method.upper(), url.path, parse_qs(url.query), headers, body)
+
+    async def _handle_connection(self, reader, writer) -> None:
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                await self._write_response(writer, 400, 'text/plain', b'Bad Request')
+                return
+            if request is None:
+                return
+
+            handler = self._routes.get((request.method, request.path))
+            if handler is None:
+                await self._write_response(writer, 404, 'text/plain', b'Not Found')
+                return
+
+            try:
+                status, content_type, body = await handler(request)
+            except Exception as e:
+                logger.error(f"Ошибка обработки HTTP-запроса {request.method} {request.path}: {e}", exc_info=True)
+                status, content_type, body = 500, 'text/plain', b'Internal Server Error'
+
+            await self._write_response(writer, status, content_type, body)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    @staticmethod
+    async def _write_response(writer, status: int, content_type: str, body: bytes) -> None:
+        head = (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 import os
 
@@ -20,17 +23,43 @@ log_dir = "logs"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, 'bot.log'), encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Параметры логирования из окружения:
+#   LOG_LEVEL          — общий уровень (INFO)
+#   LOG_LEVELS         — уровни по модулям: "httpx=WARNING,accountant_bot=DEBUG"
+#   LOG_ROTATION       — size (по размеру) или time (по времени)
+#   LOG_MAX_BYTES      — размер файла для ротации по размеру
+#   LOG_ROTATE_WHEN    — период для ротации по времени (midnight, H, D ...)
+#   LOG_BACKUP_COUNT   — сколько старых файлов хранить
+#   LOG_PROCESS_NAME   — имя файлов журнала процесса (по умолчанию имя скрипта)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING,apscheduler=WARNING')
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _process_log_name() -> str:
+    """
+    Имя файлов журнала процесса. Ротация небезопасна, если в один файл пишут
+    несколько процессов (один переименовывает файл, другие продолжают писать
+    в старый), поэтому у каждого процесса свои файлы:
+    LOG_PROCESS_NAME (воркеры кластера), иначе имя запущенного скрипта
+    (bot, cluster, maintenance ...); дочерние процессы multiprocessing — с PID.
+    """
+    import multiprocessing
+    name = os.getenv('LOG_PROCESS_NAME') or os.path.splitext(os.path.basename(sys.argv[0] or ''))[0]
+    if not name or name.startswith('-'):
+        name = 'bot'
+    if multiprocessing.parent_process() is not None:
+        name = f"{name}.{os.getpid()}"
+    return name
+
+
+LOG_PROCESS_NAME = _process_log_name()
 
-logger = logging.getLogger('accountant_bot')
 
 # Дополнительная настройка для обработки Unicode в Windows
 class SafeStreamHandler(logging.StreamHandler):
@@ -45,9 +74,74 @@ class SafeStreamHandler(logging.StreamHandler):
         except Exception:
             self.handleError(record)
 
-# Заменяем стандартный handler на безопасный
-for handler in logger.handlers[:]:
-    if isinstance(handler, logging.StreamHandler):
-        logger.removeHandler(handler)
 
-logger.addHandler(SafeStreamHandler())
\ No newline at end of file
+def _create_file_handler() -> logging.Handler:
+    # delay=True: файл создается при первой записи (дочерние процессы пишут редко)
+    log_path = os.path.join(log_dir, f'{LOG_PROCESS_NAME}.log')
+    if LOG_ROTATION == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            log_path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+    )
+
+
+def _apply_module_levels(spec: str) -> None:
+    """Уровни логирования по модулям из строки вида "имя=УРОВЕНЬ,имя=УРОВЕНЬ" """
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+
+def _setup_logging() -> logging.handlers.QueueListener:
+    """
+    Записи попадают в очередь, а в файл и консоль их пишет фоновый поток
+    QueueListener — обработчики обновлений не ждут дискового ввода-вывода.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = _create_file_handler()
+    console_handler = SafeStreamHandler(sys.stdout)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    _apply_module_levels(LOG_LEVELS)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем оставшиеся в очереди записи
+    atexit.register(listener.stop)
+    return listener
+
+
+def _setup_event_logging() -> logging.handlers.QueueListener:
+    """Журнал событий: JSON-строки в logs/<процесс>.events.jsonl через отдельную очередь"""
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, f'{LOG_PROCESS_NAME}.events.jsonl'), maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    events_queue = queue.SimpleQueue()
+    events = logging.getLogger('accountant_bot.events')
+    events.propagate = False
+    events.setLevel(logging.INFO)
+    events.addHandler(logging.handlers.QueueHandler(events_queue))
+
+    listener = logging.handlers.QueueListener(events_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = _setup_logging()
+event_log_listener = _setup_event_logging()
+logger = logging.getLogger('accountant_bot')
+event_logger = logging.getLogger('accountant_bot.events')
@@ -0,0 +1,173 @@
+# metrics.py - гистограммы задержек обработчиков и функций crud, экспорт в формате Prometheus
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from telegram.ext import ApplicationHandlerStop
+from utils.http_server import LocalHTTPServer, HTTPRequest
+
+# Границы корзин гистограммы, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сколько последних замеров хранить для расчета перцентилей
+RESERVOIR_SIZE = 2048
+
+METRIC_NAMES = {
+    'handler': 'kesha_handler',
+    'crud': 'kesha_crud',
+}
+
+
+class Histogram:
+    """Гистограмма задержек: корзины для Prometheus и последние замеры для перцентилей"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, q: float) -> float:
+        samples = sorted(self.recent)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (тип, имя) -> Histogram
+        self._histograms = {}
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        # crud вызывается и из потоков (asyncio.to_thread)
+        with self._lock:
+            histogram = self._histograms.get((kind, name))
+            if histogram is None:
+                histogram = self._histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, error)
+
+    def summary(self, kind: str) -> list[dict]:
+        """Сводка по обработчикам/функциям: количество, ошибки, p50/p95/p99 в мс"""
+        with self._lock:
+            items = [(name, h) for (k, name), h in self._histograms.items() if k == kind]
+            result = [{
+                'name': name,
+                'count': h.count,
+                'errors': h.errors,
+                'p50': h.percentile(0.50) * 1000,
+                'p95': h.percentile(0.95) * 1000,
+                'p99': h.percentile(0.99) * 1000,
+            } for name, h in items]
+        return sorted(result, key=lambda item: item['p99'], reverse=True)
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for kind, metric in METRIC_NAMES.items():
+                label = 'handler' if kind == 'handler' else 'function'
+                items = sorted((name, h) for (k, name), h in self._histograms.items() if k == kind)
+
+                lines.append(f"# TYPE {metric}_duration_seconds histogram")
+                for name, h in items:
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, h.bucket_counts):
+                        cumulative += count
+                        lines.append(f'{metric}_duration_seconds_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_duration_seconds_bucket{{{label}="{name}",le="+Inf"}} {h.count}')
+                    lines.append(f'{metric}_duration_seconds_sum{{{label}="{name}"}} {h.total:.6f}')
+                    lines.append(f'{metric}_duration_seconds_count{{{label}="{name}"}} {h.count}')
+
+                lines.append(f"# TYPE {metric}_errors_total counter")
+                for name, h in items:
+                    lines.append(f'{metric}_errors_total{{{label}="{name}"}} {h.errors}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def timed(kind: str, name: str = None):
+    """Декоратор: записывать время выполнения функции (обычной или async) в гистограмму"""
+    def decorator(func):
+        metric_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                error = False
+                try:
+                    return await func(*args, **kwargs)
+                except ApplicationHandlerStop:
+                    # Штатная остановка цепочки обработчиков (middleware), не ошибка
+                    raise
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    metrics.observe(kind, metric_name, time.perf_counter() - started, error)
+            async_wrapper.timed = True
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.observe(kind, metric_name, time.perf_counter() - started, error)
+        wrapper.timed = True
+        return wrapper
+    return decorator
+
+
+def instrument_functions(namespace: dict, kind: str) -> None:
+    """Обернуть все публичные функции модуля (передается globals()) декоратором timed"""
+    module_name = namespace['__name__']
+    for attr, value in list(namespace.items()):
+        if (callable(value) and not attr.startswith('_') and getattr(value, '__module__', None) == module_name
+                and not isinstance(value, type)):
+            namespace[attr] = timed(kind)(value)
+
+
+def instrument_application(application) -> None:
+    """Обернуть callback каждого зарегистрированного обработчика (кроме уже замеряемых)"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if not getattr(handler.callback, 'timed', False):
+                handler.callback = timed('handler')(handler.callback)
+
+
+_server = None
+
+
+async def start_metrics_server(host: str, port: int) -> LocalHTTPServer:
+    """Отдавать метрики по GET /metrics на локальном порту"""
+    global _server
+
+    async def handle_metrics(request: HTTPRequest):
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', metrics.render_prometheus().encode('utf-8')
+
+    _server = LocalHTTPServer(host, port)
+    _server.add_route('GET', '/metrics', handle_metrics)
+    await _server.start()
+    return _server
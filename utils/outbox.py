@@ -0,0 +1,160 @@
+# outbox.py - очередь исходящих сообщений с учетом лимитов Telegram
+import asyncio
+import time
+from telegram import InlineKeyboardMarkup
+from telegram.error import RetryAfter, TimedOut, BadRequest
+from utils.logger import logger
+
+# Общий лимит Telegram ~30 сообщений в секунду; лимиты чатов соблюдаются по RetryAfter
+GLOBAL_INTERVAL = 1.0 / 30
+MAX_SEND_ATTEMPTS = 3
+
+# Подтверждения операций одного пользователя в течение окна объединяются в одно сообщение
+COALESCE_WINDOW = 10.0
+MAX_COALESCED_OPERATIONS = 5
+
+
+class Outbox:
+    """
+    Отправка сообщений через очередь чата.
+
+    Вызовы для одного чата выполняются по очереди без искусственных пауз:
+    чат притормаживается только после RetryAfter от Telegram, запрос при этом
+    повторяется. Частые подтверждения операций одного пользователя дописываются
+    в уже отправленное сообщение.
+    """
+
+    def __init__(self):
+        # chat_id -> {'lock', 'next_send', 'users'}; запись удаляется, когда чат простаивает
+        self._chats = {}
+        self._global_lock = asyncio.Lock()
+        self._global_next_send = 0.0
+        # (chat_id, user_id) -> {'message_id', 'text', 'buttons', 'sent_at'}
+        self._confirmations = {}
+        self.api_calls = 0
+        self.coalesced = 0
+
+    async def _wait_global_slot(self):
+        async with self._global_lock:
+            delay = self._global_next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._global_next_send = time.monotonic() + GLOBAL_INTERVAL
+
+    async def _call(self, chat_id: int, request, retry_timeout: bool = False):
+        """
+        Выполнить запрос к API в очереди чата с повтором при RetryAfter.
+
+        Таймаут повторяется только для идемпотентных запросов (retry_timeout):
+        после таймаута сообщение могло быть доставлено, и повтор sendMessage
+        отправил бы его второй раз.
+        """
+        state = self._chats.setdefault(chat_id, {'lock': asyncio.Lock(), 'next_send': 0.0, 'users': 0})
+        state['users'] += 1
+        try:
+            async with state['lock']:
+                for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+                    delay = state['next_send'] - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    await self._wait_global_slot()
+
+                    try:
+                        self.api_calls += 1
+                        return await request()
+                    except RetryAfter as e:
+                        logger.warning(f"Лимит Telegram в чате {chat_id}, повтор через {e.retry_after} с")
+                        state['next_send'] = time.monotonic() + float(e.retry_after)
+                        if attempt == MAX_SEND_ATTEMPTS:
+                            raise
+                    except TimedOut:
+                        logger.warning(f"Таймаут запроса в чат {chat_id}, попытка {attempt}")
+                        if not retry_timeout or attempt == MAX_SEND_ATTEMPTS:
+                            raise
+        finally:
+            state['users'] -= 1
+            self._prune_chats(time.monotonic())
+
+    def _prune_chats(self, now: float) -> None:
+        """Удалить очереди чатов, которые никто не ждет и которые не приторможены RetryAfter"""
+        idle = [chat_id for chat_id, state in self._chats.items()
+                if state['users'] == 0 and state['next_send'] <= now]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def send_message(self, bot, chat_id: int, text: str,
+                           reply_markup=None, reply_to_message_id: int = None):
+        """Отправить сообщение через очередь чата"""
+        return await self._call(chat_id, lambda: bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=reply_markup,
+            reply_to_message_id=reply_to_message_id,
+            allow_sending_without_reply=True
+        ))
+
+    async def send_confirmation(self, bot, chat_id: int, user_id: int, text: str, button,
+                                reply_to_message_id: int = None):
+        """
+        Отправить подтверждение операции с кнопкой отката.
+
+        Если у пользователя есть свежее подтверждение в этом чате, новое
+        дописывается в него редактированием вместо отправки нового сообщения.
+        """
+        key = (chat_id, user_id)
+        now = time.monotonic()
+        self._prune_confirmations(now)
+        previous = self._confirmations.get(key)
+
+        if (previous and now - previous['sent_at'] <= COALESCE_WINDOW
+                and len(previous['buttons']) < MAX_COALESCED_OPERATIONS):
+            new_text = f"{previous['text']}\n\n{text}"
+            buttons = previous['buttons'] + [button]
+            try:
+                await self._call(chat_id, lambda: bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=previous['message_id'],
+                    text=new_text,
+                    reply_markup=InlineKeyboardMarkup([[b] for b in buttons])
+                ), retry_timeout=True)
+                previous.update({'text': new_text, 'buttons': buttons, 'sent_at': now})
+                self.coalesced += 1
+                return previous['message_id']
+            except BadRequest as e:
+                # Сообщение удалено или изменено — отправляем новое
+                logger.warning(f"Не удалось дописать подтверждение в чате {chat_id}: {e}")
+
+        message = await self.send_message(
+            bot, chat_id, text,
+            reply_markup=InlineKeyboardMarkup([[button]]),
+            reply_to_message_id=reply_to_message_id
+        )
+        self._confirmations[key] = {
+            'message_id': message.message_id,
+            'text': text,
+            'buttons': [button],
+            'sent_at': time.monotonic()
+        }
+        return message.message_id
+
+    def _prune_confirmations(self, now: float) -> None:
+        expired = [key for key, c in self._confirmations.items() if now - c['sent_at'] > COALESCE_WINDOW]
+        for key in expired:
+            del self._confirmations[key]
+
+    def forget_message(self, chat_id: int, message_id: int) -> None:
+        """Больше не дописывать подтверждения в это сообщение (например, после отката)"""
+        for key, confirmation in list(self._confirmations.items()):
+            if key[0] == chat_id and confirmation['message_id'] == message_id:
+                del self._confirmations[key]
+
+    def get_stats(self) -> dict:
+        return {
+            'api_calls': self.api_calls,
+            'coalesced_confirmations': self.coalesced,
+            'pending_confirmations': len(self._confirmations),
+            'active_chats': len(self._chats),
+        }
+
+
+outbox = Outbox()
@@ -0,0 +1,105 @@
+# query_profiler.py - трассировка SQL: количество и время запросов, лог медленных запросов, бюджет запросов
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from utils.logger import logger
+
+# Запросы дольше порога (мс) пишутся в лог вместе с EXPLAIN QUERY PLAN (0 — не писать)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+# Статистика запросов текущего обновления/блока кода (см. track_queries)
+_query_stats = ContextVar('query_stats', default=None)
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Код выполнил больше SQL-запросов, чем разрешено query_budget"""
+
+
+def _record(conn, sql: str, parameters, elapsed: float, single: bool = True) -> None:
+    stats = _query_stats.get()
+    # Запрос учитывается во всех вложенных областях подсчета
+    while stats is not None:
+        stats['queries'] += 1
+        stats['time'] += elapsed
+        stats = stats['parent']
+
+    elapsed_ms = elapsed * 1000
+    # Пакетные executemany не считаются медленными запросами: их время растет с размером пакета
+    if single and SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+        statement = ' '.join(sql.split())
+        plan = ''
+        if statement.upper().startswith(EXPLAINABLE):
+            try:
+                rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+                plan = '\n'.join(f"  {row[3]}" for row in rows)
+            except sqlite3.Error as e:
+                plan = f"  (план недоступен: {e})"
+        logger.warning(f"Медленный запрос {elapsed_ms:.1f} мс: {statement}" + (f"\n{plan}" if plan else ""))
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время каждого запроса"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self.connection, sql, (), time.perf_counter() - started, single=False)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого идут через TracedCursor (factory для sqlite3.connect)"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def track_queries():
+    """
+    Начать подсчет SQL-запросов в текущем контексте.
+    Возвращает (статистика {'queries': N, 'time': секунды}, токен для untrack_queries)
+    """
+    stats = {'queries': 0, 'time': 0.0, 'parent': _query_stats.get()}
+    return stats, _query_stats.set(stats)
+
+
+def untrack_queries(token) -> None:
+    _query_stats.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, label: str = 'блок'):
+    """
+    Ограничить число SQL-запросов внутри блока; при превышении — QueryBudgetExceeded.
+
+        with query_budget(5, 'баланс'):
+            get_account_balance(account_id)
+    """
+    stats, token = track_queries()
+    try:
+        yield stats
+    finally:
+        untrack_queries(token)
+    if stats['queries'] > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label}: {stats['queries']} SQL-запросов при бюджете {max_queries} "
+            f"({stats['time'] * 1000:.1f} мс)"
+        )
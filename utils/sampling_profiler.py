@@ -0,0 +1,91 @@
+# sampling_profiler.py - сэмплирующий профилировщик всех потоков процесса (без перезапуска бота)
+import sys
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.005
+MAX_DURATION = 120
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """
+    Периодически снимает стеки всех потоков через sys._current_frames().
+
+    Накладные расходы не зависят от количества вызовов в коде — профилировщик
+    можно включать на работающем боте. Результат — «свернутые» стеки
+    (поток;функция;...;функция количество), совместимые с flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Свернутые стеки для построения flamegraph"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def top_functions(self, limit: int = 15) -> list[dict]:
+        """Самые «горячие» функции: собственное время (верх стека) и общее (есть в стеке)"""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = [label.rsplit(':', 1)[0] for label in stack.split(';')[1:]]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        return [{'function': function, 'own': count, 'total': total[function]}
+                for function, count in own.most_common(limit)]
+
+
+_active = threading.Lock()
+
+
+def is_profiling() -> bool:
+    return _active.locked()
+
+
+def acquire_session() -> bool:
+    """Одновременно допускается только один сеанс профилирования"""
+    return _active.acquire(blocking=False)
+
+
+def release_session() -> None:
+    _active.release()
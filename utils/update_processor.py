@@ -0,0 +1,82 @@
+# update_processor.py - параллельная обработка обновлений с порядком внутри чата
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Сколько обновлений может ожидать в очередях на одного обработчика
+PENDING_PER_WORKER = 64
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает обновления разных чатов параллельно, а обновления одного чата — строго по очереди.
+
+    Лимит базового класса ограничивает общее число принятых обновлений
+    (в работе и в очередях). Число одновременно работающих обработчиков
+    ограничивается отдельно и занимается только после блокировки чата,
+    чтобы очередь одного занятого чата не занимала слоты других чатов.
+    """
+
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers * PENDING_PER_WORKER)
+        self.max_workers = max_workers
+        self._workers = asyncio.BoundedSemaphore(max_workers)
+        # chat_id -> [блокировка, количество обновлений в очереди и в работе]
+        self._chat_queues = {}
+        self._in_progress = 0
+        self._max_queue_depth = 0
+        self._processed = 0
+
+    @staticmethod
+    def _get_chat_id(update: object):
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def _run(self, coroutine) -> None:
+        async with self._workers:
+            self._in_progress += 1
+            try:
+                await coroutine
+            finally:
+                self._in_progress -= 1
+                self._processed += 1
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat_id = self._get_chat_id(update)
+        if chat_id is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._chat_queues.get(chat_id)
+        if entry is None:
+            entry = self._chat_queues[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self._max_queue_depth = max(self._max_queue_depth, entry[1])
+
+        try:
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._chat_queues.pop(chat_id, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def get_stats(self) -> dict:
+        """Метрики очередей: активные чаты, глубина очередей, обновления в работе"""
+        depths = [entry[1] for entry in self._chat_queues.values()]
+        return {
+            'active_chats': len(depths),
+            'queued_updates': max(0, sum(depths) - self._in_progress),
+            'max_chat_queue_depth': max(depths, default=0),
+            'max_chat_queue_depth_seen': self._max_queue_depth,
+            'in_progress': self._in_progress,
+            'processed': self._processed,
+            'max_workers': self.max_workers,
+        }
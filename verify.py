@@ -0,0 +1,131 @@
+# verify.py - проверка целостности: пересчет балансов всех счетов параллельно по процессам
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import core
+from core import get_db_connection, iter_database_paths
+from crud import _calculate_account_balance
+from export_to_excel import calculate_correct_running_balance
+from utils.logger import logger
+
+# Сколько счетов проверяет один процесс за задачу
+ACCOUNTS_PER_TASK = 200
+
+
+def _fetch_grouped(conn, query: str, account_ids: list) -> dict:
+    placeholders = ','.join('?' * len(account_ids))
+    cursor = conn.execute(query.format(ids=placeholders), account_ids)
+    return {account_id: [dict(r) for r in rows]
+            for account_id, rows in groupby(cursor, key=lambda r: r['account_id'])}
+
+
+def verify_accounts(path: str, account_ids: list) -> dict:
+    """
+    Проверить группу счетов одного файла БД (выполняется в процессе пула).
+
+    Баланс пересчитывается из сырых строк по правилам выписки
+    (export_to_excel.calculate_correct_running_balance) и сравнивается
+    с живым расчетом crud.get_account_balance.
+    """
+    conn = get_db_connection(path)
+    try:
+        accounts = _fetch_grouped(
+            conn, "SELECT * FROM accounts WHERE account_id IN ({ids}) ORDER BY account_id", account_ids
+        )
+        transactions = _fetch_grouped(
+            conn,
+            """SELECT account_id, transaction_id, amount, date, comment, username, is_archived, is_reverted
+            FROM transactions WHERE account_id IN ({ids}) ORDER BY account_id, date""",
+            account_ids
+        )
+        reconciliations = _fetch_grouped(
+            conn,
+            """SELECT account_id, reconciliation_id, balance, reconciliation_date, username
+            FROM reconciliations WHERE account_id IN ({ids}) ORDER BY account_id, reconciliation_date""",
+            account_ids
+        )
+
+        mismatches = []
+        rows_checked = 0
+        for account_id, (account,) in accounts.items():
+            precision = account['precision'] if account['precision'] is not None else 2
+            account_transactions = transactions.get(account_id, [])
+            account_reconciliations = reconciliations.get(account_id, [])
+            rows_checked += len(account_transactions) + len(account_reconciliations)
+
+            statement = calculate_correct_running_balance(account_transactions, account_reconciliations, precision)
+            recomputed = statement[-1]['Баланс'] if statement else f"{0:.{precision}f}"
+            live = f"{_calculate_account_balance(conn, account_id):.{precision}f}"
+
+            if recomputed != live:
+                mismatches.append({
+                    'database': path,
+                    'chat_id': account['chat_id'],
+                    'account_id': account_id,
+                    'account_name': account['account_name'],
+                    'live': live,
+                    'recomputed': recomputed,
+                })
+
+        return {'accounts': len(accounts), 'rows': rows_checked, 'mismatches': mismatches}
+    finally:
+        conn.close()
+
+
+def _iter_tasks():
+    for path in dict.fromkeys([core.DATABASE_PATH] + iter_database_paths()):
+        if not os.path.exists(path):
+            continue
+        conn = get_db_connection(path)
+        try:
+            account_ids = [row[0] for row in conn.execute("SELECT account_id FROM accounts ORDER BY account_id")]
+        finally:
+            conn.close()
+        for i in range(0, len(account_ids), ACCOUNTS_PER_TASK):
+            yield path, account_ids[i:i + ACCOUNTS_PER_TASK]
+
+
+def verify_all(workers: int = None) -> dict:
+    """Проверить все счета главной БД и шардов. Возвращает сводку и список расхождений"""
+    started = time.monotonic()
+    report = {'accounts': 0, 'rows': 0, 'mismatches': []}
+
+    # spawn: бот многопоточный, fork из него небезопасен
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(verify_accounts, path, ids) for path, ids in _iter_tasks()]
+        for future in futures:
+            result = future.result()
+            report['accounts'] += result['accounts']
+            report['rows'] += result['rows']
+            report['mismatches'].extend(result['mismatches'])
+
+    report['seconds'] = time.monotonic() - started
+    logger.info(
+        f"Проверка балансов: счетов {report['accounts']}, строк {report['rows']}, "
+        f"расхождений {len(report['mismatches'])} за {report['seconds']:.1f} с"
+    )
+    for item in report['mismatches']:
+        logger.warning(
+            f"Расхождение баланса: счет {item['account_name']} (id {item['account_id']}, чат {item['chat_id']}): "
+            f"текущий {item['live']}, по выписке {item['recomputed']}"
+        )
+    return report
+
+
+if __name__ == "__main__":
+    from config import VERIFY_WORKERS
+    result = verify_all(VERIFY_WORKERS)
+    print(f"Проверено счетов: {result['accounts']}, строк: {result['rows']}, за {result['seconds']:.1f} с")
+    if result['mismatches']:
+        print(f"❌ Расхождений: {len(result['mismatches'])}")
+        for item in result['mismatches']:
+            print(f"  {item['account_name']} (id {item['account_id']}): {item['live']} != {item['recomputed']}")
+        sys.exit(1)
+    print("✅ Расхождений нет")
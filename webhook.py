@@ -0,0 +1,104 @@
+# webhook.py - режим вебхука на встроенном локальном HTTP-сервере
+import asyncio
+import hmac
+import json
+import signal
+from telegram import Update
+from telegram.ext import Application
+from utils.logger import logger
+from utils.http_server import LocalHTTPServer, HTTPRequest
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+def is_valid_secret(received: str | None, secret: str) -> bool:
+    """Сравнение секрета за постоянное время (не подсказывает совпавший префикс)"""
+    return received is not None and hmac.compare_digest(received.encode('utf-8'), secret.encode('utf-8'))
+
+
+def create_webhook_route(application: Application, secret: str | None = None):
+    """Маршрут, принимающий JSON обновления и передающий его в очередь приложения"""
+
+    async def handle_webhook(request: HTTPRequest):
+        if secret and not is_valid_secret(request.headers.get(SECRET_HEADER), secret):
+            logger.warning("Вебхук: запрос с неверным секретом отклонен")
+            return 403, 'text/plain', b'Forbidden'
+
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return 400, 'text/plain', b'Bad JSON'
+
+        update = Update.de_json(data, application.bot)
+        await application.update_queue.put(update)
+        return 200, 'text/plain', b'OK'
+
+    return handle_webhook
+
+
+LOCAL_ADDRESSES = ('127.0.0.1', 'localhost', '::1')
+
+
+def check_webhook_security(listen: str, webhook_url: str | None, secret: str | None) -> str:
+    """
+    Проверить настройки перед запуском. Без секрета любой POST на путь вебхука
+    был бы принят как настоящее обновление от Telegram, поэтому:
+    публичный вебхук (webhook_url) без секрета не запускается, а без секрета
+    сервер слушает только localhost. Возвращает адрес, который следует слушать.
+    """
+    if secret:
+        return listen
+    if webhook_url:
+        raise ValueError("WEBHOOK_URL задан без WEBHOOK_SECRET — вебхук принимал бы поддельные обновления")
+    if listen not in LOCAL_ADDRESSES:
+        logger.warning(f"WEBHOOK_SECRET не задан: вебхук слушает только 127.0.0.1 вместо {listen}")
+        return '127.0.0.1'
+    return listen
+
+
+async def wait_for_stop_signal() -> None:
+    """Ожидать SIGINT/SIGTERM (на Windows — только Ctrl+C)"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await stop_event.wait()
+
+
+async def run_webhook(application: Application, listen: str, port: int, path: str,
+                      webhook_url: str | None = None, secret: str | None = None,
+                      drop_pending_updates: bool = False, post_init=None) -> None:
+    """
+    Запустить приложение в режиме вебхука.
+
+    Если задан webhook_url, вебхук регистрируется в Telegram. Ожидающие
+    обновления по умолчанию не сбрасываются — Telegram доставит их после перезапуска.
+    """
+    listen = check_webhook_security(listen, webhook_url, secret)
+    server = LocalHTTPServer(listen, port)
+    server.add_route('POST', path, create_webhook_route(application, secret))
+
+    async with application:
+        if post_init:
+            await post_init(application)
+
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + path,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates
+            )
+            logger.info(f"Вебхук зарегистрирован: {webhook_url.rstrip('/') + path}")
+
+        await application.start()
+        await server.start()
+        try:
+            await wait_for_stop_signal()
+        finally:
+            logger.info("Остановка вебхук-сервера...")
+            await server.stop()
+            await application.stop()